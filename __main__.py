@@ -2,12 +2,18 @@ import configparser
 from file_system_scanner import FileSystemScanner
 from java_parser import JavaCodeParser
 from utils import print_progress_bar, get_user_choices, IntRangeAction, create_log_csv
-from json_to_db import convert_json_to_db
+from json_to_db import update_db_from_json
+from stream_to_db import StreamingDatabaseWriter
+from class_store import BinaryClassStoreWriter, class_store_path
+from incremental_parser import ProjectManifest, parse_project_incrementally
 import argparse
 from generate_tests import TestGenerator
+from pipeline import TestGenerationPipeline
 import multiprocessing
 from datetime import datetime
 from db import DataBase
+import os
+import shutil
 
 def main():
     argument_parser = argparse.ArgumentParser(description='Automated Unit Test Generation for Java Projects using LLMs')
@@ -15,16 +21,28 @@ def main():
                                  help='If the projects should only be parsed to json files. (no database will be generated or tests generated)')
     argument_parser.add_argument('--only_generate_tests', type=bool, default=False,
                                  help='When database for projects was already created, test generation can be run in isolation (no parsing to json files or database generation)')
+    argument_parser.add_argument('--incremental', type=bool, default=False,
+                                 help='Only re-parse the files that changed since the last run and update the existing database instead of rebuilding it.')
+    argument_parser.add_argument('--export_json', type=bool, default=False,
+                                 help='Also write the parsed classes and methods to json files in build/class_parser (for debugging). The json files are always written with --only_parse or --incremental.')
+    argument_parser.add_argument('--intermediate_format', type=str, default="json", choices=["json", "binary"],
+                                 help='Format of the parser output in build/class_parser. "binary" writes one compact, memory-mappable file per project instead of a json file per class.')
     argument_parser.add_argument('--runs', type=int, default=1,
                                  help='Amount of times the test generation should be run for each project')
     argument_parser.add_argument('--method_range', action=IntRangeAction,
                                  help='Only run test generation for the methods in the range. Specify a range of integers in the format start:end')
     argument_parser.add_argument('--multiprocessing', type=int, default=0,
                                  help='Amount of processes to use for test generation. If 0, no multiprocessing will be used.')
+    argument_parser.add_argument('--pipeline', type=bool, default=False,
+                                 help='Generate the tests of several methods at once, so the LLM requests overlap with the compilation and execution of other tests (see [PIPELINE] in config.ini). Not used with multiprocessing.')
+    argument_parser.add_argument('--parsing_processes', type=int, default=0,
+                                 help='Amount of processes to use for parsing the Java files. If 0, no multiprocessing will be used.')
     argument_parser.add_argument('--compilation_repair_rounds', type=int, default="1",
                                  help='Amount of rounds to run the compilation repair for each method.')
     argument_parser.add_argument('--execution_repair_rounds', type=int, default=1,
                                  help='Amount of rounds to run the execution repair for each method.')
+    argument_parser.add_argument('--disable_llm_cache', type=bool, default=False,
+                                 help='Always query the LLM instead of using the completions stored by previous runs (see LLM_CACHE in config.ini), e.g. for deliberately stochastic runs.')
     argument_parser.add_argument('--run_id', type=str, default=None,
                                  help='Option to manually specify the run id which will be used to name the generated tests and log files.')
 
@@ -51,36 +69,90 @@ def main():
 
     choice = get_user_choices([project for project in files], "Choose project to parse: ")
 
+    # the incremental mode needs the parser output of the last parse to update the relations of unchanged classes
+    write_output = args.only_parse or args.incremental or args.export_json
+    write_json = write_output and args.intermediate_format == "json"
+
+    manifests = {}
+    incremental_updates = {}
     for project in [project for project in files if project in choice]:
         if not args.only_generate_tests:
+            manifests[project] = ProjectManifest(project)
+            if args.incremental and not args.only_parse and manifests[project].exists() \
+                    and os.path.exists(f"./build/db/{project}.db"):
+                incremental_updates[project] = parse_project_incrementally(my_java_parser, manifests[project],
+                                                                           files[project]["files"],
+                                                                           args.parsing_processes)
+                continue
+
+            manifests[project].clear()
+            store_writer = None
+            if write_output:
+                # remove classes of deleted files from previous runs (in both formats)
+                shutil.rmtree(f"./build/class_parser/{project}", ignore_errors=True)
+                if os.path.exists(class_store_path(project)):
+                    os.remove(class_store_path(project))
+                if not write_json:
+                    store_writer = BinaryClassStoreWriter(project)
+            # the parsed files are written to the database while the next files are parsed
+            db_writer = StreamingDatabaseWriter(project) if not args.only_parse else None
             n_files = len(files[project]["files"])
             curr_file = 1
-            for file in files[project]["files"]:
-                my_java_parser.parse_file(file, project)
+            for file, file_information in my_java_parser.parse_files(files[project]["files"], project,
+                                                                     args.parsing_processes, write_json):
+                manifests[project].update(file, file_information)
+                if db_writer is not None:
+                    db_writer.add_file_information(file_information)
+                if store_writer is not None:
+                    store_writer.add_file_information(file_information)
                 print_progress_bar(curr_file, n_files, prefix="Parsing files in project: {}".format(project),
                                    display_100_percent=True)
                 curr_file += 1
+            if store_writer is not None:
+                store_writer.close()
+            if db_writer is not None:
+                db_writer.finish()
 
         if args.only_parse:
             exit()
 
     if not args.only_generate_tests:
-        convert_json_to_db(choice)
+        for project in incremental_updates:
+            update_db_from_json(project, manifests[project].files, **incremental_updates[project])
+        # the manifests describe the state of the databases, so they are only saved once the databases are updated
+        # without the parser output, a later incremental run has to parse the project completely
+        for project in manifests:
+            if project not in incremental_updates:
+                # the byte offsets in the database are only valid for the parsed versions of the files
+                db = DataBase(project)
+                db.create_tables()
+                db.replace_source_files(manifests[project].files)
+            if write_output:
+                manifests[project].save()
+            else:
+                manifests[project].delete()
 
     if args.multiprocessing != 0:
         pool = multiprocessing.Pool(args.multiprocessing)
         if not args.method_range:
             db = DataBase(choice[0])
-            n_methods = db.get_num_of_methods()
-            pool.map_async(multiprocessed_generation, [(x, choice[0], args.compilation_repair_rounds, args.execution_repair_rounds, RUN_ID) for x in range(1, n_methods+1)]).get(timeout=3600)
+            # method ids can have gaps after incremental updates
+            method_ids = db.get_method_ids()
+            pool.map_async(multiprocessed_generation, [(x, choice[0], args.compilation_repair_rounds, args.execution_repair_rounds, RUN_ID, not args.disable_llm_cache) for x in method_ids]).get(timeout=3600)
         else:
-            pool.map(multiprocessed_generation, [(x, choice[0], args.compilation_repair_rounds, args.execution_repair_rounds, RUN_ID) for x in args.method_range])
+            pool.map(multiprocessed_generation, [(x, choice[0], args.compilation_repair_rounds, args.execution_repair_rounds, RUN_ID, not args.disable_llm_cache) for x in args.method_range])
 
         pool.close()
         pool.join()
     else:
         for project in choice:
-            test_generator = TestGenerator(project, RUN_ID)
+            if args.pipeline:
+                test_pipeline = TestGenerationPipeline(project, RUN_ID, use_llm_cache=not args.disable_llm_cache)
+                test_pipeline.generate_tests(args.method_range, args.runs, args.compilation_repair_rounds,
+                                             args.execution_repair_rounds)
+                continue
+
+            test_generator = TestGenerator(project, RUN_ID, use_llm_cache=not args.disable_llm_cache)
 
             if not args.method_range:
                 test_generator.generate_tests_for_whole_project(args.runs, args.compilation_repair_rounds,
@@ -91,8 +163,8 @@ def main():
 
 
 def multiprocessed_generation(args):
-    method_id, project_choice, compilation_repair_rounds, execution_repair_rounds, RUN_ID = args
-    test_generator = TestGenerator(project_choice, RUN_ID)
+    method_id, project_choice, compilation_repair_rounds, execution_repair_rounds, RUN_ID, use_llm_cache = args
+    test_generator = TestGenerator(project_choice, RUN_ID, use_llm_cache=use_llm_cache)
     test_generator.generate_test_for_method(method_id, compilation_repair_rounds, execution_repair_rounds)
 
 
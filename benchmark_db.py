@@ -0,0 +1,112 @@
+import argparse
+import os
+import random
+import time
+from db import DataBase
+from utils import make_dir_if_not_exists
+
+BENCHMARK_DB_NAME = "benchmark_db_lookups"
+BENCHMARK_SOURCE_PATH = f"./build/db/{BENCHMARK_DB_NAME}.java"
+BENCHMARK_SOURCE = "class Benchmark {\n    void method() {}\n}\n"
+
+
+def fill_benchmark_db(db: DataBase, n_classes: int, methods_per_class: int, relations_per_method: int):
+    """
+    Fills the database with a synthetic project.
+    :param db: database to fill
+    :param n_classes: number of classes of the synthetic project
+    :param methods_per_class: number of methods per class
+    :param relations_per_method: number of related methods, related classes and parameters per method
+    :return: Number of methods in the database
+    """
+    random.seed(0)
+    n_methods = n_classes * methods_per_class
+    # all classes and methods share the text of a single source file
+    with open(BENCHMARK_SOURCE_PATH, "w") as file:
+        file.write(BENCHMARK_SOURCE)
+    class_end = len(BENCHMARK_SOURCE)
+    method_start = BENCHMARK_SOURCE.index("void")
+    method_end = BENCHMARK_SOURCE.index("}") + 1
+    with db.bulk_load():
+        db.insert_project(BENCHMARK_DB_NAME)
+        db.insert_classes([(f"Class{c}", BENCHMARK_DB_NAME, "public", "", 0, class_end, method_start, "",
+                            "package benchmark;", BENCHMARK_SOURCE_PATH) for c in range(n_classes)])
+        db.insert_methods([(c * methods_per_class + m + 1, f"method{m}", f"Class{c}", method_start, method_end,
+                            None, None)
+                           for c in range(n_classes) for m in range(methods_per_class)])
+        db.insert_method_parameters([(method_id, f"Class{random.randrange(n_classes)}", f"param{p}")
+                                     for method_id in range(1, n_methods + 1) for p in range(relations_per_method)])
+        db.insert_related_methods_of_method([(method_id, random.randint(1, n_methods))
+                                             for method_id in range(1, n_methods + 1)
+                                             for _ in range(relations_per_method)])
+        db.insert_related_classes_of_method([(method_id, f"Class{random.randrange(n_classes)}")
+                                             for method_id in range(1, n_methods + 1)
+                                             for _ in range(relations_per_method)])
+    return n_methods
+
+
+def time_lookups(db: DataBase, n_methods: int, methods_per_class: int, n_lookups: int):
+    """
+    Measures the average latency of the lookups used during relation building and prompt construction.
+    :return: Dictionary with the name of the lookup as key and the average latency in microseconds as value
+    """
+    random.seed(1)
+    method_ids = [random.randint(1, n_methods) for _ in range(n_lookups)]
+    lookups = {
+        "get_method_id": lambda method_id: db.get_method_id(f"method{(method_id - 1) % methods_per_class}",
+                                                            f"Class{(method_id - 1) // methods_per_class}"),
+        "get_related_methods_of_method": db.get_related_methods_of_method,
+        "get_related_classes_of_method": db.get_related_classes_of_method,
+        "get_filepath_for_method": db.get_filepath_for_method,
+        "get_class_header_for_method": db.get_class_header_for_method,
+    }
+
+    latencies = {}
+    for name, lookup in lookups.items():
+        start = time.perf_counter()
+        for method_id in method_ids:
+            lookup(method_id)
+        latencies[name] = (time.perf_counter() - start) / n_lookups * 1e6
+    return latencies
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Micro-benchmark of the database lookups with and without '
+                                                          'secondary indexes')
+    argument_parser.add_argument('--classes', type=int, default=1000, help='Number of classes of the synthetic project')
+    argument_parser.add_argument('--methods_per_class', type=int, default=20, help='Number of methods per class')
+    argument_parser.add_argument('--relations_per_method', type=int, default=3,
+                                 help='Number of related methods, related classes and parameters per method')
+    argument_parser.add_argument('--lookups', type=int, default=500, help='Number of lookups per query')
+    args = argument_parser.parse_args()
+
+    make_dir_if_not_exists("./build/db")
+    db = DataBase(BENCHMARK_DB_NAME)
+    try:
+        db.reset()
+        db.create_tables()
+        n_methods = fill_benchmark_db(db, args.classes, args.methods_per_class, args.relations_per_method)
+        print(f"Synthetic project with {args.classes} classes and {n_methods} methods\n")
+
+        db.drop_indexes()
+        without_indexes = time_lookups(db, n_methods, args.methods_per_class, args.lookups)
+
+        db.create_indexes()
+        db.analyze()
+        with_indexes = time_lookups(db, n_methods, args.methods_per_class, args.lookups)
+
+        print("{:<32}{:>20}{:>20}{:>10}".format("lookup", "without indexes", "with indexes", "speedup"))
+        for name in without_indexes:
+            print("{:<32}{:>17.1f} us{:>17.1f} us{:>9.1f}x".format(name, without_indexes[name], with_indexes[name],
+                                                                   without_indexes[name] / with_indexes[name]))
+    finally:
+        db.conn.close()
+        db.source_reader.close()
+        for path in [f"./build/db/{BENCHMARK_DB_NAME}.db{suffix}" for suffix in ["", "-wal", "-shm"]] \
+                + [BENCHMARK_SOURCE_PATH]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+import mmap
+import os
+import struct
+
+# binary alternative to the json files in build/class_parser/[project_name]/[class_name]/
+# layout of a class store file:
+#   header:  magic, version, end of the records, offset of the string table, offset of the index
+#   records: one record per class folder (length prefixed), the content of class.json and methods.json split into
+#            the columns of RECORD_COLUMNS: the number of values of every column, followed by the values of every
+#            column packed as little-endian integers. Strings are stored as ids into the string table
+#   strings: every distinct string of the project once: number of strings, end offsets of the strings, utf-8 encoded
+#            strings
+#   index:   number of records, (length of the class folder name, utf-8 encoded name, record offset) per record
+CLASS_STORE_MAGIC = b"JCPS"
+CLASS_STORE_VERSION = 2
+HEADER = struct.Struct("<4sIQQQ")
+RECORD_LENGTH = struct.Struct("<I")
+STRING_COUNT = struct.Struct("<I")
+STRING_END = struct.Struct("<Q")
+INDEX_COUNT = struct.Struct("<I")
+INDEX_NAME_LENGTH = struct.Struct("<H")
+INDEX_OFFSET = struct.Struct("<Q")
+
+# string id of a missing string (None)
+NO_STRING = 0xFFFFFFFF
+# byte offset of a missing span (None)
+NO_BYTE = -1
+
+# columns of a record and the type of their values ("I" for string ids and counts, "q" for byte offsets)
+# lists of a class or method are stored as a column with the length of the list of every class or method
+# ("..._counts") and a column with the values of all lists
+RECORD_COLUMNS = (
+    ("class_identifier", "I"),
+    ("class_filepath", "I"),
+    ("class_modifier", "I"),
+    ("class_super_interfaces", "I"),
+    ("class_imports", "I"),
+    ("class_package", "I"),
+    # start and end byte per class
+    ("class_span", "q"),
+    ("class_header_span", "q"),
+    # identifier and type per variable
+    ("class_variable_counts", "I"),
+    ("class_variables", "I"),
+    ("constructor_counts", "I"),
+    ("constructor_identifier", "I"),
+    ("constructor_span", "q"),
+    ("constructor_parameter_type_counts", "I"),
+    ("constructor_parameter_types", "I"),
+    ("constructor_related_class_counts", "I"),
+    ("constructor_related_classes", "I"),
+    ("class_method_counts", "I"),
+    ("class_method_identifier", "I"),
+    ("class_method_parameter_type_counts", "I"),
+    ("class_method_parameter_types", "I"),
+    ("method_identifier", "I"),
+    ("method_class_identifier", "I"),
+    ("method_filepath", "I"),
+    ("method_span", "q"),
+    ("method_comment_span", "q"),
+    # name and type per parameter
+    ("method_parameter_counts", "I"),
+    ("method_parameters", "I"),
+    ("method_related_class_counts", "I"),
+    ("method_related_classes", "I"),
+    # method name, method class and number of argument types per related method
+    ("related_method_counts", "I"),
+    ("related_methods", "I"),
+    ("related_method_argument_types", "I"),
+)
+COLUMN_COUNTS = struct.Struct("<{}I".format(len(RECORD_COLUMNS)))
+
+# the store is rewritten without deleted records once they make up more than this share of the file
+MAX_GARBAGE_RATIO = 0.5
+
+
+def class_store_path(project_name: str):
+    """
+    :param project_name: name of the project
+    :return: Path of the class store file of the project
+    """
+    return f"./build/class_parser/{project_name}.jcp"
+
+
+class BinaryClassStore:
+    """
+    Read access to the class store of a project. The file is memory-mapped, only the index and the offsets of the
+    strings are read when opening the store. Records are decoded when they are requested, strings when they are
+    used for the first time.
+    """
+
+    def __init__(self, project_name: str):
+        """
+        :param project_name: name of the project, the store has to exist (see class_store_path)
+        """
+        self.project_name = project_name
+        self.file = open(class_store_path(project_name), "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.data_end, strings_offset, index_offset = HEADER.unpack_from(self.data, 0)
+        if magic != CLASS_STORE_MAGIC or version != CLASS_STORE_VERSION:
+            self.close()
+            raise ValueError("{} is not a class store of version {}".format(class_store_path(project_name),
+                                                                            CLASS_STORE_VERSION))
+
+        n_strings = STRING_COUNT.unpack_from(self.data, strings_offset)[0]
+        self.string_ends = struct.unpack_from("<{}Q".format(n_strings), self.data, strings_offset + STRING_COUNT.size)
+        self.strings_start = strings_offset + STRING_COUNT.size + STRING_END.size * n_strings
+        self.strings = [None] * n_strings
+
+        # class folder name -> record offset
+        self.index = {}
+        n_records = INDEX_COUNT.unpack_from(self.data, index_offset)[0]
+        position = index_offset + INDEX_COUNT.size
+        for _ in range(n_records):
+            name_length = INDEX_NAME_LENGTH.unpack_from(self.data, position)[0]
+            position += INDEX_NAME_LENGTH.size
+            class_name = self.data[position:position + name_length].decode("utf-8")
+            position += name_length
+            self.index[class_name] = INDEX_OFFSET.unpack_from(self.data, position)[0]
+            position += INDEX_OFFSET.size
+
+    def class_names(self):
+        """
+        :return: Names of the class folders in the store
+        """
+        return list(self.index.keys())
+
+    def string(self, string_id: int):
+        """
+        :param string_id: id of a string in the string table
+        :return: The string, None for NO_STRING
+        """
+        if string_id == NO_STRING:
+            return None
+        string = self.strings[string_id]
+        if string is None:
+            start = self.string_ends[string_id - 1] if string_id else 0
+            string = self.data[self.strings_start + start:self.strings_start + self.string_ends[string_id]] \
+                .decode("utf-8")
+            self.strings[string_id] = string
+        return string
+
+    def record(self, class_name: str):
+        """
+        :param class_name: name of the class folder
+        :return: ClassStoreRecord giving access to the single columns of the record or None if the store does not
+        contain the class folder
+        """
+        record_offset = self.index.get(class_name)
+        if record_offset is None:
+            return None
+        return ClassStoreRecord(self, record_offset + RECORD_LENGTH.size)
+
+    def read(self, class_name: str):
+        """
+        Decodes the record of a class folder.
+        :param class_name: name of the class folder
+        :return: Tuple of the class list and the method list (the content of class.json and methods.json) or None if
+        the store does not contain the class folder
+        """
+        record = self.record(class_name)
+        if record is None:
+            return None
+        return record.class_list(), record.method_list()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class ClassStoreRecord:
+    """
+    Record of a class folder in a class store. Only the columns that are used are decoded.
+    """
+
+    def __init__(self, store: BinaryClassStore, record_start: int):
+        """
+        :param store: the store containing the record
+        :param record_start: offset of the record (after its length prefix)
+        """
+        self.store = store
+        self.column_offsets = {}
+        position = record_start + COLUMN_COUNTS.size
+        for (column_name, value_type), count in zip(RECORD_COLUMNS, COLUMN_COUNTS.unpack_from(store.data,
+                                                                                            record_start)):
+            self.column_offsets[column_name] = (position, "<{}{}".format(count, value_type))
+            position += count * struct.calcsize(value_type)
+
+    def column(self, column_name: str):
+        """
+        :param column_name: name of a column in RECORD_COLUMNS
+        :return: Tuple of the values of the column
+        """
+        position, column_format = self.column_offsets[column_name]
+        return struct.unpack_from(column_format, self.store.data, position)
+
+    def strings(self, column_name: str):
+        """
+        :param column_name: name of a column of string ids in RECORD_COLUMNS
+        :return: List of the strings of the column
+        """
+        cached_strings = self.store.strings
+        return [cached_strings[string_id] if string_id != NO_STRING and cached_strings[string_id] is not None
+                else self.store.string(string_id) for string_id in self.column(column_name)]
+
+    def lists(self, counts_column: str, values: list, width: int = 1):
+        """
+        Splits the values of a column into the lists of the single classes or methods.
+        :param counts_column: name of the column with the lengths of the lists
+        :param values: values of the column containing the lists
+        :param width: number of values per list entry
+        :return: List of lists of entries (tuples of width values if width is larger than 1)
+        """
+        lists = []
+        position = 0
+        for count in self.column(counts_column):
+            if width == 1:
+                lists.append(list(values[position:position + count]))
+            else:
+                lists.append([tuple(values[entry:entry + width])
+                              for entry in range(position, position + count * width, width)])
+            position += count * width
+        return lists
+
+    def class_list(self):
+        """
+        :return: The classes of the record (content of class.json)
+        """
+        class_spans = self.column("class_span")
+        class_header_spans = self.column("class_header_span")
+        variables = self.lists("class_variable_counts", self.strings("class_variables"), 2)
+        constructors = self.lists("constructor_counts", self._constructors())
+        class_methods = self.lists("class_method_counts", self._class_methods())
+
+        class_list = []
+        for class_index, (identifier, filepath, modifier, super_interfaces, imports, package) in enumerate(zip(
+                self.strings("class_identifier"), self.strings("class_filepath"), self.strings("class_modifier"),
+                self.strings("class_super_interfaces"), self.strings("class_imports"),
+                self.strings("class_package"))):
+            class_list.append({
+                "filepath": filepath,
+                "class_identifier": identifier,
+                "class_modifier": modifier,
+                "class_super_interfaces": super_interfaces,
+                "class_constructors": constructors[class_index],
+                "class_header_span": _span(class_header_spans, class_index),
+                "class_span": _span(class_spans, class_index),
+                "class_methods": class_methods[class_index],
+                "class_variable_declarations": [{"variable_identifier": variable_identifier,
+                                                 "variable_type": variable_type}
+                                                for variable_identifier, variable_type in variables[class_index]],
+                "imports": imports,
+                "package": package
+            })
+        return class_list
+
+    def method_list(self):
+        """
+        :return: The methods of the record (content of methods.json)
+        """
+        method_spans = self.column("method_span")
+        comment_spans = self.column("method_comment_span")
+        parameters = self.lists("method_parameter_counts", self.strings("method_parameters"), 2)
+        related_classes = self.lists("method_related_class_counts", self.strings("method_related_classes"))
+        related_methods = self.lists("related_method_counts", self._related_methods())
+
+        method_list = []
+        for method_index, (identifier, class_identifier, filepath) in enumerate(zip(
+                self.strings("method_identifier"), self.strings("method_class_identifier"),
+                self.strings("method_filepath"))):
+            method_list.append({
+                "method_identifier": identifier,
+                "method_parameter_types": dict(parameters[method_index]),
+                "method_span": _span(method_spans, method_index),
+                "method_comment_span": _span(comment_spans, method_index),
+                "class_identifier": class_identifier,
+                "filepath": filepath,
+                "related_classes": related_classes[method_index],
+                "related_methods": related_methods[method_index]
+            })
+        return method_list
+
+    def _constructors(self):
+        spans = self.column("constructor_span")
+        parameter_types = self.lists("constructor_parameter_type_counts", self.strings("constructor_parameter_types"))
+        related_classes = self.lists("constructor_related_class_counts", self.strings("constructor_related_classes"))
+        return [{
+            "constructor_identifier": identifier,
+            "constructor_parameter_types": parameter_types[constructor_index],
+            "related_classes": related_classes[constructor_index],
+            "constructor_span": _span(spans, constructor_index)
+        } for constructor_index, identifier in enumerate(self.strings("constructor_identifier"))]
+
+    def _class_methods(self):
+        parameter_types = self.lists("class_method_parameter_type_counts",
+                                     self.strings("class_method_parameter_types"))
+        return [{
+            "method_identifier": identifier,
+            "method_parameter_types": parameter_types[method_index]
+        } for method_index, identifier in enumerate(self.strings("class_method_identifier"))]
+
+    def _related_methods(self):
+        related_methods = self.column("related_methods")
+        argument_types = self.strings("related_method_argument_types")
+        result = []
+        position = 0
+        for entry in range(0, len(related_methods), 3):
+            method_name, method_class, n_argument_types = related_methods[entry:entry + 3]
+            result.append({
+                "method_name": self.store.string(method_name),
+                "method_class": self.store.string(method_class),
+                "argument_types": argument_types[position:position + n_argument_types],
+            })
+            position += n_argument_types
+        return result
+
+
+def _span(offsets: tuple, index: int):
+    # spans are stored as pairs of start and end byte, NO_BYTE if the span is None
+    start, end = offsets[2 * index], offsets[2 * index + 1]
+    return None if start == NO_BYTE else [start, end]
+
+
+class BinaryClassStoreWriter:
+    """
+    Writes the information extracted by the JavaCodeParser to the class store of a project (instead of the json files).
+    Records are appended to the file, the string table and the index are written when the writer is closed.
+    """
+
+    def __init__(self, project_name: str, append: bool = False):
+        """
+        :param project_name: name of the project
+        :param append: if True, records are added to the existing store, otherwise a new store is created
+        """
+        self.project_name = project_name
+        self.path = class_store_path(project_name)
+        # name of the class folder -> (record offset, record length including the length prefix)
+        self.index = {}
+        # string -> id, the ids of the strings of an existing store stay the same
+        self.string_ids = {}
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if append and os.path.exists(self.path):
+            self._load()
+        else:
+            self.file = open(self.path, "w+b")
+            self.file.write(HEADER.pack(CLASS_STORE_MAGIC, CLASS_STORE_VERSION, HEADER.size, 0, 0))
+            self.data_end = HEADER.size
+
+    def add_file_information(self, file_information: list):
+        """
+        Adds the classes of a parsed file. Like JavaCodeParser.write_file_information, the record is stored under the
+        last class of the file and contains all classes of the file and the methods of the last class.
+        :param file_information: Information returned by JavaCodeParser.extract_file_information.
+        """
+        if not file_information:
+            return
+        class_list = [class_output for class_output, _ in file_information]
+        self.add_class_files(class_list[-1]["class_identifier"], class_list, file_information[-1][1])
+
+    def add_class_files(self, class_name: str, class_list: list, method_list: list):
+        """
+        Adds (or replaces) the record of a class folder.
+        :param class_name: name of the class folder
+        :param class_list: content of the class.json file
+        :param method_list: content of the methods.json file
+        """
+        record = self._encode_record(class_list, method_list)
+        self.file.seek(self.data_end)
+        self.file.write(RECORD_LENGTH.pack(len(record)))
+        self.file.write(record)
+        self.index[class_name] = (self.data_end, RECORD_LENGTH.size + len(record))
+        self.data_end += RECORD_LENGTH.size + len(record)
+
+    def delete_classes(self, class_names):
+        """
+        Removes the records of class folders, the space is reclaimed when the store is compacted.
+        :param class_names: names of the class folders
+        """
+        for class_name in class_names:
+            self.index.pop(class_name, None)
+
+    def close(self):
+        """
+        Writes the string table and the index and compacts the store if too many records were deleted.
+        """
+        live_bytes = sum(record_length for _, record_length in self.index.values())
+        if self.data_end - HEADER.size - live_bytes > MAX_GARBAGE_RATIO * (self.data_end - HEADER.size):
+            self._compact()
+
+        self.file.seek(self.data_end)
+        self.file.truncate()
+        strings_offset = self.data_end
+        encoded_strings = [string.encode("utf-8") for string in self.string_ids]
+        string_ends = []
+        string_end = 0
+        for encoded_string in encoded_strings:
+            string_end += len(encoded_string)
+            string_ends.append(string_end)
+        self.file.write(STRING_COUNT.pack(len(encoded_strings)))
+        self.file.write(struct.pack("<{}Q".format(len(string_ends)), *string_ends))
+        self.file.write(b"".join(encoded_strings))
+
+        index_offset = self.file.tell()
+        self.file.write(INDEX_COUNT.pack(len(self.index)))
+        for class_name, (record_offset, _) in self.index.items():
+            encoded_name = class_name.encode("utf-8")
+            self.file.write(INDEX_NAME_LENGTH.pack(len(encoded_name)))
+            self.file.write(encoded_name)
+            self.file.write(INDEX_OFFSET.pack(record_offset))
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(CLASS_STORE_MAGIC, CLASS_STORE_VERSION, self.data_end, strings_offset,
+                                    index_offset))
+        self.file.close()
+
+    def _string_id(self, string):
+        if string is None:
+            return NO_STRING
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = len(self.string_ids)
+            self.string_ids[string] = string_id
+        return string_id
+
+    def _encode_record(self, class_list: list, method_list: list):
+        columns = {column_name: [] for column_name, _ in RECORD_COLUMNS}
+
+        def add_strings(column_name, strings):
+            columns[column_name].extend(self._string_id(string) for string in strings)
+
+        def add_span(column_name, span):
+            columns[column_name].extend(span if span is not None else (NO_BYTE, NO_BYTE))
+
+        for class_dict in class_list:
+            add_strings("class_identifier", [class_dict["class_identifier"]])
+            add_strings("class_filepath", [class_dict["filepath"]])
+            add_strings("class_modifier", [class_dict["class_modifier"]])
+            add_strings("class_super_interfaces", [class_dict["class_super_interfaces"]])
+            add_strings("class_imports", [class_dict["imports"]])
+            add_strings("class_package", [class_dict["package"]])
+            add_span("class_span", class_dict["class_span"])
+            add_span("class_header_span", class_dict["class_header_span"])
+
+            columns["class_variable_counts"].append(len(class_dict["class_variable_declarations"]))
+            for variable in class_dict["class_variable_declarations"]:
+                add_strings("class_variables", [variable["variable_identifier"], variable["variable_type"]])
+
+            columns["constructor_counts"].append(len(class_dict["class_constructors"]))
+            for constructor in class_dict["class_constructors"]:
+                add_strings("constructor_identifier", [constructor["constructor_identifier"]])
+                add_span("constructor_span", constructor["constructor_span"])
+                columns["constructor_parameter_type_counts"].append(len(constructor["constructor_parameter_types"]))
+                add_strings("constructor_parameter_types", constructor["constructor_parameter_types"])
+                columns["constructor_related_class_counts"].append(len(constructor["related_classes"]))
+                add_strings("constructor_related_classes", constructor["related_classes"])
+
+            columns["class_method_counts"].append(len(class_dict["class_methods"]))
+            for class_method in class_dict["class_methods"]:
+                add_strings("class_method_identifier", [class_method["method_identifier"]])
+                columns["class_method_parameter_type_counts"].append(len(class_method["method_parameter_types"]))
+                add_strings("class_method_parameter_types", class_method["method_parameter_types"])
+
+        for method_dict in method_list:
+            add_strings("method_identifier", [method_dict["method_identifier"]])
+            add_strings("method_class_identifier", [method_dict["class_identifier"]])
+            add_strings("method_filepath", [method_dict["filepath"]])
+            add_span("method_span", method_dict["method_span"])
+            add_span("method_comment_span", method_dict["method_comment_span"])
+
+            columns["method_parameter_counts"].append(len(method_dict["method_parameter_types"]))
+            for parameter_name, parameter_type in method_dict["method_parameter_types"].items():
+                add_strings("method_parameters", [parameter_name, parameter_type])
+
+            columns["method_related_class_counts"].append(len(method_dict["related_classes"]))
+            add_strings("method_related_classes", method_dict["related_classes"])
+
+            columns["related_method_counts"].append(len(method_dict["related_methods"]))
+            for related_method in method_dict["related_methods"]:
+                add_strings("related_methods", [related_method["method_name"], related_method["method_class"]])
+                columns["related_methods"].append(len(related_method["argument_types"]))
+                add_strings("related_method_argument_types", related_method["argument_types"])
+
+        return COLUMN_COUNTS.pack(*(len(columns[column_name]) for column_name, _ in RECORD_COLUMNS)) + b"".join(
+            struct.pack("<{}{}".format(len(columns[column_name]), value_type), *columns[column_name])
+            for column_name, value_type in RECORD_COLUMNS)
+
+    def _load(self):
+        # reads the string table and the index of an existing store, new records overwrite its string table
+        store = BinaryClassStore(self.project_name)
+        try:
+            self.data_end = store.data_end
+            self.string_ids = {store.string(string_id): string_id for string_id in range(len(store.strings))}
+            for class_name, record_offset in store.index.items():
+                record_length = RECORD_LENGTH.unpack_from(store.data, record_offset)[0]
+                self.index[class_name] = (record_offset, RECORD_LENGTH.size + record_length)
+        finally:
+            store.close()
+        self.file = open(self.path, "r+b")
+
+    def _compact(self):
+        # copies the remaining records into a new file, the string table is kept as the records refer to its ids
+        compacted_path = self.path + ".tmp"
+        with open(compacted_path, "wb") as compacted_file:
+            # the header is written by close
+            compacted_file.write(HEADER.pack(CLASS_STORE_MAGIC, CLASS_STORE_VERSION, 0, 0, 0))
+            compacted_index = {}
+            data_end = HEADER.size
+            for class_name, (record_offset, record_length) in self.index.items():
+                self.file.seek(record_offset)
+                compacted_file.write(self.file.read(record_length))
+                compacted_index[class_name] = (data_end, record_length)
+                data_end += record_length
+        self.file.close()
+        os.replace(compacted_path, self.path)
+        self.file = open(self.path, "r+b")
+        self.index = compacted_index
+        self.data_end = data_end
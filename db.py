@@ -1,4 +1,6 @@
 import sqlite3
+from contextlib import contextmanager
+from source_text import SourceTextReader
 
 
 class DataBase:
@@ -6,6 +8,35 @@ class DataBase:
     def __init__(self, db_name):
         self.conn = sqlite3.connect('./build/db/' + db_name + '.db')
         self.cursor = self.conn.cursor()
+        # inserts are committed immediately unless they are run inside of bulk_load
+        self.autocommit = True
+        # the texts of classes and methods are not stored, they are read from the source files when requested
+        self.source_reader = SourceTextReader()
+
+    @contextmanager
+    def bulk_load(self):
+        # runs all inserts of the with block in a single transaction
+        # fsyncs are disabled during the load, a crash during the load requires a rebuild of the database anyway
+        # the journal mode is stored in the database file, so the previous one is restored after the load
+        self.conn.commit()
+        journal_mode = self.cursor.execute("PRAGMA journal_mode").fetchone()[0]
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=OFF")
+        self.autocommit = False
+        try:
+            yield self
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            self.autocommit = True
+            self.cursor.execute("PRAGMA synchronous=FULL")
+            self.cursor.execute("PRAGMA journal_mode={}".format(journal_mode))
+
+    def commit(self):
+        if self.autocommit:
+            self.conn.commit()
 
     def reset(self):
         self.cursor.execute("DROP TABLE IF EXISTS projects")
@@ -16,6 +47,7 @@ class DataBase:
         self.cursor.execute("DROP TABLE IF EXISTS relatedMethodsOfMethod")
         self.cursor.execute("DROP TABLE IF EXISTS classVariables")
         self.cursor.execute("DROP TABLE IF EXISTS methodParameters")
+        self.cursor.execute("DROP TABLE IF EXISTS sourceFiles")
         self.conn.commit()
 
     def create_tables(self):
@@ -28,8 +60,9 @@ class DataBase:
                     projectName TEXT NOT NULL,
                     classModifier TEXT,
                     classSuperInterface TEXT,
-                    fullText TEXT NOT NULL,
-                    classHeader TEXT,
+                    startByte INTEGER NOT NULL,
+                    endByte INTEGER NOT NULL,
+                    headerEndByte INTEGER,
                     imports TEXT,
                     package TEXT,
                     filepath TEXT,
@@ -40,7 +73,10 @@ class DataBase:
             methodId INTEGER PRIMARY KEY AUTOINCREMENT,
             methodIdentifier TEXT NOT NULL,
             classIdentifier TEXT NOT NULL,
-            fullText TEXT,
+            startByte INTEGER,
+            endByte INTEGER,
+            commentStartByte INTEGER,
+            commentEndByte INTEGER,
             FOREIGN KEY (classIdentifier) REFERENCES classes(classIdentifier)
         )""")
 
@@ -74,44 +110,247 @@ class DataBase:
             FOREIGN KEY (methodId) REFERENCES methods(methodId)
         )""")
 
+        # state of the parsed source files, the byte offsets of classes and methods are only valid for this state
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS sourceFiles (
+            filepath TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtimeNs INTEGER NOT NULL,
+            hash TEXT NOT NULL
+        )""")
+
+        # content addressed cache of token counts, not dropped on reset as it stays valid across rebuilds
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS tokenCounts (
+            tokenizerId TEXT NOT NULL,
+            textHash TEXT NOT NULL,
+            tokenCount INTEGER NOT NULL,
+            PRIMARY KEY (tokenizerId, textHash)
+        )""")
+
         self.conn.commit()
 
-    def insert_project(self, project_name):
-        self.cursor.execute("INSERT INTO projects VALUES (?)", (project_name,))
+        self.create_indexes()
+
+    def create_indexes(self):
+        # lookup of methods by name and class (relation building)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idxMethodsIdentifierClass "
+                            "ON methods(methodIdentifier, classIdentifier)")
+        # relations of a single method (prompt construction)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idxRelatedMethodsOfMethodSource "
+                            "ON relatedMethodsOfMethod(methodIdSource)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idxRelatedClassesOfMethodMethod "
+                            "ON relatedClassesOfMethod(methodId)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idxMethodParametersMethod "
+                            "ON methodParameters(methodId)")
+        self.conn.commit()
+
+    def drop_indexes(self):
+        self.cursor.execute("DROP INDEX IF EXISTS idxMethodsIdentifierClass")
+        self.cursor.execute("DROP INDEX IF EXISTS idxRelatedMethodsOfMethodSource")
+        self.cursor.execute("DROP INDEX IF EXISTS idxRelatedClassesOfMethodMethod")
+        self.cursor.execute("DROP INDEX IF EXISTS idxMethodParametersMethod")
         self.conn.commit()
 
-    def insert_class(self, class_identifier, project_name, class_modifier, class_super_interface, full_text,
-                     class_header, imports, package, filepath):
-        self.cursor.execute("INSERT INTO classes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                            (class_identifier, project_name, class_modifier, class_super_interface, full_text,
-                             class_header, imports, package, filepath))
+    def analyze(self):
+        # collect statistics for the query planner, should be run after the database was filled
+        self.cursor.execute("ANALYZE")
         self.conn.commit()
 
+    def insert_project(self, project_name):
+        self.cursor.execute("INSERT INTO projects VALUES (?)", (project_name,))
+        self.commit()
+
+    def insert_class(self, class_identifier, project_name, class_modifier, class_super_interface, start_byte,
+                     end_byte, header_end_byte, imports, package, filepath):
+        self.cursor.execute("INSERT INTO classes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (class_identifier, project_name, class_modifier, class_super_interface, start_byte,
+                             end_byte, header_end_byte, imports, package, filepath))
+        self.commit()
+
     def insert_class_variable(self, class_identifier, variable_identifier, variable_type):
         self.cursor.execute("INSERT INTO classVariables VALUES (NULL, ?, ?, ?)",
                             (class_identifier, variable_identifier, variable_type))
-        self.conn.commit()
+        self.commit()
 
-    def insert_method(self, method_identifier, class_identifier, full_text):
-        self.cursor.execute("INSERT INTO methods VALUES (NULL, ?, ?, ?)",
-                            (method_identifier, class_identifier, full_text))
-        self.conn.commit()
+    def insert_method(self, method_identifier, class_identifier, start_byte, end_byte, comment_start_byte=None,
+                      comment_end_byte=None):
+        self.cursor.execute("INSERT INTO methods VALUES (NULL, ?, ?, ?, ?, ?, ?)",
+                            (method_identifier, class_identifier, start_byte, end_byte, comment_start_byte,
+                             comment_end_byte))
+        self.commit()
 
     def insert_method_parameter(self, method_identifier, parameter_type, parameter_name):
         self.cursor.execute("INSERT INTO methodParameters VALUES (NULL, ?, ?, ?)",
                             (method_identifier, parameter_type, parameter_name))
-        self.conn.commit()
+        self.commit()
 
     def insert_related_method_of_method(self, method_id_source: int, method_id_target: int):
         # source method calls target method
         self.cursor.execute("INSERT INTO relatedMethodsOfMethod VALUES (?, ?)",
                             (method_id_source, method_id_target))
-        self.conn.commit()
+        self.commit()
 
     def insert_related_class_of_method(self, method_id: int, class_identifier: str):
         self.cursor.execute("INSERT INTO relatedClassesOfMethod VALUES (?, ?)",
                             (method_id, class_identifier))
-        self.conn.commit()
+        self.commit()
+
+    def insert_classes(self, classes: list):
+        # classes is a list of tuples following the column order of the classes table
+        self.cursor.executemany("INSERT INTO classes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", classes)
+        self.commit()
+
+    def insert_class_variables(self, class_variables: list):
+        # class_variables is a list of (class identifier, variable identifier, variable type) tuples
+        self.cursor.executemany("INSERT INTO classVariables VALUES (NULL, ?, ?, ?)", class_variables)
+        self.commit()
+
+    def insert_methods(self, methods: list):
+        # methods is a list of (method id, method identifier, class identifier, start byte, end byte, comment start
+        # byte, comment end byte) tuples, the comment bytes are None if no comment precedes the method
+        # the method ids are assigned by the caller (see get_max_method_id), so they do not have to be queried
+        self.cursor.executemany("INSERT INTO methods VALUES (?, ?, ?, ?, ?, ?, ?)", methods)
+        self.commit()
+
+    def insert_method_parameters(self, method_parameters: list):
+        # method_parameters is a list of (method id, parameter type, parameter name) tuples
+        self.cursor.executemany("INSERT INTO methodParameters VALUES (NULL, ?, ?, ?)", method_parameters)
+        self.commit()
+
+    def insert_related_methods_of_method(self, related_methods: list):
+        # related_methods is a list of (source method id, target method id) tuples
+        self.cursor.executemany("INSERT INTO relatedMethodsOfMethod VALUES (?, ?)", related_methods)
+        self.commit()
+
+    def insert_related_classes_of_method(self, related_classes: list):
+        # related_classes is a list of (method id, class identifier) tuples
+        self.cursor.executemany("INSERT INTO relatedClassesOfMethod VALUES (?, ?)", related_classes)
+        self.commit()
+
+    def delete_classes(self, class_identifiers: list):
+        # deletes classes together with their variables, methods, method parameters and all relations of their methods
+        method_ids = self.get_method_ids_of_classes(class_identifiers)
+        self.delete_relations_of_methods(method_ids, include_incoming=True)
+        for start in range(0, len(method_ids), 500):
+            chunk = method_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            self.cursor.execute("DELETE FROM methodParameters WHERE methodId IN ({})".format(placeholders), chunk)
+            self.cursor.execute("DELETE FROM methods WHERE methodId IN ({})".format(placeholders), chunk)
+        for start in range(0, len(class_identifiers), 500):
+            chunk = class_identifiers[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            self.cursor.execute("DELETE FROM relatedClassesOfMethod WHERE classIdentifier IN ({})"
+                                .format(placeholders), chunk)
+            self.cursor.execute("DELETE FROM classVariables WHERE classIdentifier IN ({})".format(placeholders), chunk)
+            self.cursor.execute("DELETE FROM classes WHERE classIdentifier IN ({})".format(placeholders), chunk)
+        self.commit()
+
+    def delete_relations_of_methods(self, method_ids: list, include_incoming: bool = False):
+        # deletes the related methods and related classes of the given methods
+        # if include_incoming is set, relations of other methods pointing to the given methods are deleted as well
+        for start in range(0, len(method_ids), 500):
+            chunk = method_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            self.cursor.execute("DELETE FROM relatedMethodsOfMethod WHERE methodIdSource IN ({})".format(placeholders),
+                                chunk)
+            if include_incoming:
+                self.cursor.execute("DELETE FROM relatedMethodsOfMethod WHERE methodIdTarget IN ({})"
+                                    .format(placeholders), chunk)
+            self.cursor.execute("DELETE FROM relatedClassesOfMethod WHERE methodId IN ({})".format(placeholders), chunk)
+        self.commit()
+
+    def replace_source_files(self, source_files: dict):
+        # source_files maps the filepath of every parsed file to a dictionary with its size, mtime_ns and hash at
+        # parse time (see ProjectManifest)
+        self.cursor.execute("DELETE FROM sourceFiles")
+        self.cursor.executemany("INSERT INTO sourceFiles VALUES (?, ?, ?, ?)",
+                                [(filepath, state["size"], state["mtime_ns"], state["hash"])
+                                 for filepath, state in source_files.items()])
+        self.commit()
+        self.source_reader.file_states = None
+
+    def get_source_files(self):
+        # returns a dictionary with the filepath as key and a tuple of size, mtime_ns and hash as value
+        try:
+            self.cursor.execute("SELECT filepath, size, mtimeNs, hash FROM sourceFiles")
+        except sqlite3.OperationalError:
+            # database created by an older version, the files can not be checked
+            return {}
+        return {filepath: (size, mtime_ns, file_hash) for filepath, size, mtime_ns, file_hash in self.cursor.fetchall()}
+
+    def check_source_files(self):
+        # raises a SourceFileChangedError if a parsed source file changed since it was parsed
+        for filepath, state in self.get_source_files().items():
+            SourceTextReader.check_file_state(filepath, *state)
+
+    def insert_token_counts(self, tokenizer_id: str, token_counts: list):
+        # token_counts is a list of (text hash, token count) tuples
+        self.cursor.executemany("INSERT OR IGNORE INTO tokenCounts VALUES (?, ?, ?)",
+                                [(tokenizer_id, text_hash, token_count) for text_hash, token_count in token_counts])
+        self.commit()
+
+    def get_token_counts(self, tokenizer_id: str, text_hashes: list):
+        # returns a dictionary with the text hash as key and the token count as value for all cached hashes
+        result = {}
+        # stay below the maximum number of variables per statement
+        for start in range(0, len(text_hashes), 500):
+            chunk = text_hashes[start:start + 500]
+            self.cursor.execute("SELECT textHash, tokenCount FROM tokenCounts WHERE tokenizerId=? AND textHash IN ({})"
+                                .format(", ".join("?" * len(chunk))), (tokenizer_id, *chunk))
+            result.update(self.cursor.fetchall())
+        return result
+
+    def get_all_methods(self):
+        self.cursor.execute("""SELECT methods.*, classes.filepath
+                               FROM methods
+                               LEFT JOIN classes ON methods.classIdentifier = classes.classIdentifier""")
+        return self.fetch_methods_with_text()
+
+    def get_all_classes(self):
+        self.cursor.execute("SELECT * FROM classes")
+        return self.fetch_classes_with_text()
+
+    def fetch_methods_with_text(self):
+        # fetches the rows of a query selecting methods with the filepath of their class and adds their fullText
+        column_names = [description[0] for description in self.cursor.description]
+        methods = []
+        for row in self.cursor.fetchall():
+            method = dict(zip(column_names, row))
+            method["fullText"] = self.read_method_text(method["filepath"], method["startByte"], method["endByte"],
+                                                       method["commentStartByte"], method["commentEndByte"])
+            methods.append(method)
+        return methods
+
+    def fetch_classes_with_text(self):
+        # fetches the rows of a query selecting classes and adds their fullText and classHeader
+        column_names = [description[0] for description in self.cursor.description]
+        classes = []
+        for row in self.cursor.fetchall():
+            class_dict = dict(zip(column_names, row))
+            class_dict["fullText"] = self.read_text(class_dict["filepath"], class_dict["startByte"],
+                                                    class_dict["endByte"])
+            class_dict["classHeader"] = self.read_text(class_dict["filepath"], class_dict["startByte"],
+                                                       class_dict["headerEndByte"])
+            classes.append(class_dict)
+        return classes
+
+    def read_text(self, filepath, start_byte, end_byte):
+        # reads the text of a class or class header from its source file, an empty string if there is no text
+        if filepath is None or start_byte is None or end_byte is None:
+            return ""
+        return self.get_source_reader().read(filepath, start_byte, end_byte)
+
+    def read_method_text(self, filepath, start_byte, end_byte, comment_start_byte, comment_end_byte):
+        # reads the text of a method (preceded by its comment) from its source file
+        if filepath is None or start_byte is None:
+            return None
+        comment_span = (comment_start_byte, comment_end_byte) if comment_start_byte is not None else None
+        return self.get_source_reader().read_spans(filepath, [comment_span, (start_byte, end_byte)])
+
+    def get_source_reader(self):
+        # the states of the source files are loaded on the first read, as the table may not exist before
+        if self.source_reader.file_states is None:
+            self.source_reader.file_states = self.get_source_files()
+        return self.source_reader
 
     def get_method_id(self, method_identifier, class_identifier):
         self.cursor.execute("SELECT methodId FROM methods WHERE methodIdentifier=? AND classIdentifier =?",
@@ -130,26 +369,22 @@ class DataBase:
         return result[0]
 
     def get_method_by_id(self, method_id):
-        self.cursor.execute("SELECT * FROM methods WHERE methodId=?", (method_id,))
-        result = self.cursor.fetchone()
+        self.cursor.execute("""SELECT methods.*, classes.filepath
+                               FROM methods
+                               LEFT JOIN classes ON methods.classIdentifier = classes.classIdentifier
+                               WHERE methodId=?""", (method_id,))
+        result = self.fetch_methods_with_text()
         if result:
-            column_names = [description[0] for description in self.cursor.description]
-            result_dict = dict(zip(column_names, result))
-            return result_dict
+            return result[0]
         return None
 
     def get_related_methods_of_method(self, method_id):
-        self.cursor.execute(""" SELECT *
+        self.cursor.execute(""" SELECT methods.*, relatedMethodsOfMethod.*, classes.filepath
                                 FROM methods
                                 JOIN relatedMethodsOfMethod ON methods.methodId = relatedMethodsOfMethod.methodIdTarget
+                                LEFT JOIN classes ON methods.classIdentifier = classes.classIdentifier
                                 WHERE relatedMethodsOfMethod.methodIdSource = ?""", (method_id,))
-        result = self.cursor.fetchall()
-        result_list = []
-        for row in result:
-            column_names = [description[0] for description in self.cursor.description]
-            result_dict = dict(zip(column_names, row))
-            result_list.append(result_dict)
-        return result_list
+        return self.fetch_methods_with_text()
 
     def get_related_classes_of_method(self, method_id):
         self.cursor.execute("""SELECT * 
@@ -158,13 +393,7 @@ class DataBase:
                              ON classes.classIdentifier = relatedClassesOfMethod.classIdentifier 
                              WHERE relatedClassesOfMethod.methodId = ?"""
                             , (method_id,))
-        result = self.cursor.fetchall()
-        result_list = []
-        for row in result:
-            column_names = [description[0] for description in self.cursor.description]
-            result_dict = dict(zip(column_names, row))
-            result_list.append(result_dict)
-        return result_list
+        return self.fetch_classes_with_text()
 
     def get_imports_of_class(self, class_identifier):
         self.cursor.execute("SELECT imports FROM classes WHERE classIdentifier=?", (class_identifier,))
@@ -197,6 +426,117 @@ class DataBase:
             return result[0]
         return None
 
+    def get_method_ids(self):
+        self.cursor.execute("SELECT methodId FROM methods ORDER BY methodId")
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_method_ids_of_classes(self, class_identifiers: list):
+        method_ids = []
+        for start in range(0, len(class_identifiers), 500):
+            chunk = class_identifiers[start:start + 500]
+            self.cursor.execute("SELECT methodId FROM methods WHERE classIdentifier IN ({}) ORDER BY methodId"
+                                .format(", ".join("?" * len(chunk))), chunk)
+            method_ids.extend(row[0] for row in self.cursor.fetchall())
+        return method_ids
+
+    def get_class_identifiers(self):
+        self.cursor.execute("SELECT classIdentifier FROM classes")
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_method_identifiers(self):
+        # (method id, method identifier, class identifier) of all methods in the order of their ids
+        self.cursor.execute("SELECT methodId, methodIdentifier, classIdentifier FROM methods ORDER BY methodId")
+        return self.cursor.fetchall()
+
+    def get_method_parameter_types(self):
+        # (method id, parameter type) of all method parameters in the order they were declared
+        self.cursor.execute("SELECT methodId, parameterType FROM methodParameters ORDER BY id")
+        return self.cursor.fetchall()
+
+    def get_max_method_id(self):
+        self.cursor.execute("SELECT MAX(methodId) FROM methods")
+        result = self.cursor.fetchone()
+        if result and result[0] is not None:
+            return result[0]
+        return 0
+
+    def get_method_context(self, method_id):
+        # everything needed to construct the prompt for a method and to place its test, see get_method_contexts
+        return self.get_method_contexts([method_id]).get(int(method_id))
+
+    def get_method_contexts(self, method_ids):
+        # returns a dictionary with the method id as key and the context of the method as value:
+        # the method (methodId, methodIdentifier, classIdentifier, fullText), the classHeader, imports, package and
+        # filepath of its class, and the lists relatedMethods and relatedClasses
+        # the contexts of all methods are fetched with two queries per chunk of method ids
+        method_ids = [int(method_id) for method_id in method_ids]
+        contexts = {}
+        # stay below the maximum number of variables per statement
+        for start in range(0, len(method_ids), 500):
+            chunk = method_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+
+            self.cursor.execute("""SELECT methods.methodId, methods.methodIdentifier, methods.classIdentifier,
+                                         methods.startByte, methods.endByte, methods.commentStartByte,
+                                         methods.commentEndByte, classes.startByte, classes.headerEndByte,
+                                         classes.imports, classes.package, classes.filepath
+                                  FROM methods
+                                  LEFT JOIN classes ON methods.classIdentifier = classes.classIdentifier
+                                  WHERE methods.methodId IN ({})""".format(placeholders), chunk)
+            for method_id, method_identifier, class_identifier, start_byte, end_byte, comment_start_byte, \
+                    comment_end_byte, class_start_byte, header_end_byte, imports, package, filepath \
+                    in self.cursor.fetchall():
+                contexts[method_id] = {
+                    "methodId": method_id,
+                    "methodIdentifier": method_identifier,
+                    "classIdentifier": class_identifier,
+                    "fullText": self.read_method_text(filepath, start_byte, end_byte, comment_start_byte,
+                                                      comment_end_byte),
+                    "classHeader": self.read_text(filepath, class_start_byte, header_end_byte)
+                    if filepath is not None else None,
+                    "imports": imports,
+                    "package": package,
+                    "filepath": filepath,
+                    "relatedMethods": [],
+                    "relatedClasses": []
+                }
+
+            self.cursor.execute("""SELECT 'method' AS relation, relatedMethodsOfMethod.rowid AS relationId,
+                                         relatedMethodsOfMethod.methodIdSource AS sourceMethodId, methods.methodId,
+                                         methods.methodIdentifier, methods.classIdentifier, classes.filepath,
+                                         methods.startByte, methods.endByte, methods.commentStartByte,
+                                         methods.commentEndByte
+                                  FROM relatedMethodsOfMethod
+                                  JOIN methods ON methods.methodId = relatedMethodsOfMethod.methodIdTarget
+                                  LEFT JOIN classes ON methods.classIdentifier = classes.classIdentifier
+                                  WHERE relatedMethodsOfMethod.methodIdSource IN ({0})
+                                  UNION ALL
+                                  SELECT 'class' AS relation, relatedClassesOfMethod.rowid AS relationId,
+                                         relatedClassesOfMethod.methodId AS sourceMethodId, NULL, NULL,
+                                         classes.classIdentifier, classes.filepath, classes.startByte,
+                                         classes.endByte, NULL, NULL
+                                  FROM relatedClassesOfMethod
+                                  JOIN classes ON classes.classIdentifier = relatedClassesOfMethod.classIdentifier
+                                  WHERE relatedClassesOfMethod.methodId IN ({0})
+                                  ORDER BY relation, relationId""".format(placeholders), chunk + chunk)
+            for relation, _, source_method_id, method_id, method_identifier, class_identifier, filepath, start_byte, \
+                    end_byte, comment_start_byte, comment_end_byte in self.cursor.fetchall():
+                # methodIdSource is stored as text
+                context = contexts.get(int(source_method_id))
+                if context is None:
+                    continue
+                if relation == "method":
+                    context["relatedMethods"].append({"methodId": method_id,
+                                                      "methodIdentifier": method_identifier,
+                                                      "classIdentifier": class_identifier,
+                                                      "fullText": self.read_method_text(filepath, start_byte,
+                                                                                        end_byte, comment_start_byte,
+                                                                                        comment_end_byte)})
+                else:
+                    context["relatedClasses"].append({"classIdentifier": class_identifier,
+                                                      "fullText": self.read_text(filepath, start_byte, end_byte)})
+        return contexts
+
     def get_num_of_methods(self):
         self.cursor.execute("SELECT COUNT(*) FROM methods")
         result = self.cursor.fetchone()
@@ -205,11 +545,11 @@ class DataBase:
         return None
 
     def get_class_header_for_method(self, method_id: int):
-        self.cursor.execute("""SELECT classHeader
+        self.cursor.execute("""SELECT classes.filepath, classes.startByte, classes.headerEndByte
                                 FROM methods
                                 INNER JOIN classes ON methods.classIdentifier = classes.classIdentifier
                                 WHERE methods.methodId = ?""", (method_id,))
         result = self.cursor.fetchone()
         if result:
-            return result[0]
+            return self.read_text(*result)
         return None
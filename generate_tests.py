@@ -1,10 +1,11 @@
 from prompt_builder import PromptBuilder
-from llm import LocalServerLlm, HuggingFaceLlm
+from llm import LocalServerLlm, HuggingFaceLlm, BatchingLlm
+from llm_cache import CachingLlm
 import os
 from db import DataBase
 from utils import make_dir_if_not_exists, \
     write_file, replace_str_in_file, \
-    delete_lines_starting_with, extract_source_code, log_to_csv
+    delete_lines_starting_with, extract_source_code, contains_complete_class, log_to_csv
 from run_test import TestExecuter
 from java_parser import JavaCodeParser
 import logging
@@ -12,15 +13,30 @@ import datetime
 import configparser
 from timeout_decorator import timeout
 
+# number of method contexts fetched from the database at once when generating tests for a range of methods
+METHOD_CONTEXT_PREFETCH_SIZE = 100
+
+# seconds the test generation for one method may take
+METHOD_TIMEOUT = 600
+
 
 class TestGenerator:
 
-    def __init__(self, project_name, run_id):
+    def __init__(self, project_name, run_id, batch_llm_requests=False, use_llm_cache=True):
+        """
+        :param project_name: name of the project to generate tests for
+        :param run_id: ID of the run which is used to name the tests and the log files
+        :param batch_llm_requests: if the requests of several threads to the local web server should be batched
+        (see BatchingLlm), used by the pipeline
+        :param use_llm_cache: if False, the LLM is always queried, even if LLM_CACHE is set (see CachingLlm)
+        """
 
         self.config = configparser.ConfigParser()
         self.config.read('config.ini')
         self.USE_HUGGINGFACE = self.config.getboolean('INFERENCE', 'USE_HUGGINGFACE')
         self.USE_LOCAL_WEB_SERVER = self.config.getboolean('INFERENCE', 'USE_LOCAL_WEB_SERVER')
+        # stream the answers of the LLM and stop the generation once the test class is complete
+        self.stream_answers = self.config.getboolean('INFERENCE', 'STREAM_ANSWERS', fallback=False)
 
         self.run_id = run_id
 
@@ -30,6 +46,11 @@ class TestGenerator:
             self.llm = HuggingFaceLlm()
         elif self.USE_LOCAL_WEB_SERVER:
             self.llm = LocalServerLlm()
+            if batch_llm_requests:
+                self.llm = BatchingLlm(self.llm)
+
+        if use_llm_cache and self.config.getboolean('INFERENCE', 'LLM_CACHE', fallback=False):
+            self.llm = CachingLlm(self.llm, run_id)
 
         self.project_name = project_name
 
@@ -38,6 +59,8 @@ class TestGenerator:
                             level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
         self.db = DataBase(project_name)
+        # the prompts are read from the source files using the byte offsets of the last parse
+        self.db.check_source_files()
         self.prompt_constructor = PromptBuilder(project_name)
         self.test_executer = TestExecuter(project_name, False)
         self.java_parser = JavaCodeParser()
@@ -46,7 +69,7 @@ class TestGenerator:
         self.num_methods = self.db.get_num_of_methods()
 
     def generate_target_filepaths(self, project_name: str, method_id: int):
-        filepath = self.db.get_filepath_for_method(method_id)
+        filepath = self.prompt_constructor.get_method_context(method_id)["filepath"]
         filepath = filepath.split('/')
         start_idx = filepath.index('java') + 1
         filepath = filepath[start_idx:-1]
@@ -76,7 +99,10 @@ class TestGenerator:
 
     def get_answer(self, prompt):
         print("> Prompt created, querying LLM")
-        answer = self.llm(prompt)
+        if self.stream_answers:
+            answer = self.llm.generate_until(prompt, contains_complete_class)
+        else:
+            answer = self.llm(prompt)
         print("> LLM answered, processing answer")
         logging.info("LLM answered: " + answer)
         # delete the last line of the answer as it should always be ``` due to the prompt
@@ -120,8 +146,8 @@ class TestGenerator:
         # change class name
         current_class_name = self.java_parser.extract_class_name(
             filepaths['execution_filepath'] + f"/{method_id}_test.java")
-        new_class_name = self.db.get_class_identifier_for_method(
-            method_id) + f"Test_Method_{str(method_id)}_Run_{str(self.run_id)}"
+        new_class_name = self.prompt_constructor.get_method_context(method_id)["classIdentifier"] \
+            + f"Test_Method_{str(method_id)}_Run_{str(self.run_id)}"
         if current_class_name:
             logging.info("Class name extracted: " + current_class_name)
             replace_str_in_file(filepaths['execution_filepath'] + f"/{method_id}_test.java", current_class_name,
@@ -137,15 +163,7 @@ class TestGenerator:
 
     def run_compilation_repair(self, method_id, filepaths, compilation_output, new_class_name):
         try:
-            print(">> Compilation failed, running LLM repair")
-            logging.info("Compilation failed with the following output: " + compilation_output)
-            logging.info("Running LLM repair")
-            # read in text of test file which caused the error
-            test_file_text = ""
-            with open(filepaths['execution_filepath'] + f"/{new_class_name}.java", 'r') as file:
-                test_file_text = file.read()
-            prompt = self.prompt_constructor.construct_compile_error_repair_prompt(test_file_text,
-                                                                                   compilation_output)
+            prompt = self.construct_compilation_repair_prompt(filepaths, compilation_output, new_class_name)
 
             if prompt:
                 # query LLM with constructed prompt
@@ -153,11 +171,7 @@ class TestGenerator:
                 if not answer:
                     return False
 
-                answer = self.add_package_information(answer, filepaths)
-
-                logging.info("Answer created: " + answer)
-                # change text of test file to repaired version
-                write_file(filepaths['execution_filepath'], new_class_name, ".java", answer)
+                self.write_repaired_test(filepaths, new_class_name, answer)
                 return True
         except Exception as e:
             logging.info("Error during compilation repair: " + str(e))
@@ -165,23 +179,15 @@ class TestGenerator:
 
     def run_execution_repair(self, filepaths, execution_output, new_class_name):
         try:
-            with open(filepaths['execution_filepath'] + f"/{new_class_name}.java", 'r') as file:
-                test_file_text = file.read()
-
-            prompt = self.prompt_constructor.construct_execution_error_repair_prompt(test_file_text, execution_output)
+            prompt = self.construct_execution_repair_prompt(filepaths, execution_output, new_class_name)
 
             if prompt:
-                logging.info("Created execution repair prompt: " + prompt)
                 # query LLM with constructed prompt
                 answer = self.get_answer(prompt)
                 if not answer:
                     return False
 
-                answer = self.add_package_information(answer, filepaths)
-
-                logging.info("Answer created: " + answer)
-                # change text of test file to repaired version
-                write_file(filepaths['execution_filepath'], new_class_name, ".java", answer)
+                self.write_repaired_test(filepaths, new_class_name, answer)
                 return True
             else:
                 logging.info("Could not create execution repair prompt")
@@ -190,172 +196,260 @@ class TestGenerator:
             logging.info("Error during execution repair: " + str(e))
             return False
 
-    @timeout(600, use_signals=True)
+    def construct_compilation_repair_prompt(self, filepaths, compilation_output, new_class_name):
+        print(">> Compilation failed, running LLM repair")
+        logging.info("Compilation failed with the following output: " + compilation_output)
+        logging.info("Running LLM repair")
+        # read in text of test file which caused the error
+        with open(filepaths['execution_filepath'] + f"/{new_class_name}.java", 'r') as file:
+            test_file_text = file.read()
+        return self.prompt_constructor.construct_compile_error_repair_prompt(test_file_text, compilation_output)
+
+    def construct_execution_repair_prompt(self, filepaths, execution_output, new_class_name):
+        print(">> Execution failed, running LLM repair")
+        logging.info("Execution failed with the following output: " + execution_output)
+        logging.info("Running LLM execution repair")
+        with open(filepaths['execution_filepath'] + f"/{new_class_name}.java", 'r') as file:
+            test_file_text = file.read()
+
+        prompt = self.prompt_constructor.construct_execution_error_repair_prompt(test_file_text, execution_output)
+        if prompt:
+            logging.info("Created execution repair prompt: " + prompt)
+        return prompt
+
+    def write_repaired_test(self, filepaths, new_class_name, answer):
+        answer = self.add_package_information(answer, filepaths)
+
+        logging.info("Answer created: " + answer)
+        # change text of test file to repaired version
+        write_file(filepaths['execution_filepath'], new_class_name, ".java", answer)
+
+    @timeout(METHOD_TIMEOUT, use_signals=True)
     def generate_test_for_method(self, method_id, compilation_repair_rounds=1, execution_repair_rounds=3):
+        generated_test = self.generate_initial_test(method_id)
+        if not generated_test:
+            return
+        filepaths, new_class_name = generated_test
+
+        print("> Wrote test to file, compiling...")
+
+        # initial compilation of the generated test
+        compilation_result = self.compile_test(method_id, filepaths, new_class_name)
+
+        self.repair_and_execute_test(method_id, filepaths, new_class_name, compilation_result,
+                                     compilation_repair_rounds, execution_repair_rounds)
+
+    def generate_initial_test(self, method_id):
+        """
+        Queries the LLM for a test of the method and writes it to the execution folder.
+        :param method_id: ID of the method to generate a test for
+        :return: Tuple of the filepaths dictionary of the method and the class name of the test or None if no test
+        could be generated
+        """
         try:
-            print("\n Generating test for method " + str(method_id))
-            logging.info("Generating test for method " + str(method_id))
-            prompt = self.prompt_constructor.construct_initial_prompt(str(method_id))
-            logging.info("Prompt created: " + prompt)
+            prompt = self.construct_initial_prompt(method_id)
 
             if prompt:
                 # query LLM with constructed prompt
                 answer = self.get_answer(prompt)
                 if not answer:
-                    print(">> Could not extract answer from LLM, skipping test")
-                    logging.info("Could not extract answer from LLM, skipping test")
-                    log_to_csv(self.project_name, method_id, "Answer Extraction Error", 1, self.run_id)
+                    self.log_answer_extraction_error(method_id)
                     return
 
-                filepaths = self.generate_target_filepaths(self.project_name, method_id)
+                return self.write_initial_test(method_id, prompt, answer)
 
-                answer = self.add_package_information(answer, filepaths)
+        except Exception as e:
+            self.log_generation_exception(method_id, e)
+            return
 
-                self.create_target_folders(filepaths)
+    def construct_initial_prompt(self, method_id):
+        print("\n Generating test for method " + str(method_id))
+        logging.info("Generating test for method " + str(method_id))
+        prompt = self.prompt_constructor.construct_initial_prompt(str(method_id))
+        logging.info("Prompt created: " + prompt)
+        return prompt
 
-                write_file(filepaths['prompt_path'], str(method_id) + "_prompt.md", "", prompt)
-                write_file(filepaths['execution_filepath'], str(method_id) + "_test.java", "", answer)
+    def write_initial_test(self, method_id, prompt, answer):
+        """
+        Writes the prompt and the test generated by the LLM to the folders of the method and gives the test class a
+        unique name.
+        :param method_id: ID of the method the test was generated for
+        :param prompt: initial prompt of the method
+        :param answer: source code extracted from the answer of the LLM
+        :return: Tuple of the filepaths dictionary of the method and the class name of the test or None if the class
+        name could not be extracted
+        """
+        filepaths = self.generate_target_filepaths(self.project_name, method_id)
 
-                new_class_name = self.change_class_name(method_id, filepaths)
+        answer = self.add_package_information(answer, filepaths)
 
-                if not new_class_name:
-                    log_to_csv(self.project_name, method_id, "Class Name Extraction Error", 1, self.run_id)
+        self.create_target_folders(filepaths)
+
+        write_file(filepaths['prompt_path'], str(method_id) + "_prompt.md", "", prompt)
+        write_file(filepaths['execution_filepath'], str(method_id) + "_test.java", "", answer)
+
+        new_class_name = self.change_class_name(method_id, filepaths)
+
+        if not new_class_name:
+            log_to_csv(self.project_name, method_id, "Class Name Extraction Error", 1, self.run_id)
+            return
+
+        return filepaths, new_class_name
+
+    def repair_and_execute_test(self, method_id, filepaths, new_class_name, compilation_result,
+                                compilation_repair_rounds=1, execution_repair_rounds=3):
+        """
+        Repairs the compilation errors of a generated test, executes it, repairs the execution errors and moves the
+        test to the folder of its result.
+        :param method_id: ID of the method the test was generated for
+        :param filepaths: filepaths dictionary of the method
+        :param new_class_name: class name of the test
+        :param compilation_result: Tuple of return code and output of the initial compilation of the test
+        :param compilation_repair_rounds: Number of repair rounds for compilation errors
+        :param execution_repair_rounds: Number of repair rounds for execution errors
+        :return:
+        """
+        try:
+            compilation_result_code, compilation_output = compilation_result
+
+            # if compilation fails, try to repair the compilation error
+            # run repair rounds until compilation succeeds or the maximum number of repair rounds is reached
+            current_repair_round = 1
+            while compilation_result_code != 0 and current_repair_round <= compilation_repair_rounds:
+                if not self.run_compilation_repair(method_id, filepaths, compilation_output, new_class_name):
+                    self.log_repair_prompt_error(method_id, "Compilation", current_repair_round)
                     return
+                compilation_result_code, compilation_output = self.compile_test(method_id, filepaths,
+                                                                                new_class_name)
+                current_repair_round += 1
 
-                print("> Wrote test to file, compiling...")
-
-                # initial compilation of the generated test
-                compilation_result_code, compilation_output = self.test_executer.compile_test_case(
-                    f"classpath_{str(method_id)}.txt",
-                    filepaths['execution_filepath'] +
-                    f"/{new_class_name}.java")
-
-                # if compilation fails, try to repair the compilation error
-                # run repair rounds until compilation succeeds or the maximum number of repair rounds is reached
-                current_repair_round = 1
-                while compilation_result_code != 0 and current_repair_round <= compilation_repair_rounds:
-                    compilation_repair_sucess = self.run_compilation_repair(method_id, filepaths, compilation_output,
-                                                                            new_class_name)
-
-                    if compilation_repair_sucess:
-                        # compile the test again
-                        compilation_result_code, compilation_output = self.test_executer.compile_test_case(
-                            f"classpath_{str(method_id)}.txt",
-                            filepaths[
-                                'execution_filepath'] +
-                            f"/{new_class_name}.java")
-                        logging.info("Compilation result: " + str(compilation_output))
-
-                    else:
-                        print(">> Could not create repair prompt, skipping test")
-                        logging.info("Could not create repair prompt, skipping test")
-                        log_to_csv(self.project_name, method_id,
-                                   f"Compilation Repair Prompt Construction Error Round {current_repair_round}", 1,
-                                   self.run_id)
-                        return
-
-                    current_repair_round += 1
-
-                # if compilation still fails after repair, skip the test
-                if compilation_result_code != 0:
-                    log_to_csv(self.project_name, method_id, f"Compilation Error Round {current_repair_round - 1}", 1,
-                               self.run_id, compilation_output)
-                    print(">> Compilation failed after repair, skipping test \n")
-                    logging.info("Compilation failed after repair, skipping test")
-                    # copy java file to from execution folder to compile error folder
-                    os.rename(filepaths['execution_filepath'] + f"/{new_class_name}.java",
-                              filepaths['compile_error_filepath'] + f"/{new_class_name}.java")
+            # if compilation still fails after repair, skip the test
+            if not self.finish_compilation(method_id, filepaths, new_class_name,
+                                           (compilation_result_code, compilation_output), current_repair_round - 1):
+                return
+
+            execution_result_code, execution_output = self.execute_test(method_id, filepaths, new_class_name)
+
+            current_execution_repair_round = 1
+            while execution_result_code != 0 and current_execution_repair_round <= execution_repair_rounds:
+                if not self.run_execution_repair(filepaths, execution_output, new_class_name):
+                    self.log_repair_prompt_error(method_id, "Execution", current_execution_repair_round)
                     return
 
-                # if compilation succeeds, execute the test
-                if compilation_result_code == 0:
-                    print("> Compilation successful \n")
-                    logging.info("Compilation successful")
-                    log_to_csv(self.project_name, method_id, f"Compilation Successful Round {current_repair_round - 1}",
-                               0,
-                               self.run_id)
-
-                    print("> Executing test \n")
-
-                    execution_result_code, execution_output = self.test_executer.run_test(
-                        f"classpath_{str(method_id)}.txt",
-                        filepaths[
-                            'package'] + f".{new_class_name}")
-
-                    current_execution_repair_round = 1
-                    while execution_result_code != 0 and current_execution_repair_round <= execution_repair_rounds:
-                        print(">> Execution failed, running LLM repair")
-                        logging.info("Execution failed with the following output: " + execution_output)
-                        logging.info("Running LLM execution repair")
-
-                        execution_repair_sucess = self.run_execution_repair(filepaths, execution_output, new_class_name)
-
-                        if execution_repair_sucess:
-                            print(">> Compiling repaired test")
-                            logging.info("Compiling repaired test")
-
-                            # compile the test again
-                            compilation_result_code, compilation_output = self.test_executer.compile_test_case(
-                                f"classpath_{str(method_id)}.txt",
-                                filepaths['execution_filepath'] +
-                                f"/{new_class_name}.java")
-                            if compilation_result_code != 0:
-                                print(">> Compilation failed after repair, skipping test \n")
-                                logging.info("Compilation failed after repair, skipping test")
-                                log_to_csv(self.project_name, method_id,
-                                           f"Compilation Error during Execution Repair Round {current_execution_repair_round}",
-                                           1,
-                                           self.run_id)
-                                # skip the test if compilation fails
-                                break
-
-                            print(">> Running repaired test")
-                            logging.info("Running repaired test")
-                            execution_result_code, execution_output = self.test_executer.run_test(
-                                f"classpath_{str(method_id)}.txt",
-                                filepaths[
-                                    'package'] + f".{new_class_name}")
-                            logging.info("Execution result: " + str(execution_output))
-                        else:
-                            print(">> Could not create repair prompt, skipping test")
-                            logging.info("Could not create repair prompt, skipping test")
-                            log_to_csv(self.project_name, method_id,
-                                       f"Execution Repair Prompt Construction Error Round {current_execution_repair_round}",
-                                       1,
-                                       self.run_id)
-                            return
-
-                        current_execution_repair_round += 1
-
-                    if execution_result_code == 0:
-                        print(">> Execution successful, test will be saved \n")
-                        logging.info("Execution successful, test will be saved")
-                        log_to_csv(self.project_name, method_id,
-                                   f"Execution Successful after {current_execution_repair_round - 1} repairs", 0,
-                                   self.run_id)
-                        # move java file to from execution folder to passed folder
-                        os.rename(filepaths['execution_filepath'] + f"/{new_class_name}.java",
-                                  filepaths['passed_filepath'] + f"/{new_class_name}.java")
-                        print(">> Test finished \n")
-                    else:
-                        print(">> Execution failed after repair, skipping test \n")
-                        log_to_csv(self.project_name, method_id,
-                                   f"Execution Error after after {current_execution_repair_round - 1} repairs", 1,
-                                   self.run_id, execution_output)
-                        # copy java file to from execution folder to execution error folder
-                        os.rename(filepaths['execution_filepath'] + f"/{new_class_name}.java",
-                                  filepaths['execution_error_filepath'] + f"/{new_class_name}.java")
-                        return
+                compilation_result_code, compilation_output = self.compile_test(method_id, filepaths,
+                                                                                new_class_name)
+                if compilation_result_code != 0:
+                    # skip the test if compilation fails
+                    self.log_compilation_error_during_execution_repair(method_id, current_execution_repair_round)
+                    break
+
+                execution_result_code, execution_output = self.execute_test(method_id, filepaths, new_class_name)
+                current_execution_repair_round += 1
+
+            self.finish_execution(method_id, filepaths, new_class_name, (execution_result_code, execution_output),
+                                  current_execution_repair_round - 1)
 
         except Exception as e:
-            logging.exception("Exception occurred " + str(e))
-            print("Exception occurred " + str(e))
-            print("Skipping method")
-            log_to_csv(self.project_name, method_id,
-                       "Other Error", 1,
-                       self.run_id, str(e))
+            self.log_generation_exception(method_id, e)
             return
 
+    def compile_test(self, method_id, filepaths, new_class_name):
+        """
+        :return: Tuple of return code and output of the compilation of the test
+        """
+        compilation_result = self.test_executer.compile_test_case(
+            f"classpath_{str(method_id)}.txt", filepaths['execution_filepath'] + f"/{new_class_name}.java")
+        logging.info("Compilation result: " + str(compilation_result[1]))
+        return compilation_result
+
+    def execute_test(self, method_id, filepaths, new_class_name):
+        """
+        :return: Tuple of return code and output of the execution of the test
+        """
+        print(f"> Executing test for method {method_id} \n")
+        execution_result = self.test_executer.run_test(f"classpath_{str(method_id)}.txt",
+                                                       filepaths['package'] + f".{new_class_name}")
+        logging.info("Execution result: " + str(execution_result[1]))
+        return execution_result
+
+    def finish_compilation(self, method_id, filepaths, new_class_name, compilation_result, repair_rounds):
+        """
+        Logs the result of the compilation after the compilation repair rounds and moves the test to the compile
+        error folder if the compilation failed.
+        :param compilation_result: Tuple of return code and output of the last compilation of the test
+        :param repair_rounds: Number of repair rounds that were run
+        :return: True if the test compiled, False otherwise
+        """
+        compilation_result_code, compilation_output = compilation_result
+        if compilation_result_code != 0:
+            log_to_csv(self.project_name, method_id, f"Compilation Error Round {repair_rounds}", 1,
+                       self.run_id, compilation_output)
+            print(f">> Compilation of the test for method {method_id} failed after repair, skipping test \n")
+            logging.info("Compilation failed after repair, skipping test")
+            # move java file from execution folder to compile error folder
+            os.rename(filepaths['execution_filepath'] + f"/{new_class_name}.java",
+                      filepaths['compile_error_filepath'] + f"/{new_class_name}.java")
+            return False
+
+        print(f"> Compilation of the test for method {method_id} successful \n")
+        logging.info("Compilation successful")
+        log_to_csv(self.project_name, method_id, f"Compilation Successful Round {repair_rounds}", 0, self.run_id)
+        return True
+
+    def finish_execution(self, method_id, filepaths, new_class_name, execution_result, repair_rounds):
+        """
+        Logs the result of the execution after the execution repair rounds and moves the test to the passed or the
+        execution error folder.
+        :param execution_result: Tuple of return code and output of the last execution of the test
+        :param repair_rounds: Number of repair rounds that were run
+        :return:
+        """
+        execution_result_code, execution_output = execution_result
+        if execution_result_code == 0:
+            print(f">> Execution of the test for method {method_id} successful, test will be saved \n")
+            logging.info("Execution successful, test will be saved")
+            log_to_csv(self.project_name, method_id, f"Execution Successful after {repair_rounds} repairs", 0,
+                       self.run_id)
+            # move java file from execution folder to passed folder
+            os.rename(filepaths['execution_filepath'] + f"/{new_class_name}.java",
+                      filepaths['passed_filepath'] + f"/{new_class_name}.java")
+        else:
+            print(f">> Execution of the test for method {method_id} failed after repair, skipping test \n")
+            log_to_csv(self.project_name, method_id, f"Execution Error after after {repair_rounds} repairs", 1,
+                       self.run_id, execution_output)
+            # move java file from execution folder to execution error folder
+            os.rename(filepaths['execution_filepath'] + f"/{new_class_name}.java",
+                      filepaths['execution_error_filepath'] + f"/{new_class_name}.java")
+
+    def log_repair_prompt_error(self, method_id, repair_type, repair_round):
+        """
+        :param repair_type: "Compilation" or "Execution"
+        :param repair_round: repair round that could not be run
+        """
+        print(f">> Could not create repair prompt for method {method_id}, skipping test")
+        logging.info("Could not create repair prompt, skipping test")
+        log_to_csv(self.project_name, method_id, f"{repair_type} Repair Prompt Construction Error Round {repair_round}",
+                   1, self.run_id)
+
+    def log_compilation_error_during_execution_repair(self, method_id, repair_round):
+        print(f">> Compilation of the test for method {method_id} failed after repair, skipping test \n")
+        logging.info("Compilation failed after repair, skipping test")
+        log_to_csv(self.project_name, method_id, f"Compilation Error during Execution Repair Round {repair_round}", 1,
+                   self.run_id)
+
+    def log_answer_extraction_error(self, method_id):
+        print(">> Could not extract answer from LLM, skipping test")
+        logging.info("Could not extract answer from LLM, skipping test")
+        log_to_csv(self.project_name, method_id, "Answer Extraction Error", 1, self.run_id)
+
+    def log_generation_exception(self, method_id, e):
+        logging.exception("Exception occurred " + str(e))
+        print("Exception occurred " + str(e))
+        print("Skipping method")
+        log_to_csv(self.project_name, method_id,
+                   "Other Error", 1,
+                   self.run_id, str(e))
+
     def generate_tests_for_whole_project(self, runs_per_method=1, compilation_repair_rounds=1,
                                          execution_repair_rounds=1):
         """
@@ -365,24 +459,41 @@ class TestGenerator:
         :param execution_repair_rounds: Number of repair rounds for execution errors
         :return:
         """
-        self.generate_tests_for_method_range(range(1, self.num_methods + 1), runs_per_method, compilation_repair_rounds,
+        # method ids can have gaps after incremental updates of the database
+        self.generate_tests_for_method_range(self.db.get_method_ids(), runs_per_method, compilation_repair_rounds,
                                              execution_repair_rounds)
 
     def generate_tests_for_method_range(self, method_range: range, runs_per_method=1, compilation_repair_rounds=1,
                                         execution_repair_rounds=1):
         """
         Generates tests for a range of methods in the project based on the method id
-        :param method_range: range of method ids
+        :param method_range: range (or list) of method ids
         :param runs_per_method: Trys per method
         :param compilation_repair_rounds: Number of repair rounds for compilation errors
         :param execution_repair_rounds: Number of repair rounds for execution errors
         :return:
         """
+        method_ids = list(method_range)
         for run in range(1, runs_per_method + 1):
-            for method_id in method_range:
-                try:
-                    self.generate_test_for_method(method_id, compilation_repair_rounds, execution_repair_rounds)
-                except TimeoutError as e:
-                    print("Function execution timed out for method " + str(method_id))
-                    logging.info("Function execution timed out for method " + str(method_id))
-                    log_to_csv(self.project_name, method_id, "Timeout Error", 1, self.run_id, str(e))
+            for start in range(0, len(method_ids), METHOD_CONTEXT_PREFETCH_SIZE):
+                # fetch the contexts of the next methods at once instead of querying them method by method
+                method_id_chunk = method_ids[start:start + METHOD_CONTEXT_PREFETCH_SIZE]
+                self.prompt_constructor.prefetch_method_contexts(method_id_chunk)
+                for method_id in method_id_chunk:
+                    try:
+                        self.generate_test_for_method(method_id, compilation_repair_rounds, execution_repair_rounds)
+                    except TimeoutError as e:
+                        self.log_generation_timeout(method_id, e)
+        self.log_llm_metrics()
+
+    def log_llm_metrics(self):
+        # latencies of the requests to the HuggingFace inference API
+        metrics = getattr(self.llm, "metrics", None)
+        if metrics is not None:
+            print("LLM requests: " + str(metrics.summary()))
+            logging.info("LLM requests: " + str(metrics.summary()))
+
+    def log_generation_timeout(self, method_id, e):
+        print("Function execution timed out for method " + str(method_id))
+        logging.info("Function execution timed out for method " + str(method_id))
+        log_to_csv(self.project_name, method_id, "Timeout Error", 1, self.run_id, str(e))
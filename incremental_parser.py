@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import shutil
+from class_store import BinaryClassStoreWriter, class_store_path
+from java_parser import JavaCodeParser
+from utils import print_progress_bar, make_dir_if_not_exists
+
+# has to be increased whenever the parser output or the database schema changes
+# manifests of other versions are ignored, so the projects are parsed again completely
+MANIFEST_VERSION = 3
+
+
+class ProjectManifest:
+    """
+    This class keeps track of the state of every Java file of a project at the time it was last parsed
+    (size, modification time and content hash) as well as the classes it contains and the classes it references.
+    It is used to only re-parse files that changed since the last run.
+    """
+
+    def __init__(self, project_name: str):
+        """
+        Loads the manifest of a project if it exists.
+        :param project_name: Name of the project.
+        """
+        self.project_name = project_name
+        self.manifest_path = f"./build/manifests/{project_name}.json"
+        self.files = {}
+        self.loaded = False
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as file:
+                manifest = json.load(file)
+            if isinstance(manifest, dict) and manifest.get("version") == MANIFEST_VERSION:
+                self.files = manifest["files"]
+                self.loaded = True
+
+    def exists(self):
+        """
+        :return: True if the project was parsed before and the manifest was saved by this version, False otherwise.
+        """
+        return self.loaded
+
+    def save(self):
+        """
+        Writes the manifest to the build folder.
+        """
+        make_dir_if_not_exists("./build/manifests")
+        with open(self.manifest_path, "w") as file:
+            file.write(json.dumps({"version": MANIFEST_VERSION, "files": self.files}))
+
+    def delete(self):
+        """
+        Deletes the saved manifest, e.g. if the project was parsed without writing json files.
+        """
+        self.files = {}
+        self.loaded = False
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+    def clear(self):
+        """
+        Removes all files from the manifest, e.g. before a full parse of the project.
+        """
+        self.files = {}
+
+    def find_changed_files(self, filepaths: list):
+        """
+        Compares the files of the project with the manifest. The content hash of a file is only computed if its size
+        or modification time changed.
+        :param filepaths: Filepaths of all Java files of the project.
+        :return: Tuple of the list of new or changed files and the list of files that were deleted
+        """
+        changed_files = []
+        for filepath in filepaths:
+            entry = self.files.get(filepath)
+            if entry is None:
+                changed_files.append(filepath)
+                continue
+
+            stat = os.stat(filepath)
+            if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+                continue
+
+            if self.hash_file(filepath) == entry["hash"]:
+                # only touched, remember the new modification time to skip hashing next time
+                entry["mtime_ns"] = stat.st_mtime_ns
+            else:
+                changed_files.append(filepath)
+
+        existing_files = set(filepaths)
+        deleted_files = [filepath for filepath in self.files if filepath not in existing_files]
+        return changed_files, deleted_files
+
+    def update(self, filepath: str, file_information: list):
+        """
+        Records the current state of a parsed file.
+        :param filepath: Filepath of the parsed Java file.
+        :param file_information: Information extracted from the file (see JavaCodeParser.extract_file_information).
+        """
+        stat = os.stat(filepath)
+        referenced_classes = set()
+        for class_output, method_output in file_information:
+            for method in method_output:
+                referenced_classes.update(related_method["method_class"] for related_method in method["related_methods"])
+                referenced_classes.update(method["method_parameter_types"].values())
+
+        self.files[filepath] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": self.hash_file(filepath),
+            "classes": [class_output["class_identifier"] for class_output, _ in file_information],
+            "referenced_classes": sorted(referenced_classes)
+        }
+
+    def remove(self, filepath: str):
+        """
+        Removes a deleted file from the manifest.
+        :param filepath: Filepath of the deleted Java file.
+        """
+        self.files.pop(filepath, None)
+
+    def classes_of_files(self, filepaths: list):
+        """
+        :param filepaths: Filepaths of Java files in the manifest.
+        :return: Set of the identifiers of all classes contained in the files.
+        """
+        return {class_identifier for filepath in filepaths for class_identifier in self.files[filepath]["classes"]}
+
+    def classes_referencing(self, class_identifiers: set):
+        """
+        :param class_identifiers: Identifiers of classes.
+        :return: Set of the identifiers of all classes in files that reference one of the given classes.
+        """
+        return {class_identifier for entry in self.files.values()
+                if not class_identifiers.isdisjoint(entry["referenced_classes"])
+                for class_identifier in entry["classes"]}
+
+    @staticmethod
+    def hash_file(filepath: str):
+        """
+        :param filepath: Filepath of the file to hash.
+        :return: Hex digest of the SHA-256 hash of the file content.
+        """
+        with open(filepath, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+
+def parse_project_incrementally(java_parser: JavaCodeParser, manifest: ProjectManifest, filepaths: list,
+                                processes: int = 0):
+    """
+    Re-parses only the files of a project that changed since the last parse and updates the JSON files (or the binary
+    class store, if the project was parsed into one) and the manifest accordingly. The manifest is not saved, as it should only be saved once the database was updated.
+    :param java_parser: Parser used for the changed files.
+    :param manifest: Manifest of the project.
+    :param filepaths: Filepaths of all Java files of the project.
+    :param processes: Amount of processes to use for parsing. If 0, the files are parsed in this process.
+    :return: Dictionary with the identifiers of the removed_classes (changed or deleted), the parsed_classes and the
+    relinked_classes (unchanged classes referencing a changed class), see json_to_db.update_db_from_json.
+    """
+    project_name = manifest.project_name
+    changed_files, deleted_files = manifest.find_changed_files(filepaths)
+    print(f"{len(changed_files)} new or changed and {len(deleted_files)} deleted file(s) in the project "
+          f"{project_name}.")
+
+    # classes of the previous version of the changed and deleted files
+    removed_classes = manifest.classes_of_files([filepath for filepath in changed_files + deleted_files
+                                                 if filepath in manifest.files])
+    store_writer = None
+    if os.path.exists(class_store_path(project_name)):
+        store_writer = BinaryClassStoreWriter(project_name, append=True)
+        store_writer.delete_classes(removed_classes)
+    else:
+        for class_identifier in removed_classes:
+            shutil.rmtree(f"./build/class_parser/{project_name}/{class_identifier}", ignore_errors=True)
+    for filepath in deleted_files:
+        manifest.remove(filepath)
+
+    parsed_classes = set()
+    curr_file = 1
+    for filepath, file_information in java_parser.parse_files(changed_files, project_name, processes,
+                                                              write_json=store_writer is None):
+        manifest.update(filepath, file_information)
+        if store_writer is not None:
+            store_writer.add_file_information(file_information)
+        parsed_classes.update(class_output["class_identifier"] for class_output, _ in file_information)
+        print_progress_bar(curr_file, len(changed_files), prefix="Parsing files in project: {}".format(project_name),
+                           display_100_percent=True)
+        curr_file += 1
+    if store_writer is not None:
+        store_writer.close()
+
+    # unchanged classes whose relations may point to removed, changed or new classes
+    relinked_classes = manifest.classes_referencing(removed_classes | parsed_classes) - parsed_classes
+
+    return {
+        "removed_classes": removed_classes,
+        "parsed_classes": parsed_classes,
+        "relinked_classes": relinked_classes
+    }
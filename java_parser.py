@@ -2,7 +2,113 @@ import json
 from typing import List
 
 from tree_sitter import Language, Parser
+import hashlib
+import multiprocessing
 import os
+import re
+
+TREE_SITTER_LIBRARY_PATH = 'build/tree-sitter-languages.so'
+TREE_SITTER_GRAMMAR_PATHS = ['vendor/tree-sitter-java']
+
+# node types collected in a single traversal of every method declaration
+METHOD_NODE_TYPES = ["block", "method_invocation", "local_variable_declaration", "object_creation_expression"]
+
+# tree-sitter queries (S-expressions) evaluated in native code, every capture is named after the captured node type
+JAVA_QUERIES = {
+    # declarations on the top level of a file
+    "file": """
+        (program (package_declaration) @package_declaration)
+        (program (import_declaration) @import_declaration)
+        (program (class_declaration) @class_declaration)
+    """,
+    # nodes of a method declaration needed to extract its related classes and methods
+    "method": "\n".join("({0}) @{0}".format(node_type) for node_type in METHOD_NODE_TYPES),
+}
+
+# language, parser and compiled queries shared by all JavaCodeParser instances of a process, created on first use
+_java_language = None
+_java_parser = None
+_java_queries = {}
+
+
+def get_java_language():
+    """
+    Returns the tree-sitter Java language of this process and loads it on first use.
+    :return: Java language
+    """
+    global _java_language
+    if _java_language is None:
+        build_language_library_if_stale()
+        _java_language = Language(TREE_SITTER_LIBRARY_PATH, 'java')
+    return _java_language
+
+
+def get_java_parser():
+    """
+    Returns the tree-sitter parser for Java of this process and creates it on first use.
+    :return: Parser with the Java language set
+    """
+    global _java_parser
+    if _java_parser is None:
+        _java_parser = Parser()
+        _java_parser.set_language(get_java_language())
+    return _java_parser
+
+
+def get_java_query(query_name: str):
+    """
+    Returns the compiled query of this process and compiles it on first use.
+    :param query_name: Name of the query in JAVA_QUERIES.
+    :return: Query of the Java language
+    """
+    if query_name not in _java_queries:
+        _java_queries[query_name] = get_java_language().query(JAVA_QUERIES[query_name])
+    return _java_queries[query_name]
+
+
+def build_language_library_if_stale():
+    """
+    Builds the tree-sitter library if it does not exist or if the grammar sources changed since it was built.
+    The hash of the grammar sources used for the last build is stored next to the library.
+    """
+    grammar_hash = hash_grammar_sources(TREE_SITTER_GRAMMAR_PATHS)
+    hash_path = TREE_SITTER_LIBRARY_PATH + '.sha256'
+
+    if os.path.exists(TREE_SITTER_LIBRARY_PATH):
+        # without grammar sources the existing library is used as is
+        if grammar_hash is None:
+            return
+        if os.path.exists(hash_path):
+            with open(hash_path, 'r') as file:
+                if file.read() == grammar_hash:
+                    return
+        # build_library only compares modification times, so a stale library has to be removed first
+        os.remove(TREE_SITTER_LIBRARY_PATH)
+
+    Language.build_library(TREE_SITTER_LIBRARY_PATH, TREE_SITTER_GRAMMAR_PATHS)
+
+    if grammar_hash is not None:
+        with open(hash_path, 'w') as file:
+            file.write(grammar_hash)
+
+
+def hash_grammar_sources(grammar_paths):
+    """
+    Hashes the sources (the src folder) of tree-sitter grammars.
+    :param grammar_paths: Paths of the grammar repositories.
+    :return: Hex digest of the SHA-256 hash over all source files or None if there are no source files.
+    """
+    grammar_hash = hashlib.sha256()
+    has_sources = False
+    for grammar_path in grammar_paths:
+        for root, _, files in sorted(os.walk(os.path.join(grammar_path, 'src'))):
+            for file_name in sorted(files):
+                has_sources = True
+                file_path = os.path.join(root, file_name)
+                grammar_hash.update(os.path.relpath(file_path, grammar_path).encode('utf-8'))
+                with open(file_path, 'rb') as file:
+                    grammar_hash.update(file.read())
+    return grammar_hash.hexdigest() if has_sources else None
 
 
 class JavaCodeParser:
@@ -12,24 +118,9 @@ class JavaCodeParser:
 
     def __init__(self):
         """
-        This method initializes the JavaCodeParser class and builds the parser.
+        This method initializes the JavaCodeParser class. The parser is shared by all instances of a process.
         """
-
-        # build the parser if it doesn't exist – only needs to be done once
-        Language.build_library(
-            # Store the library in the `build` directory
-            'build/tree-sitter-languages.so',
-
-            # Include one or more languages
-            [
-                'vendor/tree-sitter-java'
-            ]
-        )
-
-        JAVA_LANGUAGE = Language('build/tree-sitter-languages.so', 'java')
-
-        self.parser = Parser()
-        self.parser.set_language(JAVA_LANGUAGE)
+        self.parser = get_java_parser()
 
     def parse_file(self, filepath, project_name):
         """
@@ -38,36 +129,87 @@ class JavaCodeParser:
         :param project_name: Name of the project the file belongs to. Used for naming the output file.
         :return:
         """
-
+        file_information = self.extract_file_information(filepath)
+        self.write_file_information(file_information, project_name)
+
+    def parse_files(self, filepaths, project_name, processes: int = 0, write_json: bool = True):
+        """
+        This method parses several Java files, optionally distributed over a pool of processes.
+        The output files are always written by the calling process in the order of the filepaths, so the result
+        does not depend on the number of processes.
+        :param filepaths: Filepaths of the Java files to parse.
+        :param project_name: Name of the project the files belong to. Used for naming the output files.
+        :param processes: Amount of processes to use for parsing. If 0, the files are parsed in this process.
+        :param write_json: If the extracted information should be written to JSON files. If False, the information is
+        only yielded (e.g. to stream it into the database).
+        :return: Generator yielding the filepath and the extracted information (see extract_file_information) of
+        every parsed file.
+        """
+        if processes == 0:
+            for filepath in filepaths:
+                file_information = self.extract_file_information(filepath)
+                if write_json:
+                    self.write_file_information(file_information, project_name)
+                yield filepath, file_information
+            return
+
+        # every worker builds its own parser once, the files are handed out in small chunks to balance the load
+        with multiprocessing.Pool(processes, initializer=_init_parse_worker) as pool:
+            for filepath, file_information in zip(filepaths,
+                                                  pool.imap(_extract_file_information_in_worker, filepaths,
+                                                            chunksize=8)):
+                if write_json:
+                    self.write_file_information(file_information, project_name)
+                yield filepath, file_information
+
+    def extract_file_information(self, filepath):
+        """
+        This method extracts the information about all classes and their methods of a single Java file.
+        :param filepath: Filepath of the Java file to parse.
+        :return: List of tuples containing the class information and the list of method information of every class
+        (test classes are skipped).
+        """
         with open(filepath, 'r') as file:
             try:
                 file_content = file.read()
             except IOError:
-                return {}
+                return []
 
         # provides an object tree that can be used to extract information about certain elements
         # the tree variable contains the root node of the constructed sytax tree
-        tree = self.parser.parse(bytes(file_content, "utf8"))
+        source_code = bytes(file_content, "utf8")
+        tree = self.parser.parse(source_code)
 
-        # get all class declarations (usually only one per file)
-        classes = JavaCodeParser.extract_classes_of_tree(tree)
-
-        # get all imports
-        # has do be done here, as there is no access to the imports on a class level
-        imports = JavaCodeParser.extract_import_declarations(tree)
-        package_name = JavaCodeParser.extract_package_name(tree)
+        # get all class declarations (usually only one per file), imports and the package with a single query
+        # imports have do be extracted here, as there is no access to the imports on a class level
+        file_nodes = JavaCodeParser.query_nodes(tree.root_node, "file")
+        classes = file_nodes["class_declaration"]
+        imports = "\n".join(node.text.decode("utf-8") for node in file_nodes["import_declaration"])
+        package_name = "\n".join(node.text.decode("utf-8") for node in file_nodes["package_declaration"])
 
         # extract metadata for each class in the file and extract methods of the class
-        class_output_list = []
+        file_information = []
         for class_node in classes:
             # filter out test classes based on the @Test annotation
-            if JavaCodeParser.is_test_class(class_node):
+            if JavaCodeParser.is_test_class(class_node, source_code):
                 continue
 
             class_output = JavaCodeParser.extract_class_information(class_node, filepath, imports, package_name)
             method_output = JavaCodeParser.extract_all_method_information(class_node, class_output["class_identifier"],
                                                                           filepath)
+            file_information.append((class_output, method_output))
+
+        return file_information
 
+    def write_file_information(self, file_information, project_name):
+        """
+        This method writes the information extracted from a single Java file to JSON files.
+        :param file_information: Information returned by extract_file_information.
+        :param project_name: Name of the project the file belongs to. Used for naming the output file.
+        :return:
+        """
+        class_output_list = []
+        for class_output, method_output in file_information:
             # Write method_output_list to a JSON file
             self.write_method_file(method_output, project_name, class_output["class_identifier"])
 
@@ -75,17 +217,20 @@ class JavaCodeParser:
             class_output_list.append(class_output)
 
         if class_output_list:
-            self.write_class_file(class_output_list, project_name, class_output["class_identifier"])
+            self.write_class_file(class_output_list, project_name, class_output_list[-1]["class_identifier"])
 
     @staticmethod
-    def is_test_class(class_node):
+    def is_test_class(class_node, source_code: bytes = None):
         """
         This method checks if a class is a test class based on the @Test annotation.
         :param class_node: A class node produced by tree-sitter.
+        :param source_code: Source code the class node was parsed from. If given, the annotation is searched in place
+        instead of copying the text of the class.
         :return: True if the class is a test class, False otherwise.
         """
-        is_test_class = class_node.text.decode('utf-8').find("@Test") != -1
-        return is_test_class
+        if source_code is None:
+            return class_node.text.find(b"@Test") != -1
+        return source_code.find(b"@Test", class_node.start_byte, class_node.end_byte) != -1
 
     @staticmethod
     def extract_all_method_information(class_node, class_identifier, filepath):
@@ -113,21 +258,29 @@ class JavaCodeParser:
                 if parameter.children[0].type == "type_identifier":
                     method_parameters_output[parameter.children[1].text.decode("utf-8")] = \
                         parameter.children[0].text.decode("utf-8")
-            method_full_text = method.text.decode("utf-8")
+            # the text is not decoded here, only its position in the source file is recorded
+            method_span = [method.start_byte, method.end_byte]
 
             # add comments to the method declarations if they precede the method declaration
+            # (the full text of the method is the comment and the method joined by a line break)
+            method_comment_span = None
             if method.prev_named_sibling is not None and (method.prev_named_sibling.type == "comment" or method.prev_named_sibling.type == "block_comment"):
-                method_full_text = method.prev_named_sibling.text.decode("utf-8") + "\n" + method_full_text
+                method_comment_span = [method.prev_named_sibling.start_byte, method.prev_named_sibling.end_byte]
 
-            related_classes = JavaCodeParser.extract_related_classes_of_method(method)
+            # all nodes needed to extract the related classes and methods are captured by a single query
+            method_nodes = JavaCodeParser.query_nodes(method, "method")
+
+            related_classes = JavaCodeParser.extract_related_classes_of_method(method, method_nodes)
 
             related_methods = JavaCodeParser.extract_related_methods_of_method(method, method_parameters_output,
-                                                                               class_identifier, class_variables)
+                                                                               class_identifier, class_variables,
+                                                                               method_nodes)
 
             method_output_list.append({
                 "method_identifier": method_identifier,
                 "method_parameter_types": method_parameters_output,
-                "method_full_text": method_full_text,
+                "method_span": method_span,
+                "method_comment_span": method_comment_span,
                 "class_identifier": class_identifier,
                 "filepath": filepath,
                 "related_classes": related_classes,
@@ -165,15 +318,16 @@ class JavaCodeParser:
         # reverse to get the last constructor declaration
         for node in class_body.children:
             if node.type == "constructor_declaration" or node.type == "field_declaration":
-                class_header_end_byte = node.end_byte - class_node.start_byte
+                class_header_end_byte = node.end_byte
 
-        # if there is no constructor declaration, we take the last
+        # if there is no constructor declaration, the class has no header
         if class_header_end_byte is not None:
-            class_header = class_node.text[0:class_header_end_byte].decode("utf-8")
+            class_header_span = [class_node.start_byte, class_header_end_byte]
         else:
-            class_header = ""
+            class_header_span = None
 
-        class_full_text = class_node.text.decode("utf-8")
+        # the texts are not decoded here, only their position in the source file is recorded
+        class_span = [class_node.start_byte, class_node.end_byte]
 
         class_methods = [JavaCodeParser.extract_method_identifier_parameter_types(node) for node in class_body.children
                          if node.type == "method_declaration"]
@@ -185,8 +339,8 @@ class JavaCodeParser:
                                                                   class_modifier,
                                                                   class_super_interfaces,
                                                                   class_constructors,
-                                                                  class_header,
-                                                                  class_full_text,
+                                                                  class_header_span,
+                                                                  class_span,
                                                                   class_methods,
                                                                   class_variable_declarations,
                                                                   imports,
@@ -233,7 +387,7 @@ class JavaCodeParser:
             "constructor_identifier": "ConstructorName",
             "constructor_parameter_types": ["param_type1", "param_type2", ...],
             "related_classes": ["related_class1", "related_class2", ...]
-            "constructor_full_text": "full_text_of_constructor"
+            "constructor_span": [start_byte, end_byte]
             }, ...]
         :param class_node: A class node produced by tree-sitter.
         :return: Class constructors.
@@ -244,14 +398,14 @@ class JavaCodeParser:
         class_constructors_output = []
         for constructor in class_constructors:
             constructor_information = JavaCodeParser.extract_method_identifier_parameter_types(constructor)
-            constructor_related_classes = JavaCodeParser.extract_related_classes_of_method(constructor)
-            constructor_full_text = constructor.text.decode("utf-8")
+            constructor_related_classes = JavaCodeParser.extract_related_classes_of_method(
+                constructor, JavaCodeParser.query_nodes(constructor, "method"))
 
             class_constructors_output.append({
                 "constructor_identifier": constructor_information["method_identifier"],
                 "constructor_parameter_types": constructor_information["method_parameter_types"],
                 "related_classes": constructor_related_classes,
-                "constructor_full_text": constructor_full_text
+                "constructor_span": [constructor.start_byte, constructor.end_byte]
             })
 
         return class_constructors_output
@@ -283,10 +437,8 @@ class JavaCodeParser:
         :param tree_node: Tree returned by the tree-sitter parser.
         :return: Single string of import declarations.
         """
-        import_declarations = [node.text.decode("utf-8") for node in tree_node.root_node.children if
-                               node.type == "import_declaration"]
-        import_declarations = "\n".join(import_declarations)
-        return import_declarations
+        import_declarations = JavaCodeParser.query_nodes(tree_node.root_node, "file")["import_declaration"]
+        return "\n".join(node.text.decode("utf-8") for node in import_declarations)
 
     @staticmethod
     def extract_classes_of_tree(tree_node):
@@ -295,15 +447,16 @@ class JavaCodeParser:
         :param tree_node: Tree returned by the tree-sitter parser.
         :return: List of classes.
         """
-        classes = [node for node in tree_node.root_node.children if node.type == "class_declaration"]
-        return classes
+        return JavaCodeParser.query_nodes(tree_node.root_node, "file")["class_declaration"]
 
     @staticmethod
-    def extract_related_classes_of_method(method_node):
+    def extract_related_classes_of_method(method_node, method_nodes=None):
         """
         This method extracts all related classes of a method. Related classes are classes that are used for
         initializing class variables.
         :param method_node: Node of the method to extract information from.
+        :param method_nodes: Nodes of the method already collected with query_nodes or collect_nodes_with_types
+        (needs to include the type object_creation_expression). If None, the method body is traversed.
         :return: List of related class identifiers used for initializing class variables.
         """
         method_body = []
@@ -316,9 +469,17 @@ class JavaCodeParser:
 
         if method_body:
             method_body = method_body[0]
-            object_creation_expressions = JavaCodeParser.find_nodes_with_type(method_body, "object_creation_expression")
-            related_classes = [JavaCodeParser.find_nodes_with_type(item, "type_identifier")[0].text.decode("utf-8")
-                               for item in object_creation_expressions]
+            if method_nodes is None:
+                object_creation_expressions = JavaCodeParser.find_nodes_with_type(method_body,
+                                                                                  "object_creation_expression")
+            else:
+                object_creation_expressions = JavaCodeParser.nodes_within(method_nodes["object_creation_expression"],
+                                                                          method_body)
+            related_classes = []
+            for item in object_creation_expressions:
+                type_identifier = JavaCodeParser.find_first_node_with_type(item, "type_identifier")
+                if type_identifier is not None:
+                    related_classes.append(type_identifier.text.decode("utf-8"))
 
             return related_classes
 
@@ -330,22 +491,78 @@ class JavaCodeParser:
         This method traverses all children nodes of the given node and
         returns a list of all nodes with the specified type.
         :param node: A node produced by tree-sitter.
-        :param result: A list of nodes with the specified type.
         :param node_type: A string specifying the type of nodes to return.
         :return: List of nodes with the specified type.
         """
-        result = []
+        return JavaCodeParser.collect_nodes_with_types(node, [node_type])[node_type]
 
-        def dfs(node, node_type):
-            if node.type == node_type:
-                result.append(node)
+    @staticmethod
+    def query_nodes(node, query_name: str):
+        """
+        This method runs a query of JAVA_QUERIES on the given node and all of its descendants.
+        The tree is searched by tree-sitter in native code, the captures are only grouped here.
+        :param node: A node produced by tree-sitter.
+        :param query_name: Name of the query in JAVA_QUERIES.
+        :return: Dictionary with the capture name (the node type) as key and the list of captured nodes (in
+        pre-order) as value.
+        """
+        result = {capture_name: [] for capture_name in re.findall(r"@(\w+)", JAVA_QUERIES[query_name])}
+        for captured_node, capture_name in get_java_query(query_name).captures(node):
+            result[capture_name].append(captured_node)
+        return result
 
-            for child in node.children:
-                dfs(child, node_type)
+    @staticmethod
+    def collect_nodes_with_types(node, node_types):
+        """
+        This method traverses the given node and all of its descendants once (pre-order, without recursion) and
+        collects the nodes of all specified types.
+        :param node: A node produced by tree-sitter.
+        :param node_types: The types of nodes to collect.
+        :return: Dictionary with the node type as key and the list of nodes of this type (in pre-order) as value.
+        """
+        result = {node_type: [] for node_type in node_types}
+        cursor = node.walk()
+        while True:
+            current_node = cursor.node
+            if current_node.type in result:
+                result[current_node.type].append(current_node)
 
-        dfs(node, node_type)
+            if cursor.goto_first_child():
+                continue
+            # go up until there is a next sibling, the cursor can not leave the given node
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return result
 
-        return result
+    @staticmethod
+    def find_first_node_with_type(node, node_type: str):
+        """
+        This method returns the first node (in pre-order) of the specified type within the given node.
+        :param node: A node produced by tree-sitter.
+        :param node_type: A string specifying the type of the node to return.
+        :return: The first node with the specified type or None if there is none.
+        """
+        cursor = node.walk()
+        while True:
+            if cursor.node.type == node_type:
+                return cursor.node
+
+            if cursor.goto_first_child():
+                continue
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return None
+
+    @staticmethod
+    def nodes_within(nodes, container_node):
+        """
+        This method filters nodes to the ones located within the container node.
+        :param nodes: Nodes produced by tree-sitter.
+        :param container_node: The node that has to contain the nodes.
+        :return: List of nodes within the container node.
+        """
+        return [node for node in nodes
+                if container_node.start_byte <= node.start_byte and node.end_byte <= container_node.end_byte]
 
     @staticmethod
     def extract_method_information(method_node):
@@ -389,7 +606,7 @@ class JavaCodeParser:
 
     @staticmethod
     def construct_class_output_dict(filepath, class_identifier, class_modifier, class_super_interfaces,
-                                    class_constructors, class_header, class_full_text, class_methods,
+                                    class_constructors, class_header_span, class_span, class_methods,
                                     class_variable_declarations, imports, package_name):
         """
         This method constructs a dictionary with all relevant information about a class.
@@ -398,8 +615,9 @@ class JavaCodeParser:
         :param class_modifier: Modifier of the class.
         :param class_super_interfaces: Interfaces the class implements.
         :param class_constructors: Constructor of the class.
-        :param class_header: Class header containing everything from the beginning of the class to the constructor.
-        :param class_full_text: Full text of the class.
+        :param class_header_span: Start and end byte of the class header in the source file (everything from the
+        beginning of the class to the last constructor or field) or None if the class has no header.
+        :param class_span: Start and end byte of the full text of the class in the source file.
         :param class_methods: List of dictionaries containing all relevant information about the methods of the class.
         :param class_variable_declarations: List of dictionaries containing class level variable declarations.
         :param imports: String containing all imports of the class.
@@ -412,8 +630,8 @@ class JavaCodeParser:
             "class_modifier": class_modifier,
             "class_super_interfaces": class_super_interfaces,
             "class_constructors": class_constructors,
-            "class_header": class_header,
-            "class_full_text": class_full_text,
+            "class_header_span": class_header_span,
+            "class_span": class_span,
             "class_methods": class_methods,
             "class_variable_declarations": class_variable_declarations,
             "imports": imports,
@@ -451,23 +669,30 @@ class JavaCodeParser:
             file.write(json.dumps(class_output_list))
 
     @staticmethod
-    def extract_related_methods_of_method(method, method_parameters, class_identifier, class_variables):
-        method_body = JavaCodeParser.find_nodes_with_type(method, "block")
+    def extract_related_methods_of_method(method, method_parameters, class_identifier, class_variables,
+                                          method_nodes=None):
+        # differentiate between method and constructor
+        node_type = method.type.split("_")[0]
+        invocation_type = "{}_invocation".format(node_type)
+
+        # collect all nodes needed below in a single traversal of the method
+        if method_nodes is None or invocation_type not in method_nodes:
+            method_nodes = JavaCodeParser.collect_nodes_with_types(method, METHOD_NODE_TYPES + [invocation_type])
+
+        method_body = method_nodes["block"]
 
         if not method_body:
             return []
         else:
             method_body = method_body[0]
 
-        # differentiate between method and constructor
-        node_type = method.type.split("_")[0]
-
         # extract invocations in the method body
-        invocations = JavaCodeParser.find_nodes_with_type(method_body, "{}_invocation".format(node_type))
+        invocations = JavaCodeParser.nodes_within(method_nodes[invocation_type], method_body)
 
         # get variable declarations within the method body to determine the type of the arguments
         # if the argument is a variable, the type is the type of the variable
-        variables = JavaCodeParser.extract_variable_declarations_of_method(method_body)
+        variables = JavaCodeParser.extract_variable_declarations_of_method(
+            method_body, JavaCodeParser.nodes_within(method_nodes["local_variable_declaration"], method_body))
 
         methods = []
 
@@ -527,26 +752,27 @@ class JavaCodeParser:
         return argument_types
 
     @staticmethod
-    def extract_variable_declarations_of_method(method_body):
+    def extract_variable_declarations_of_method(method_body, declarations=None):
         """
         This method extracts all variable declarations of a method.
         :param method_body: Method body to extract the variable declarations from.
+        :param declarations: Local variable declaration nodes of the method body if they were already collected.
         :return: Dictionary containing the names of the variables as keys and the types of the variables as values.
         """
-        declarations = JavaCodeParser.find_nodes_with_type(method_body, "local_variable_declaration")
+        if declarations is None:
+            declarations = JavaCodeParser.find_nodes_with_type(method_body, "local_variable_declaration")
 
         variable_declarations = {}
 
         for declaration in declarations:
             variable_type = declaration.child_by_field_name("type").text.decode("utf-8")
-            variable_declarator = JavaCodeParser.find_nodes_with_type(declaration, "variable_declarator")[0]
-            variable_name = JavaCodeParser.find_nodes_with_type(variable_declarator, "identifier")[0].text.decode(
+            variable_declarator = JavaCodeParser.find_first_node_with_type(declaration, "variable_declarator")
+            variable_name = JavaCodeParser.find_first_node_with_type(variable_declarator, "identifier").text.decode(
                 "utf-8")
             variable_declarations[variable_name] = variable_type
 
         return variable_declarations
 
-
     @staticmethod
     def extract_package_name(tree_node):
         """
@@ -554,10 +780,8 @@ class JavaCodeParser:
         :param tree: AST of the project.
         :return: Package name of the project.
         """
-        package_declarations = [node.text.decode("utf-8") for node in tree_node.root_node.children if
-                               node.type == "package_declaration"]
-        package_declarations = "\n".join(package_declarations)
-        return package_declarations
+        package_declarations = JavaCodeParser.query_nodes(tree_node.root_node, "file")["package_declaration"]
+        return "\n".join(node.text.decode("utf-8") for node in package_declarations)
 
     def extract_class_name(self, filepath: str):
         """
@@ -580,3 +804,16 @@ class JavaCodeParser:
             return class_name
         else:
             return None
+
+
+# parser of a worker process of JavaCodeParser.parse_files
+_worker_parser = None
+
+
+def _init_parse_worker():
+    global _worker_parser
+    _worker_parser = JavaCodeParser()
+
+
+def _extract_file_information_in_worker(filepath):
+    return _worker_parser.extract_file_information(filepath)
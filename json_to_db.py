@@ -1,109 +1,335 @@
 from db import DataBase
+from prompt_builder import PromptBuilder
+from symbol_table import SymbolTable
+from class_store import BinaryClassStore, class_store_path
 import os
 import json
 from utils import print_progress_bar
 
+# number of rows collected before they are written to the database with a single executemany
+INSERT_BATCH_SIZE = 1000
+
 
 def convert_json_to_db(project_names: str):
     """
-    Converts the json files to a database
+    Converts the json files (or the binary class store, see class_store.py) to a database
     :param project_names: list of selected projects in /build/class_parser to convert to database
     :return:
     """
-    for project_name in os.listdir("./build/class_parser"):
-        if project_name not in project_names:
+    for project_name in project_names:
+        class_files = open_class_files(project_name)
+        if class_files is None:
             continue
         # create new database for every project for faster querying and avoiding conflicts between projects
         db = DataBase(project_name)
         db.reset()
         db.create_tables()
 
-        # insert project
-        db.insert_project(str(project_name))
-
-        n_classes = len(os.listdir("./build/class_parser/" + project_name))
-        curr_class = 1
-
-        # loop over all classes
-        for class_name in os.listdir("./build/class_parser/" + project_name):
-            print_progress_bar(curr_class, n_classes, prefix="Adding classes of {} to database".format(project_name),
-                               display_100_percent=True)
-            curr_class += 1
-            # read in class.json file and convert it to a dictionary
-            # check if class file exists
-            if os.path.exists("./build/class_parser/" + project_name + "/" + class_name + "/class.json") \
-                    and os.path.exists("./build/class_parser/" + project_name + "/" + class_name + "/methods.json"):
-                class_file = open("./build/class_parser/" + project_name + "/" + class_name + "/class.json", "r")
-                method_file = open("./build/class_parser/" + project_name + "/" + class_name + "/methods.json", "r")
-                with class_file:
-                    class_list = json.load(class_file)
-
-                with method_file:
-                    method_list = json.load(method_file)
-
-                for class_dict in class_list:
-                    # write to database
-                    db.insert_class(class_dict["class_identifier"],
-                                    project_name,
-                                    class_dict["class_modifier"],
-                                    class_dict["class_super_interfaces"],
-                                    class_dict["class_full_text"],
-                                    class_dict["class_header"],
-                                    class_dict["imports"],
-                                    class_dict["package"],
-                                    class_dict["filepath"])
-
-                    for var in class_dict["class_variable_declarations"]:
-                        db.insert_class_variable(class_dict["class_identifier"],
-                                                 var["variable_identifier"],
-                                                 var["variable_type"])
-
-                    for method_dict in method_list:
-                        # write methods of class to database
-                        db.insert_method(method_dict["method_identifier"],
-                                         class_dict["class_identifier"],
-                                         method_dict["method_full_text"])
-
-                        methodId = db.get_method_id(method_dict["method_identifier"], class_dict["class_identifier"])
-
-                        # write parameters of method to database
-                        for key in method_dict["method_parameter_types"]:
-                            db.insert_method_parameter(methodId,
-                                                       method_dict["method_parameter_types"][key],
-                                                       key)
-
-        curr_class = 1
-        # create intra-project relations
-        for class_name in os.listdir("./build/class_parser/" + project_name):
-            print_progress_bar(curr_class, n_classes,
-                               prefix="Adding intra-project relations of {} to database".format(project_name),
-                               display_100_percent=True)
-            curr_class += 1
-            if os.path.exists("./build/class_parser/" + project_name + "/" + class_name + "/class.json") \
-                    and os.path.exists("./build/class_parser/" + project_name + "/" + class_name + "/methods.json"):
-                class_file = open("./build/class_parser/" + project_name + "/" + class_name + "/class.json", "r")
-                method_file = open("./build/class_parser/" + project_name + "/" + class_name + "/methods.json", "r")
-                with class_file:
-                    class_list = json.load(class_file)
-
-                with method_file:
-                    method_list = json.load(method_file)
-
-                for class_dict in class_list:
-                    for method_dict in method_list:
-                        source_method_id = db.get_method_id(method_dict["method_identifier"],
-                                                            class_dict["class_identifier"])
-                        # write intra-project relations to database
-                        for related_method in method_dict["related_methods"]:
-                            target_method_id = db.get_method_id(related_method["method_name"],
-                                                                related_method["method_class"])
-                            if target_method_id is not None:
-                                # relation between methods
-                                db.insert_related_method_of_method(source_method_id, target_method_id)
-
-                            # relation between methods and classes
-                        for key in method_dict["method_parameter_types"]:
-                            # check if class exists in database
-                            class_id = db.get_class_id(method_dict["method_parameter_types"][key])
-                            if class_id is not None:
-                                db.insert_related_class_of_method(source_method_id, class_id)
+        class_names = class_files.class_names()
+
+        # all inserts of the project are written in one transaction
+        with db.bulk_load():
+            # insert project
+            db.insert_project(str(project_name))
+
+            insert_classes_from_json(db, project_name, class_names, class_files)
+
+            # create intra-project relations
+            insert_relations_from_json(db, project_name, class_names, class_files)
+        class_files.close()
+
+        # update the statistics of the query planner now that the tables are filled
+        db.analyze()
+
+        # tokenize all prompt sections once, so prompt construction only has to read the cached token counts
+        PromptBuilder(project_name).prefill_token_counts()
+
+
+def update_db_from_json(project_name: str, source_files: dict, removed_classes: set, parsed_classes: set,
+                        relinked_classes: set):
+    """
+    Applies the changes of an incremental parse to the existing database of a project instead of rebuilding it.
+    Method ids of unchanged methods stay the same, new methods get new ids.
+    :param project_name: name of the project in /build/class_parser
+    :param source_files: state of the parsed source files (see ProjectManifest.files)
+    :param removed_classes: identifiers of classes that were changed or deleted since the last parse
+    :param parsed_classes: identifiers of classes that were (re-)parsed and have to be inserted
+    :param relinked_classes: identifiers of unchanged classes whose relations can point to changed classes and have
+    to be recomputed
+    :return:
+    """
+    db = DataBase(project_name)
+    db.create_tables()
+    class_files = open_class_files(project_name)
+
+    # only class folders of the current parse, the folder of a deleted class does not exist anymore
+    existing_class_names = set(class_files.class_names()) if class_files is not None else set()
+    parsed_class_names = [class_name for class_name in parsed_classes if class_name in existing_class_names]
+    relinked_class_names = [class_name for class_name in relinked_classes if class_name not in parsed_classes]
+
+    with db.bulk_load():
+        db.delete_classes(sorted(removed_classes | parsed_classes))
+        db.delete_relations_of_methods(db.get_method_ids_of_classes(relinked_class_names))
+
+        if class_files is not None:
+            insert_classes_from_json(db, project_name, parsed_class_names, class_files)
+            insert_relations_from_json(db, project_name, parsed_class_names + relinked_class_names, class_files)
+        # the byte offsets are only valid for the parsed versions of the files, which the token counts are read from
+        db.replace_source_files(source_files)
+    if class_files is not None:
+        class_files.close()
+
+    PromptBuilder(project_name).prefill_token_counts()
+
+
+def insert_classes_from_json(db: DataBase, project_name: str, class_names: list, class_files=None):
+    """
+    Inserts the classes, class variables, methods and method parameters of the given class folders.
+    :param db: database to write to
+    :param project_name: name of the project in /build/class_parser
+    :param class_names: names of the class folders in /build/class_parser/[project_name]
+    :param class_files: JsonClassFiles or BinaryClassStore to read the class folders from, the json files by default
+    :return:
+    """
+    if class_files is None:
+        class_files = JsonClassFiles(project_name)
+    n_classes = len(class_names)
+    curr_class = 1
+
+    # method ids are assigned here instead of reading back the AUTOINCREMENT id after every insert
+    next_method_id = db.get_max_method_id() + 1
+    rows = new_insert_batch()
+
+    # loop over all classes
+    for class_name in class_names:
+        print_progress_bar(curr_class, n_classes,
+                           prefix="Adding classes of {} to database".format(project_name),
+                           display_100_percent=True)
+        curr_class += 1
+        class_folder = class_files.read(class_name)
+        if class_folder is None:
+            continue
+        class_list, method_list = class_folder
+        next_method_id = add_class_rows(rows, project_name, class_list, method_list, next_method_id)
+
+        if len(rows["methods"]) >= INSERT_BATCH_SIZE:
+            write_insert_batch(db, rows)
+            rows = new_insert_batch()
+
+    write_insert_batch(db, rows)
+
+
+def insert_relations_from_json(db: DataBase, project_name: str, class_names: list, class_files=None):
+    """
+    Inserts the relations of the methods of the given class folders to other methods and classes of the project.
+    The methods and classes of the whole project have to be inserted beforehand.
+    :param db: database to write to
+    :param project_name: name of the project in /build/class_parser
+    :param class_names: names of the class folders in /build/class_parser/[project_name]
+    :param class_files: JsonClassFiles or BinaryClassStore to read the class folders from, the json files by default
+    :return:
+    """
+    if class_files is None:
+        class_files = JsonClassFiles(project_name)
+    n_classes = len(class_names)
+    curr_class = 1
+    rows = new_insert_batch()
+    # the methods and classes of the project are looked up in memory instead of querying them for every call site
+    symbol_table = SymbolTable.from_database(db)
+
+    for class_name in class_names:
+        print_progress_bar(curr_class, n_classes,
+                           prefix="Adding intra-project relations of {} to database".format(project_name),
+                           display_100_percent=True)
+        curr_class += 1
+        class_folder = class_files.read(class_name)
+        if class_folder is None:
+            continue
+        class_list, method_list = class_folder
+        add_relation_rows(rows, class_list, method_list, symbol_table)
+
+        if len(rows["related_methods"]) + len(rows["related_classes"]) >= INSERT_BATCH_SIZE:
+            write_insert_batch(db, rows)
+            rows = new_insert_batch()
+
+    write_insert_batch(db, rows)
+
+
+def add_class_rows(rows: dict, project_name: str, class_list: list, method_list: list, next_method_id: int,
+                   symbol_table: SymbolTable = None):
+    """
+    Adds the rows of the classes, class variables, methods and method parameters of a class folder to a batch.
+    :param rows: batch of rows created by new_insert_batch
+    :param project_name: name of the project
+    :param class_list: content of the class.json file of the class folder
+    :param method_list: content of the methods.json file of the class folder
+    :param next_method_id: id of the first method added to the batch
+    :param symbol_table: if given, the classes and methods are added to the symbol table as well
+    :return: Id of the next method
+    """
+    for class_dict in class_list:
+        if symbol_table is not None:
+            symbol_table.add_class(class_dict["class_identifier"])
+        rows["classes"].append((class_dict["class_identifier"],
+                                project_name,
+                                class_dict["class_modifier"],
+                                class_dict["class_super_interfaces"],
+                                *class_dict["class_span"],
+                                class_dict["class_header_span"][1] if class_dict["class_header_span"] else None,
+                                class_dict["imports"],
+                                class_dict["package"],
+                                class_dict["filepath"]))
+
+        for var in class_dict["class_variable_declarations"]:
+            rows["class_variables"].append((class_dict["class_identifier"],
+                                            var["variable_identifier"],
+                                            var["variable_type"]))
+
+        for method_dict in method_list:
+            # methods of class, the texts are read from the source file when needed
+            comment_span = method_dict["method_comment_span"] or [None, None]
+            rows["methods"].append((next_method_id,
+                                    method_dict["method_identifier"],
+                                    class_dict["class_identifier"],
+                                    *method_dict["method_span"],
+                                    *comment_span))
+
+            # parameters of method
+            for key in method_dict["method_parameter_types"]:
+                rows["method_parameters"].append((next_method_id,
+                                                  method_dict["method_parameter_types"][key],
+                                                  key))
+            if symbol_table is not None:
+                symbol_table.add_method(next_method_id, method_dict["method_identifier"], class_dict["class_identifier"],
+                                        method_dict["method_parameter_types"].values())
+            next_method_id += 1
+
+    return next_method_id
+
+
+def add_relation_rows(rows: dict, class_list: list, method_list: list, symbol_table: SymbolTable):
+    """
+    Adds the relations of the methods of a class folder to other methods and classes of the project to a batch.
+    :param rows: batch of rows created by new_insert_batch
+    :param class_list: content of the class.json file of the class folder
+    :param method_list: content of the methods.json file of the class folder
+    :param symbol_table: symbol table containing all classes and methods of the project
+    :return:
+    """
+    for class_dict in class_list:
+        for method_index, method_dict in enumerate(method_list):
+            # the methods of a class are inserted in the order of the method list, so overloads are told apart
+            source_method_id = symbol_table.method_id_of_class(class_dict["class_identifier"], method_index)
+            if source_method_id is None:
+                continue
+            # intra-project relations
+            for related_method in method_dict["related_methods"]:
+                target_method_id = symbol_table.resolve_method(related_method["method_name"],
+                                                               related_method["method_class"],
+                                                               related_method["argument_types"])
+                if target_method_id is not None:
+                    # relation between methods
+                    rows["related_methods"].append((source_method_id, target_method_id))
+
+            # relation between methods and classes
+            for key in method_dict["method_parameter_types"]:
+                # check if class exists in database
+                class_id = symbol_table.resolve_class(method_dict["method_parameter_types"][key])
+                if class_id is not None:
+                    rows["related_classes"].append((source_method_id, class_id))
+
+
+class JsonClassFiles:
+    """
+    Read access to the json files of a project in /build/class_parser/[project_name] (same interface as
+    BinaryClassStore).
+    """
+
+    def __init__(self, project_name: str):
+        """
+        :param project_name: name of the project in /build/class_parser
+        """
+        self.project_name = project_name
+
+    def class_names(self):
+        """
+        :return: Names of the class folders of the project
+        """
+        if not os.path.isdir("./build/class_parser/" + self.project_name):
+            return []
+        return os.listdir("./build/class_parser/" + self.project_name)
+
+    def read(self, class_name: str):
+        """
+        :param class_name: name of the class folder
+        :return: Tuple of the class list and the method list or None if one of the files does not exist
+        """
+        return read_class_files(self.project_name, class_name)
+
+    def close(self):
+        pass
+
+
+def open_class_files(project_name: str):
+    """
+    Opens the parser output of a project, the binary class store if it exists, the json files otherwise.
+    :param project_name: name of the project
+    :return: BinaryClassStore or JsonClassFiles, None if the project was not parsed
+    """
+    if os.path.exists(class_store_path(project_name)):
+        return BinaryClassStore(project_name)
+    if os.path.isdir("./build/class_parser/" + project_name):
+        return JsonClassFiles(project_name)
+    return None
+
+
+def read_class_files(project_name: str, class_name: str):
+    """
+    Reads the class.json and methods.json file of a class folder.
+    :param project_name: name of the project in /build/class_parser
+    :param class_name: name of the class folder
+    :return: Tuple of the class list and the method list or None if one of the files does not exist
+    """
+    # check if class file exists
+    if os.path.exists("./build/class_parser/" + project_name + "/" + class_name + "/class.json") \
+            and os.path.exists("./build/class_parser/" + project_name + "/" + class_name + "/methods.json"):
+        class_file = open("./build/class_parser/" + project_name + "/" + class_name + "/class.json", "r")
+        method_file = open("./build/class_parser/" + project_name + "/" + class_name + "/methods.json", "r")
+        with class_file:
+            class_list = json.load(class_file)
+
+        with method_file:
+            method_list = json.load(method_file)
+
+        return class_list, method_list
+    return None
+
+
+def new_insert_batch():
+    """
+    Creates an empty batch of rows to insert into the database.
+    :return: Dictionary with a list of rows for every table
+    """
+    return {
+        "classes": [],
+        "class_variables": [],
+        "methods": [],
+        "method_parameters": [],
+        "related_methods": [],
+        "related_classes": []
+    }
+
+
+def write_insert_batch(db: DataBase, rows: dict):
+    """
+    Writes a batch of rows to the database using one executemany per table.
+    :param db: database to write to
+    :param rows: batch of rows created by new_insert_batch
+    :return:
+    """
+    db.insert_classes(rows["classes"])
+    db.insert_class_variables(rows["class_variables"])
+    db.insert_methods(rows["methods"])
+    db.insert_method_parameters(rows["method_parameters"])
+    db.insert_related_methods_of_method(rows["related_methods"])
+    db.insert_related_classes_of_method(rows["related_classes"])
@@ -2,10 +2,18 @@ from langchain.llms import OpenAI
 import os
 import warnings
 from utils import measure_execution_time
+import random
 import requests
+from requests.adapters import HTTPAdapter
+import threading
+import time
 from dotenv import load_dotenv
 import configparser
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
+import queue
 import logging
+from typing import Tuple
 
 
 class LocalServerLlm(OpenAI):
@@ -14,6 +22,9 @@ class LocalServerLlm(OpenAI):
     the llama-cpp-python project.
     """
 
+    # connect and read timeout of streamed requests in seconds (see generate_until)
+    stream_timeout: Tuple[float, float] = (10.0, 120.0)
+
     def __init__(self):
 
         config = configparser.ConfigParser()
@@ -37,38 +48,318 @@ class LocalServerLlm(OpenAI):
             presence_penalty=0.0,
             n=1,
             best_of=3,
-            batch_size=1,
+            # amount of prompts sent in one request by generate (see BatchingLlm)
+            batch_size=config.getint('INFERENCE', 'LOCAL_WEB_SERVER_MAX_BATCH_SIZE', fallback=1),
             logit_bias={},
             streaming=False,
+            stream_timeout=(config.getfloat('INFERENCE', 'LOCAL_WEB_SERVER_CONNECT_TIMEOUT', fallback=10.0),
+                            config.getfloat('INFERENCE', 'LOCAL_WEB_SERVER_READ_TIMEOUT', fallback=120.0)),
         )
 
     @measure_execution_time(">> LLM query")
     def __call__(self, *args, **kwargs):
         return super().__call__(*args, **kwargs)
 
+    @measure_execution_time(">> LLM query")
+    def generate_until(self, prompt, is_complete):
+        """
+        Streams the completion of a prompt from the local web server and stops the generation once the answer is
+        complete. Streamed requests are sent without best_of, which the OpenAI API does not allow with streaming.
+        The request fails if the server does not accept the connection or sends no token for the connect or read
+        timeout of stream_timeout (LOCAL_WEB_SERVER_CONNECT_TIMEOUT and LOCAL_WEB_SERVER_READ_TIMEOUT).
+        :param prompt: prompt to complete
+        :param is_complete: function called with the completion received so far (see read_event_stream)
+        :return: Completion received until is_complete returned True or the generation ended
+        """
+        parameters = self.completion_parameters(stream=True)
+        logging.info(f"LLM streaming request with parameters: {parameters}")
+        response = requests.post(f"{self.openai_api_base}/completions", stream=True, timeout=self.stream_timeout,
+                                 json={**parameters, "prompt": prompt, "stream": True})
+        response.raise_for_status()
+        return read_event_stream(response, lambda event: event["choices"][0].get("text") or "", is_complete)
+
+    def completion_parameters(self, stream: bool = False):
+        """
+        :param stream: if the parameters of a streamed request (see generate_until) should be returned
+        :return: Parameters of the completion requests sent to the local web server
+        """
+        parameters = {"model": self.model_name, "temperature": self.temperature, "top_p": self.top_p,
+                      "max_tokens": self.max_tokens, "presence_penalty": self.presence_penalty}
+        if not stream:
+            parameters["best_of"] = self.best_of
+        return parameters
+
+    def cache_parameters(self, stream: bool = False):
+        # parameters changing the completions, part of the key of the cached completions (see llm_cache.py)
+        return {"endpoint": self.openai_api_base, **self.completion_parameters(stream)}
+
+
+def read_event_stream(response, token_text, is_complete):
+    """
+    Reads a streamed completion (server-sent events) until is_complete returns True or the stream ends. Closing the
+    response afterwards makes the server stop the generation.
+    :param response: requests response opened with stream=True
+    :param token_text: function returning the text of an event (parsed json), raises ValueError for error events
+    :param is_complete: function called with the text received so far whenever a token contains a backtick (only a
+    closing code fence can complete an answer)
+    :return: Text received until then
+    """
+    text = ""
+    response.encoding = "utf-8"
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line.startswith("data:") or line[len("data:"):].strip() == "[DONE]":
+                continue
+            token = token_text(json.loads(line[len("data:"):]))
+            text += token
+            if "`" in token and is_complete(text):
+                break
+    finally:
+        response.close()
+    return text
+
+
+class BatchingLlm:
+    """
+    Collects the prompts of several threads (e.g. of the LLM stage of the pipeline) and sends them to the local web
+    server together, so the server always has work. The answers are returned to the waiting threads.
+    Prompts are either sent as concurrent requests (at most LOCAL_WEB_SERVER_MAX_BATCH_SIZE at the same time) or,
+    with LOCAL_WEB_SERVER_BATCH_REQUESTS, as one request with a list of prompts. In that case, the prompts arriving
+    within LOCAL_WEB_SERVER_BATCH_WINDOW seconds are collected and the next batch is collected and sent while the
+    server answers the previous one (at most LOCAL_WEB_SERVER_MAX_BATCH_SIZE requests at the same time).
+    """
+
+    def __init__(self, llm: LocalServerLlm):
+        """
+        :param llm: client of the local web server
+        """
+        config = configparser.ConfigParser()
+        config.read('config.ini')
+        self.max_batch_size = config.getint('INFERENCE', 'LOCAL_WEB_SERVER_MAX_BATCH_SIZE', fallback=1)
+        self.batch_window = config.getfloat('INFERENCE', 'LOCAL_WEB_SERVER_BATCH_WINDOW', fallback=0.05)
+        # the llama-cpp-python server only answers the first prompt of a request
+        self.batch_requests = config.getboolean('INFERENCE', 'LOCAL_WEB_SERVER_BATCH_REQUESTS', fallback=False)
+
+        self.llm = llm
+        self.prompts = queue.Queue()
+        self.request_executor = ThreadPoolExecutor(max_workers=self.max_batch_size,
+                                                   thread_name_prefix="llm_request")
+        self.dispatcher = threading.Thread(target=self._dispatch, name="llm_batching", daemon=True)
+        self.dispatcher.start()
+
+    def __call__(self, prompt):
+        return self.generate_until(prompt, None)
+
+    def cache_parameters(self, stream: bool = False):
+        return self.llm.cache_parameters(stream)
+
+    def generate_until(self, prompt, is_complete):
+        """
+        :param prompt: prompt to complete
+        :param is_complete: if set, the completion is streamed and stopped once is_complete returns True (see
+        LocalServerLlm.generate_until), not used for requests with several prompts
+        :return: Completion of the prompt
+        """
+        answer = Future()
+        self.prompts.put((prompt, is_complete, answer))
+        return answer.result()
+
+    def _dispatch(self):
+        while True:
+            batch = self._collect_batch()
+            if self.batch_requests:
+                self.request_executor.submit(self._send_batch, batch)
+            else:
+                for prompt, is_complete, answer in batch:
+                    self.request_executor.submit(self._send, prompt, is_complete, answer)
+
+    def _collect_batch(self):
+        batch = [self.prompts.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            try:
+                if self.batch_requests:
+                    batch.append(self.prompts.get(timeout=max(0.0, deadline - time.monotonic())))
+                else:
+                    # concurrent requests do not have to wait for each other
+                    batch.append(self.prompts.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, prompt, is_complete, answer):
+        try:
+            if is_complete is not None:
+                answer.set_result(self.llm.generate_until(prompt, is_complete))
+            else:
+                answer.set_result(self.llm(prompt))
+        except Exception as e:
+            answer.set_exception(e)
+
+    def _send_batch(self, batch):
+        start = time.monotonic()
+        try:
+            result = self.llm.generate([prompt for prompt, _, _ in batch])
+        except Exception as e:
+            for _, _, answer in batch:
+                answer.set_exception(e)
+            return
+        print(f">> LLM query of {len(batch)} prompts took: {round(time.monotonic() - start, 1)} seconds")
+        for (_, _, answer), generations in zip(batch, result.generations):
+            answer.set_result(generations[0].text)
+
+
+class HuggingFaceLlmError(Exception):
+    pass
+
+
+class RequestMetrics:
+    """
+    Latencies (in seconds, including retries and waiting) and attempts of the requests to an inference API.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.attempts = []
+        self.failed_requests = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency: float, attempts: int, failed: bool = False):
+        with self.lock:
+            self.latencies.append(latency)
+            self.attempts.append(attempts)
+            if failed:
+                self.failed_requests += 1
+
+    def summary(self):
+        """
+        :return: Dictionary with the amount of requests, failed requests and retries and the mean, median, 95th
+        percentile and maximum latency in seconds
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+            if not latencies:
+                return {"requests": 0, "failed_requests": 0, "retries": 0}
+            return {
+                "requests": len(latencies),
+                "failed_requests": self.failed_requests,
+                "retries": sum(self.attempts) - len(self.attempts),
+                "mean_latency": round(sum(latencies) / len(latencies), 2),
+                "median_latency": round(latencies[len(latencies) // 2], 2),
+                "p95_latency": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+                "max_latency": round(latencies[-1], 2),
+            }
+
 
 class HuggingFaceLlm:
+    """
+    Client of the HuggingFace inference API. The connections are kept alive and shared by all threads using the
+    client, at most HUGGINGFACE_MAX_CONCURRENT_REQUESTS requests are sent at the same time. Errors (e.g. while the
+    model is loading) are retried with exponential backoff and jitter, waiting at least the estimated_time the API
+    reports for loading the model.
+    """
+
+    # status codes of responses that are retried (rate limits, model loading and other server errors)
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
     def __init__(self):
         self.config = configparser.ConfigParser()
         self.config.read('config.ini')
         self.MODEL_MAX_OUTPUT_TOKENS = self.config.getint('INFERENCE', 'MODEL_MAX_OUTPUT_TOKENS')
         self.API_URL = self.config.get('INFERENCE', 'HUGGINGFACE_INFERENCE_URL')
+        self.max_concurrent_requests = self.config.getint('INFERENCE', 'HUGGINGFACE_MAX_CONCURRENT_REQUESTS',
+                                                          fallback=4)
+        self.max_retries = self.config.getint('INFERENCE', 'HUGGINGFACE_MAX_RETRIES', fallback=8)
+        self.backoff_base = self.config.getfloat('INFERENCE', 'HUGGINGFACE_BACKOFF_BASE', fallback=1.0)
+        self.backoff_max = self.config.getfloat('INFERENCE', 'HUGGINGFACE_BACKOFF_MAX', fallback=60.0)
+        # seconds to wait for a response (generation takes up to max_time seconds, see __call__)
+        self.request_timeout = self.config.getfloat('INFERENCE', 'HUGGINGFACE_REQUEST_TIMEOUT', fallback=150.0)
 
         load_dotenv()
         self.headers = {"Authorization": f"Bearer {os.getenv('HF_API_KEY')}"}
 
-    def query(self, payload):
-        response = requests.post(self.API_URL, headers=self.headers, json=payload).json()
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrent_requests)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.request_slots = threading.BoundedSemaphore(self.max_concurrent_requests)
+        self.metrics = RequestMetrics()
 
-        while type(response) == dict and "error" in response.keys():
-            response = requests.post(self.API_URL, headers=self.headers, json=payload).json()
+    def query(self, payload, is_complete=None):
+        """
+        Sends a request to the inference API, retrying errors up to HUGGINGFACE_MAX_RETRIES times.
+        :param payload: json payload of the request
+        :param is_complete: if set, the response is streamed until is_complete returns True (see read_event_stream)
+        :return: json response, the streamed text if is_complete is set
+        """
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            result, error, wait_time = self._send(payload, is_complete)
+            if error is None:
+                self.metrics.record(time.monotonic() - start, attempt)
+                logging.info(f"LLM request took {round(time.monotonic() - start, 2)} seconds ({attempt} attempts)")
+                return result
+            if attempt > self.max_retries:
+                self.metrics.record(time.monotonic() - start, attempt, failed=True)
+                raise HuggingFaceLlmError(f"Inference API request failed after {attempt} attempts: {error}")
 
-        return response
+            # full jitter, so clients waiting for the same model do not retry at the same time
+            backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+            wait_time = max(backoff, min(wait_time or 0, self.backoff_max))
+            logging.info(f"LLM request failed ({error}), retrying in {round(wait_time, 1)} seconds")
+            time.sleep(wait_time)
 
-    @measure_execution_time(">> LLM query")
-    def __call__(self, message):
-        result = self.query({
+    def _send(self, payload, is_complete=None):
+        """
+        :return: Tuple of the json response (or streamed text), a description of the error (None if the request
+        succeeded) and the seconds the API asks to wait before retrying (None if unknown)
+        """
+        with self.request_slots:
+            try:
+                response = self.session.post(self.API_URL, json=payload, timeout=self.request_timeout,
+                                             stream=is_complete is not None)
+                if response.ok and is_complete is not None:
+                    return read_event_stream(response, self._token_text, is_complete), None, None
+            except (requests.RequestException, ValueError) as e:
+                # connection errors, timeouts and errors while streaming
+                return None, str(e), None
+        try:
+            result = response.json()
+        except ValueError:
+            result = None
+
+        if response.ok and not (isinstance(result, dict) and "error" in result):
+            return result, None, None
+
+        wait_time = None
+        if isinstance(result, dict) and isinstance(result.get("estimated_time"), (int, float)):
+            # the model is loading
+            wait_time = float(result["estimated_time"])
+        elif response.headers.get("Retry-After", "").isdigit():
+            wait_time = float(response.headers["Retry-After"])
+        error = f"{response.status_code}: {result.get('error') if isinstance(result, dict) else response.text[:200]}"
+        if not response.ok and response.status_code not in self.RETRY_STATUS_CODES:
+            # e.g. an invalid API key or payload
+            raise HuggingFaceLlmError(f"Inference API request failed with {error}")
+        return result, error, wait_time
+
+    @staticmethod
+    def _token_text(event):
+        if "error" in event:
+            raise ValueError(event["error"])
+        token = event.get("token") or {}
+        return "" if token.get("special") else token.get("text", "")
+
+    def cache_parameters(self, stream: bool = False):
+        # parameters changing the completions, part of the key of the cached completions (see llm_cache.py)
+        # (streamed requests use the same parameters)
+        return {"endpoint": self.API_URL, **self._payload("")["parameters"]}
+
+    def _payload(self, message):
+        return {
             "inputs": message,
             "parameters": {
                 "max_new_tokens": self.MODEL_MAX_OUTPUT_TOKENS,
@@ -80,7 +371,23 @@ class HuggingFaceLlm:
                 "use_cache": False,
                 "wait_for_model": True,
             }
-        })
+        }
+
+    @measure_execution_time(">> LLM query")
+    def generate_until(self, message, is_complete):
+        """
+        Streams the answer to a prompt and stops the generation once the answer is complete.
+        :param message: prompt
+        :param is_complete: function called with the answer received so far (see read_event_stream)
+        :return: Answer received until is_complete returned True or the generation ended
+        """
+        payload = self._payload(message)
+        payload["stream"] = True
+        return self.query(payload, is_complete)
+
+    @measure_execution_time(">> LLM query")
+    def __call__(self, message):
+        result = self.query(self._payload(message))
         if result:
             logging.info(f"LLM response: {result}")
             return result[0]["generated_text"]
\ No newline at end of file
@@ -0,0 +1,149 @@
+from threading import Lock
+import configparser
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+LLM_CACHE_PATH = "./build/llm_cache/completions.db"
+
+
+class LlmCache:
+    """
+    Completions of the LLM stored in a SQLite database, keyed by a hash of the prompt and the parameters of the LLM
+    (see key). The least recently used completions are removed once the completions exceed max_size_mb.
+    The cache can be shared by several threads and processes.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_size_mb: float = 512):
+        """
+        :param path: path of the database file (created if it does not exist)
+        :param max_size_mb: maximum size of the stored completions in megabytes
+        """
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS completions (
+                                key TEXT NOT NULL,
+                                sample INTEGER NOT NULL,
+                                completion TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                lastUsed REAL NOT NULL,
+                                PRIMARY KEY (key, sample))""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS completions_lastUsed ON completions (lastUsed)")
+        self.conn.commit()
+
+    @staticmethod
+    def key(parameters: dict, prompt: str):
+        """
+        :param parameters: parameters of the LLM that change its completions (model, endpoint, sampling parameters)
+        :param prompt: prompt of the completion
+        :return: Hex digest of the SHA-256 hash of the parameters and the prompt
+        """
+        return hashlib.sha256(json.dumps({"parameters": parameters, "prompt": prompt},
+                                         sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key: str, sample: int):
+        """
+        :param key: key of the prompt (see key)
+        :param sample: index of the completion of the prompt
+        :return: The stored completion or None
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT completion FROM completions WHERE key = ? AND sample = ?",
+                                    (key, sample)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE completions SET lastUsed = ? WHERE key = ? AND sample = ?",
+                              (time.time(), key, sample))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key: str, sample: int, completion: str):
+        """
+        Stores a completion and removes the least recently used completions if the cache is too large.
+        :param key: key of the prompt (see key)
+        :param sample: index of the completion of the prompt
+        :param completion: completion of the LLM
+        """
+        size = len(completion.encode("utf-8"))
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO completions (key, sample, completion, size, lastUsed) "
+                              "VALUES (?, ?, ?, ?, ?)", (key, sample, completion, size, time.time()))
+            self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        total_size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        # remove completions until the cache is filled to 90%, so the next completions do not evict again
+        excess = total_size - int(self.max_size * 0.9)
+        removed = 0
+        for key, sample, size in self.conn.execute("SELECT key, sample, size FROM completions "
+                                                   "ORDER BY lastUsed").fetchall():
+            if removed >= excess:
+                break
+            self.conn.execute("DELETE FROM completions WHERE key = ? AND sample = ?", (key, sample))
+            removed += size
+
+    def close(self):
+        self.conn.close()
+
+
+class CachingLlm:
+    """
+    Returns stored completions for prompts the LLM already completed with the same parameters in a run with the same
+    run id (i.e. when a run is repeated with the same --run_id or resumed after a crash) and stores new completions.
+    Runs with a different run id never get the completions of other runs.
+    The completions of a prompt are numbered by how often the prompt was sent in this run, so the runs of --runs
+    still get different completions (and a repeated run gets the same completions in the same order).
+    """
+
+    def __init__(self, llm, run_id, cache: LlmCache = None):
+        """
+        :param llm: LLM client with cache_parameters (HuggingFaceLlm, LocalServerLlm or BatchingLlm)
+        :param run_id: ID of the run, part of the key of the completions
+        :param cache: cache to use, created with the size of LLM_CACHE_MAX_SIZE_MB if None
+        """
+        if cache is None:
+            config = configparser.ConfigParser()
+            config.read('config.ini')
+            cache = LlmCache(max_size_mb=config.getfloat('INFERENCE', 'LLM_CACHE_MAX_SIZE_MB', fallback=512))
+        self.llm = llm
+        self.cache = cache
+        # streamed completions end early and may be requested with other parameters, so they are stored separately
+        self.parameters = {stream: dict(llm.cache_parameters(stream), run_id=str(run_id), stream=stream)
+                           for stream in (False, True)}
+        # latencies of the requests of the LLM client (if it records them)
+        self.metrics = getattr(llm, "metrics", None)
+        self.samples = {}
+        self.lock = Lock()
+
+    def __call__(self, prompt):
+        return self._complete(prompt, None)
+
+    def generate_until(self, prompt, is_complete):
+        return self._complete(prompt, is_complete)
+
+    def _complete(self, prompt, is_complete):
+        key = self.cache.key(self.parameters[is_complete is not None], prompt)
+        with self.lock:
+            sample = self.samples.get(key, 0)
+            self.samples[key] = sample + 1
+
+        completion = self.cache.get(key, sample)
+        if completion is not None:
+            print(">> LLM answer loaded from cache")
+            return completion
+
+        if is_complete is not None:
+            completion = self.llm.generate_until(prompt, is_complete)
+        else:
+            completion = self.llm(prompt)
+        if completion:
+            self.cache.put(key, sample, completion)
+        return completion
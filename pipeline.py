@@ -0,0 +1,210 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from generate_tests import TestGenerator, METHOD_CONTEXT_PREFETCH_SIZE, METHOD_TIMEOUT
+import asyncio
+import configparser
+
+
+class TestGenerationPipeline:
+    """
+    Generates tests for many methods at once, so the LLM requests of some methods overlap with the compilation and
+    execution of the tests of others. The generation of a test is split into stages, every stage has its own
+    threads and therefore its own concurrency limit:
+    - prompt: constructs the initial and repair prompts and writes (and renames) the generated tests. The prompt
+      builder shares the SQLite connection of the test generator, so this stage always runs on one thread.
+    - llm: queries the LLM (LLM_CONCURRENCY)
+    - compile: compiles the tests (COMPILE_CONCURRENCY)
+    - execute: runs the tests (EXECUTE_CONCURRENCY)
+    The steps and the logged events of a method are the same as in TestGenerator.generate_test_for_method.
+    A method that exceeds METHOD_TIMEOUT stays in flight until the stage it is waiting for has finished.
+    """
+
+    def __init__(self, project_name, run_id, use_llm_cache=True):
+        """
+        :param project_name: name of the project to generate tests for
+        :param run_id: ID of the run which is used to name the tests and the log files
+        :param use_llm_cache: if False, the LLM is always queried, even if LLM_CACHE is set
+        """
+        self.project_name = project_name
+        self.run_id = run_id
+        self.use_llm_cache = use_llm_cache
+
+        self.config = configparser.ConfigParser()
+        self.config.read('config.ini')
+        self.max_methods_in_flight = self.config.getint('PIPELINE', 'MAX_METHODS_IN_FLIGHT', fallback=16)
+        self.stage_concurrency = {
+            "prompt": 1,
+            "llm": self.config.getint('PIPELINE', 'LLM_CONCURRENCY', fallback=4),
+            "compile": self.config.getint('PIPELINE', 'COMPILE_CONCURRENCY', fallback=2),
+            "execute": self.config.getint('PIPELINE', 'EXECUTE_CONCURRENCY', fallback=2),
+        }
+
+        self.executors = {}
+        self.generator = None
+        # task generating the test of a method -> future of the stage the task is currently waiting for
+        self.stage_futures = {}
+
+    def generate_tests(self, method_ids=None, runs_per_method=1, compilation_repair_rounds=1,
+                       execution_repair_rounds=1):
+        """
+        Generates tests for the methods of the project (blocks until all tests are generated)
+        :param method_ids: range (or list) of method ids, all methods of the project if None
+        :param runs_per_method: Trys per method
+        :param compilation_repair_rounds: Number of repair rounds for compilation errors
+        :param execution_repair_rounds: Number of repair rounds for execution errors
+        :return:
+        """
+        asyncio.run(self.run(method_ids, runs_per_method, compilation_repair_rounds, execution_repair_rounds))
+
+    async def run(self, method_ids=None, runs_per_method=1, compilation_repair_rounds=1, execution_repair_rounds=1):
+        self.executors = {stage: ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"pipeline_{stage}")
+                          for stage, concurrency in self.stage_concurrency.items()}
+        try:
+            # the database connections of the generator can only be used by the thread that created them
+            self.generator = await self.run_stage("prompt", TestGenerator, self.project_name, self.run_id, True,
+                                                  self.use_llm_cache)
+            if method_ids is None:
+                # method ids can have gaps after incremental updates of the database
+                method_ids = await self.run_stage("prompt", self.generator.db.get_method_ids)
+            method_ids = list(method_ids)
+
+            # a method is only generated once at a time, as the runs of a method write to the same files
+            for run in range(1, runs_per_method + 1):
+                await self.run_wave(method_ids, compilation_repair_rounds, execution_repair_rounds)
+            self.generator.log_llm_metrics()
+        finally:
+            for executor in self.executors.values():
+                executor.shutdown(wait=True)
+            self.executors = {}
+
+    async def run_wave(self, method_ids, compilation_repair_rounds, execution_repair_rounds):
+        methods_in_flight = asyncio.Semaphore(self.max_methods_in_flight)
+        in_flight_method_ids = set()
+        tasks = []
+
+        def finish_method(method_id, task):
+            in_flight_method_ids.discard(method_id)
+            methods_in_flight.release()
+
+        for start in range(0, len(method_ids), METHOD_CONTEXT_PREFETCH_SIZE):
+            # fetch the contexts of the next methods at once instead of querying them method by method
+            method_id_chunk = method_ids[start:start + METHOD_CONTEXT_PREFETCH_SIZE]
+            await self.run_stage("prompt", self.generator.prompt_constructor.prefetch_method_contexts,
+                                 method_id_chunk, list(in_flight_method_ids))
+            for method_id in method_id_chunk:
+                await methods_in_flight.acquire()
+                in_flight_method_ids.add(int(method_id))
+                task = asyncio.create_task(self.generate_test_for_method(method_id, compilation_repair_rounds,
+                                                                         execution_repair_rounds))
+                task.add_done_callback(partial(finish_method, int(method_id)))
+                tasks.append(task)
+        await asyncio.gather(*tasks)
+
+    async def run_stage(self, stage, function, *args):
+        """
+        Runs a function on the threads of a stage.
+        :param stage: "prompt", "llm", "compile" or "execute"
+        :param function: function to run
+        :param args: arguments of the function
+        :return: Return value of the function
+        """
+        future = self.executors[stage].submit(partial(function, *args))
+        task = asyncio.current_task()
+        if task in self.stage_futures:
+            self.stage_futures[task] = future
+        return await asyncio.wrap_future(future)
+
+    async def generate_test_for_method(self, method_id, compilation_repair_rounds=1, execution_repair_rounds=1):
+        task = asyncio.create_task(self.generate_and_repair_test(method_id, compilation_repair_rounds,
+                                                                 execution_repair_rounds))
+        self.stage_futures[task] = None
+        try:
+            done, _ = await asyncio.wait({task}, timeout=METHOD_TIMEOUT)
+            if not done:
+                # cancelling the task only stops stages that have not started yet, a running stage can not be
+                # interrupted. The method stays in flight until its stage is done, so it is not started again in the
+                # next wave while the stage still writes its files.
+                task.cancel()
+                await asyncio.wait({task})
+                stage_future = self.stage_futures[task]
+                if stage_future is not None:
+                    await asyncio.wait({asyncio.wrap_future(stage_future)})
+                self.generator.log_generation_timeout(method_id, asyncio.TimeoutError(
+                    f"Test generation took longer than {METHOD_TIMEOUT} seconds"))
+            elif task.exception() is not None:
+                self.generator.log_generation_exception(method_id, task.exception())
+        finally:
+            del self.stage_futures[task]
+
+    async def generate_and_repair_test(self, method_id, compilation_repair_rounds, execution_repair_rounds):
+        # same steps as TestGenerator.generate_test_for_method and TestGenerator.repair_and_execute_test
+        generator = self.generator
+
+        prompt = await self.run_stage("prompt", generator.construct_initial_prompt, method_id)
+        if not prompt:
+            return
+        answer = await self.run_stage("llm", generator.get_answer, prompt)
+        if not answer:
+            generator.log_answer_extraction_error(method_id)
+            return
+        generated_test = await self.run_stage("prompt", generator.write_initial_test, method_id, prompt, answer)
+        if not generated_test:
+            return
+        filepaths, new_class_name = generated_test
+
+        print(f"> Wrote test for method {method_id} to file, compiling...")
+        compilation_result_code, compilation_output = await self.run_stage(
+            "compile", generator.compile_test, method_id, filepaths, new_class_name)
+
+        # run repair rounds until compilation succeeds or the maximum number of repair rounds is reached
+        current_repair_round = 1
+        while compilation_result_code != 0 and current_repair_round <= compilation_repair_rounds:
+            if not await self.repair_test(generator.construct_compilation_repair_prompt, filepaths,
+                                          compilation_output, new_class_name):
+                generator.log_repair_prompt_error(method_id, "Compilation", current_repair_round)
+                return
+            compilation_result_code, compilation_output = await self.run_stage(
+                "compile", generator.compile_test, method_id, filepaths, new_class_name)
+            current_repair_round += 1
+
+        if not await self.run_stage("prompt", generator.finish_compilation, method_id, filepaths, new_class_name,
+                                    (compilation_result_code, compilation_output), current_repair_round - 1):
+            return
+
+        execution_result_code, execution_output = await self.run_stage(
+            "execute", generator.execute_test, method_id, filepaths, new_class_name)
+
+        current_execution_repair_round = 1
+        while execution_result_code != 0 and current_execution_repair_round <= execution_repair_rounds:
+            if not await self.repair_test(generator.construct_execution_repair_prompt, filepaths,
+                                          execution_output, new_class_name):
+                generator.log_repair_prompt_error(method_id, "Execution", current_execution_repair_round)
+                return
+
+            compilation_result_code, compilation_output = await self.run_stage(
+                "compile", generator.compile_test, method_id, filepaths, new_class_name)
+            if compilation_result_code != 0:
+                generator.log_compilation_error_during_execution_repair(method_id, current_execution_repair_round)
+                break
+
+            execution_result_code, execution_output = await self.run_stage(
+                "execute", generator.execute_test, method_id, filepaths, new_class_name)
+            current_execution_repair_round += 1
+
+        await self.run_stage("prompt", generator.finish_execution, method_id, filepaths, new_class_name,
+                             (execution_result_code, execution_output), current_execution_repair_round - 1)
+
+    async def repair_test(self, construct_repair_prompt, filepaths, output, new_class_name):
+        """
+        Queries the LLM for a repaired test and overwrites the test with it.
+        :param construct_repair_prompt: TestGenerator.construct_compilation_repair_prompt or
+        TestGenerator.construct_execution_repair_prompt
+        :param output: output of the failed compilation or execution
+        :return: True if the test was repaired, False if no repair prompt or answer could be created
+        """
+        prompt = await self.run_stage("prompt", construct_repair_prompt, filepaths, output, new_class_name)
+        answer = await self.run_stage("llm", self.generator.get_answer, prompt) if prompt else None
+        if not answer:
+            return False
+        await self.run_stage("prompt", self.generator.write_repaired_test, filepaths, new_class_name, answer)
+        return True
@@ -1,9 +1,33 @@
 from db import DataBase
-from llama_cpp import Llama
-import tiktoken
+from tokenizer import get_tokenizer, hash_text
 from prompt_templates import compile_error_prompt, prompt_template_1, prompt_template_2, prompt_template_3, \
     prompt_template_4, system_prompt, execution_error_prompt
 import configparser
+import logging
+import sqlite3
+from collections import Counter, OrderedDict
+from string import Formatter
+from utils import print_progress_bar
+
+# amount of token counts kept in memory by a prompt builder (the least recently used ones are dropped, they are
+# still found in the token count cache of the database)
+TOKEN_COUNT_CACHE_SIZE = 10000
+
+# prompt templates with increasing context, the largest one that fits into the token limit is used
+PROMPT_TEMPLATES = {
+    1: "\n".join([system_prompt.system_prompt, prompt_template_1.prompt_template_1]),
+    2: "\n".join([system_prompt.system_prompt, prompt_template_2.prompt_template_2]),
+    3: "\n".join([system_prompt.system_prompt, prompt_template_3.prompt_template_3]),
+    4: "\n".join([system_prompt.system_prompt, prompt_template_4.prompt_template_4]),
+}
+
+NO_RELATIONS_FOUND = "No relations found."
+
+# values that are the same for every prompt and therefore part of the template skeleton
+PROMPT_CONSTANTS = {
+    "testing_framework": "JUnit 5",
+    "mocking_framework": "Mockito",
+}
 
 
 class PromptBuilder:
@@ -12,44 +36,209 @@ class PromptBuilder:
         """
         This class is responsible for constructing the prompt for the LLM given a reference to a method in the database
         :param db_name: the name of the database
-        :param max_tokens: the maximum number of tokens allowed in the prompt
         """
+        self.db_name = db_name
         self.db = DataBase(db_name)
 
         self.config = configparser.ConfigParser()
         self.config.read('config.ini')
-        self.USE_MODEL = self.config.getboolean('MODEL', 'USE_MODEL')
-
-        if self.USE_MODEL:
-            self.MODEL_PATH = self.config.get('MODEL', 'MODEL_PATH')
+        # loaded once per process (or shared through the tokenizer server) instead of once per token count
+        self.tokenizer = get_tokenizer(self.config)
 
         self.max_tokens = int(self.config.get('MODEL', 'MODEL_MAX_INPUT_TOKENS'))
 
+        # token counts of recently tokenized texts (prompt sections, template skeletons), keyed by the hash of the text
+        self.token_counts = OrderedDict()
+        self.template_token_counts = None
+
+        # contexts of the methods prefetched with prefetch_method_contexts
+        self.method_contexts = {}
+
+    def prefetch_method_contexts(self, method_ids, keep_method_ids=()):
+        """
+        Fetches the contexts of several methods at once. Replaces the previously prefetched contexts.
+        :param method_ids: ids of the methods prompts will be constructed for next
+        :param keep_method_ids: ids of methods whose already fetched contexts are still needed (e.g. because tests
+        for them are still being generated)
+        """
+        method_contexts = {int(method_id): self.method_contexts[int(method_id)] for method_id in keep_method_ids
+                           if int(method_id) in self.method_contexts}
+        method_contexts.update(self.db.get_method_contexts(method_ids))
+        self.method_contexts = method_contexts
+
+    def get_method_context(self, method_id):
+        """
+        Returns the context of a method (see DataBase.get_method_contexts), prefetched if possible.
+        :param method_id: id of the method
+        :return: Dictionary containing the method, information about its class and its related methods and classes
+        """
+        method_id = int(method_id)
+        if method_id not in self.method_contexts:
+            self.method_contexts[method_id] = self.db.get_method_context(method_id)
+        return self.method_contexts[method_id]
+
     def construct_initial_prompt(self, method_id):
-        method = self.db.get_method_by_id(method_id)
-        method_name = method["methodIdentifier"]
-        class_name = method["classIdentifier"]
-        related_methods = self.db.get_related_methods_of_method(method_id)
-        related_classes = self.db.get_related_classes_of_method(method_id)
-        imports = self.db.get_imports_of_class(class_name)
-        package = self.db.get_package_of_class(class_name)
-        class_header = self.db.get_class_header_for_method(method_id)
-
-        related_methods_formatted = self.construct_code_prompt_from_dict_list(related_methods, "java", True)
-        related_classes_formatted = self.construct_code_prompt_from_dict_list(related_classes, "java", False)
-
-        size = 1
-        prompt = ""
-        while size <= 4 and self.check_token_limit(
-                self._generate_prompts_with_different_size(size, method_name, class_name, method,
-                                                           related_methods_formatted,
-                                                           related_classes_formatted, imports, package, class_header)):
-            prompt = self._generate_prompts_with_different_size(size, method_name, class_name, method,
-                                                                related_methods_formatted, related_classes_formatted,
-                                                                imports, package, class_header)
-            size += 1
-
-        return prompt
+        context = self.get_method_context(method_id)
+
+        sections = {
+            "method_name": context["methodIdentifier"],
+            "class_name": context["classIdentifier"],
+            "method_code": context["fullText"],
+            "package": context["package"],
+            "imports": context["imports"],
+            "class_header": context["classHeader"]
+        }
+
+        related_method_snippets = [self.format_code_snippet(code, "java", True) for code in context["relatedMethods"]]
+        related_class_snippets = [self.format_code_snippet(code, "java", False) for code in context["relatedClasses"]]
+
+        return self.assemble_prompt(sections, related_method_snippets, related_class_snippets)
+
+    def assemble_prompt(self, sections: dict, related_method_snippets: list, related_class_snippets: list):
+        """
+        Assembles the largest prompt that fits into the token limit.
+        Every section and snippet is tokenized only once, the size of a prompt is estimated as the sum of the tokens
+        of its template skeleton and the sections it contains. Related methods and related classes are packed snippet
+        by snippet (most relevant first) into the tokens left over by the template and the other sections. Only the
+        selected prompt is tokenized as a whole to make sure it really fits (see fit_prompt).
+        :param sections: the values to fill into the template, except for related_methods and related_classes
+        (see render_prompt)
+        :param related_method_snippets: formatted related methods, a method called several times is contained once
+        per call
+        :param related_class_snippets: formatted related classes, a class referenced several times is contained
+        once per reference
+        :return: The prompt or an empty string if not even the smallest template fits
+        """
+        if self.template_token_counts is None:
+            self.template_token_counts = self._count_template_skeleton_tokens()
+
+        section_names = list(sections.keys())
+        section_texts = [str(sections[name]) for name in section_names]
+        snippets = related_method_snippets + related_class_snippets
+        token_counts = self.count_tokens(section_texts + [NO_RELATIONS_FOUND] + snippets)
+        section_tokens = dict(zip(section_names, token_counts))
+        no_relations_tokens = token_counts[len(section_names)]
+        snippet_tokens = dict(zip(snippets, token_counts[len(section_names) + 1:]))
+
+        related_snippets = {
+            "related_methods": self.rank_snippets(related_method_snippets, snippet_tokens),
+            "related_classes": self.rank_snippets(related_class_snippets, snippet_tokens)
+        }
+
+        candidates = []
+        for size, template in PROMPT_TEMPLATES.items():
+            # summing up independently tokenized sections only estimates the prompt length, the selected prompt is
+            # checked as a whole in fit_prompt
+            remaining_tokens = self.max_tokens - 1 - self.template_token_counts[size]
+            template_fields = self._template_fields(template)
+            for field_name in template_fields:
+                if field_name in section_tokens:
+                    remaining_tokens -= section_tokens[field_name]
+
+            packed = {}
+            for field_name, ranked_snippets in related_snippets.items():
+                if field_name not in template_fields:
+                    continue
+                packed[field_name] = self.pack_snippets(ranked_snippets, snippet_tokens, remaining_tokens)
+                if packed[field_name]:
+                    remaining_tokens -= sum(snippet_tokens[snippet] for snippet in packed[field_name])
+                else:
+                    remaining_tokens -= no_relations_tokens
+
+            if remaining_tokens < 0:
+                break
+            candidates.append((size, packed))
+
+        return self.fit_prompt(sections, candidates)
+
+    def fit_prompt(self, sections: dict, candidates: list):
+        """
+        Renders the largest candidate prompt and tokenizes it as a whole, as tokens can merge differently at the
+        boundaries of the sections than within the separately counted sections. If the prompt exceeds the token
+        limit after all, the least relevant packed snippets are dropped (related classes first) and then the next
+        smaller candidate is tried.
+        :param sections: the values to fill into the template, except for related_methods and related_classes
+        :param candidates: list of (template size, packed snippets per related field) tuples, smallest size first
+        :return: The prompt or an empty string if no candidate fits
+        """
+        for size, packed in reversed(candidates):
+            packed = {field_name: list(snippets) for field_name, snippets in packed.items()}
+            while True:
+                size_sections = dict(sections)
+                for field_name, snippets in packed.items():
+                    size_sections[field_name] = "".join(snippets) if snippets else NO_RELATIONS_FOUND
+                prompt = self.render_prompt(size, size_sections)
+                # whole prompts are unique, so they are not added to the token count cache
+                if self.tokenizer.count_tokens([prompt])[0] < self.max_tokens:
+                    return prompt
+
+                trimmable_fields = [field_name for field_name in ("related_classes", "related_methods")
+                                    if packed.get(field_name)]
+                if not trimmable_fields:
+                    break
+                packed[trimmable_fields[0]].pop()
+        return ""
+
+    @staticmethod
+    def rank_snippets(snippets: list, snippet_tokens: dict):
+        """
+        Ranks code snippets by relevance. Snippets which occur more often (e.g. methods called several times) come
+        first, snippets occurring equally often are ordered by their number of tokens (smallest first).
+        :param snippets: the snippets to rank, may contain duplicates
+        :param snippet_tokens: number of tokens of each snippet
+        :return: List of unique snippets, most relevant first
+        """
+        occurrences = Counter(snippets)
+        return sorted(occurrences.keys(), key=lambda snippet: (-occurrences[snippet], snippet_tokens[snippet]))
+
+    @staticmethod
+    def pack_snippets(ranked_snippets: list, snippet_tokens: dict, token_budget: int):
+        """
+        Greedily selects snippets in the order of their relevance as long as they fit into the token budget.
+        Snippets that are too large are skipped, so smaller less relevant snippets can still be added.
+        :param ranked_snippets: snippets, most relevant first
+        :param snippet_tokens: number of tokens of each snippet
+        :param token_budget: number of tokens available for the snippets
+        :return: List of selected snippets
+        """
+        packed_snippets = []
+        for snippet in ranked_snippets:
+            if snippet_tokens[snippet] <= token_budget:
+                packed_snippets.append(snippet)
+                token_budget -= snippet_tokens[snippet]
+        return packed_snippets
+
+    @staticmethod
+    def render_prompt(size: int, sections: dict):
+        """
+        Renders the prompt template of the given size.
+        :param size: the size of the template (1 - 4)
+        :param sections: the values to fill into the template (method_name, class_name, method_code, package, imports,
+        class_header, related_methods, related_classes)
+        :return: The rendered prompt
+        """
+        return PROMPT_TEMPLATES[size].format(**sections, **PROMPT_CONSTANTS)
+
+    def _count_template_skeleton_tokens(self):
+        """
+        Counts the tokens of every prompt template without any of the method specific sections.
+        :return: Dictionary with the template size as key and the number of tokens as value
+        """
+        skeletons = []
+        for template in PROMPT_TEMPLATES.values():
+            empty_sections = {field_name: "" for field_name in self._template_fields(template)
+                              if field_name not in PROMPT_CONSTANTS}
+            skeletons.append(template.format(**empty_sections, **PROMPT_CONSTANTS))
+        return dict(zip(PROMPT_TEMPLATES.keys(), self.count_tokens(skeletons)))
+
+    @staticmethod
+    def _template_fields(template: str):
+        """
+        Lists the replacement fields of a template, a field is listed once for every occurrence.
+        :param template: the template string
+        :return: List of field names
+        """
+        return [field_name for _, field_name, _, _ in Formatter().parse(template) if field_name]
 
     def construct_error_prompt(self, method_id, error_message):
         pass
@@ -63,28 +252,94 @@ class PromptBuilder:
         :param is_method: True if the code snippets are methods, False otherwise
         :return: Single string containing all code snippets wrapped in code blocks
         """
-        prompt = ""
-        for code in code_list:
-            if is_method:
-                prompt += "Method: " + str(code["methodIdentifier"]) + " of the class " + str(
-                    code["classIdentifier"]) + ":\n"
-            prompt += "```" + language_identifier + "\n"
-            prompt += str(code["fullText"])
-            prompt += "\n```\n"
-        return prompt if prompt != "" else "No relations found."
+        prompt = "".join(PromptBuilder.format_code_snippet(code, language_identifier, is_method) for code in code_list)
+        return prompt if prompt != "" else NO_RELATIONS_FOUND
+
+    @staticmethod
+    def format_code_snippet(code, language_identifier, is_method):
+        """
+        Wraps a single code snippet in a code block.
+        :param code: dictionary containing the fullText (and methodIdentifier and classIdentifier for methods)
+        :param language_identifier: the language identifier
+        :param is_method: True if the code snippet is a method, False otherwise
+        :return: The code snippet wrapped in a code block
+        """
+        snippet = ""
+        if is_method:
+            snippet += "Method: " + str(code["methodIdentifier"]) + " of the class " + str(
+                code["classIdentifier"]) + ":\n"
+        snippet += "```" + language_identifier + "\n"
+        snippet += str(code["fullText"])
+        snippet += "\n```\n"
+        return snippet
 
     def check_token_limit(self, prompt: str):
         """
         Checks if the prompt is too long for the given token limit.
         :param prompt: the prompt to check
-        :param token_limit: the token limit to check against
-        :return: True if the prompt is too long, False otherwise
+        :return: True if the prompt fits into the token limit, False otherwise
         """
-        if self.USE_MODEL:
-            tokens = self.tokenize_with_model(prompt, self.MODEL_PATH)
-        else:
-            tokens = self.tokenize_with_tiktoken(prompt)
-        return len(tokens) < self.max_tokens
+        # repair prompts are unique, so they are not added to the token count cache
+        return self.tokenizer.count_tokens([prompt])[0] < self.max_tokens
+
+    def count_tokens(self, texts: list):
+        """
+        Counts the tokens of several texts in one batch using the configured tokenizer.
+        Texts which were recently counted by this prompt builder (see TOKEN_COUNT_CACHE_SIZE) or are found in the
+        token count cache of the database are not tokenized again. Newly counted texts are added to the cache of the
+        database.
+        :param texts: the texts to count the tokens for
+        :return: List of token counts following the order of the texts
+        """
+        text_hashes = {text: hash_text(text) for text in texts}
+        counts = {}
+        for text, text_hash in text_hashes.items():
+            if text_hash in self.token_counts:
+                self.token_counts.move_to_end(text_hash)
+                counts[text] = self.token_counts[text_hash]
+        new_texts = [text for text in text_hashes if text not in counts]
+        if new_texts:
+            cached_counts = self.db.get_token_counts(self.tokenizer.tokenizer_id,
+                                                   [text_hashes[text] for text in new_texts])
+
+            uncached_texts = [text for text in new_texts if text_hashes[text] not in cached_counts]
+            if uncached_texts:
+                uncached_counts = [(text_hashes[text], token_count) for text, token_count in
+                                   zip(uncached_texts, self.tokenizer.count_tokens(uncached_texts))]
+                cached_counts.update(uncached_counts)
+                try:
+                    self.db.insert_token_counts(self.tokenizer.tokenizer_id, uncached_counts)
+                except sqlite3.OperationalError as e:
+                    # e.g. database locked by another process, the counts will simply be computed again next time
+                    logging.info("Could not cache token counts: " + str(e))
+
+            for text in new_texts:
+                counts[text] = cached_counts[text_hashes[text]]
+                self.token_counts[text_hashes[text]] = counts[text]
+            while len(self.token_counts) > TOKEN_COUNT_CACHE_SIZE:
+                self.token_counts.popitem(last=False)
+        return [counts[text] for text in texts]
+
+    def prefill_token_counts(self, batch_size: int = 1000):
+        """
+        Counts the tokens of all prompt sections of the project (method code, class headers, imports, related
+        method and class snippets, ...) and stores them in the token count cache of the database.
+        :param batch_size: number of texts passed to the tokenizer at once
+        """
+        texts = set()
+        for method in self.db.get_all_methods():
+            texts.update([str(method["methodIdentifier"]), str(method["fullText"]),
+                          self.format_code_snippet(method, "java", True)])
+        for class_dict in self.db.get_all_classes():
+            texts.update([str(class_dict["classIdentifier"]), str(class_dict["classHeader"]),
+                          str(class_dict["imports"]), str(class_dict["package"]),
+                          self.format_code_snippet(class_dict, "java", False)])
+
+        texts = list(texts)
+        for start in range(0, len(texts), batch_size):
+            self.count_tokens(texts[start:start + batch_size])
+            print_progress_bar(min(start + batch_size, len(texts)), len(texts),
+                               prefix="Counting tokens of {}".format(self.db_name), display_100_percent=True)
 
     def construct_compile_error_repair_prompt(self, method_text, error_message):
         """
@@ -115,113 +370,3 @@ class PromptBuilder:
             return prompt
         else:
             return ""
-
-    def tokenize_with_model(self, prompt: str, model_path: str):
-        """
-        Generates a list of tokens for the prompt.
-        Uses the Llama tokenizer provided by llama-cpp-python.
-        :param prompt: the prompt to generate tokens for
-        :param model_path: the path to the model to use
-        :return: A list of integers representing the tokens
-        """
-        llm = Llama(model_path, n_ctx=self.max_tokens, verbose=False)
-        tokens = llm.tokenize(bytes(prompt, "utf-8"))
-        return tokens
-
-    @staticmethod
-    def tokenize_with_tiktoken(prompt: str):
-        """
-        Generates a list of tokens for the prompt using tiktoken with the cl100k_base encoding.
-        Using this method can be useful when running the application with OpenAI models, as they use
-        the same encoding.
-        :param prompt: the prompt to generate tokens for
-        :return: A list of integers representing the tokens
-        """
-        encoding = tiktoken.get_encoding("cl100k_base")
-        tokens = encoding.encode(prompt)
-        return tokens
-
-    @staticmethod
-    def _generate_prompts_with_different_size(size: int,
-                                              method_name: str,
-                                              class_name: str,
-                                              method: dict,
-                                              related_methods_formatted: str,
-                                              related_classes_formatted: str,
-                                              imports: str,
-                                              package: str,
-                                              class_header: str):
-
-        if size == 1:
-            prompt_template = "\n".join(
-                [
-                    system_prompt.system_prompt,
-                    prompt_template_1.prompt_template_1
-                ])
-
-            return prompt_template.format(
-                method_name=method_name,
-                class_name=class_name,
-                method_code=method["fullText"],
-                testing_framework="JUnit 5",
-                mocking_framework="Mockito",
-                package=package,
-                imports=imports
-            )
-
-        elif size == 2:
-            prompt_template = "\n".join(
-                [
-                    system_prompt.system_prompt,
-                    prompt_template_2.prompt_template_2
-                ])
-
-            return prompt_template.format(
-                method_name=method_name,
-                class_name=class_name,
-                method_code=method["fullText"],
-                testing_framework="JUnit 5",
-                mocking_framework="Mockito",
-                package=package,
-                imports=imports,
-                class_header=class_header
-            )
-
-        elif size == 3:
-            prompt_template = "\n".join(
-                [
-                    system_prompt.system_prompt,
-                    prompt_template_3.prompt_template_3
-                ])
-
-            return prompt_template.format(
-                method_name=method_name,
-                class_name=class_name,
-                method_code=method["fullText"],
-                testing_framework="JUnit 5",
-                mocking_framework="Mockito",
-                related_methods=related_methods_formatted,
-                package=package,
-                imports=imports,
-                class_header=class_header
-            )
-
-        elif size == 4 or size == 5:
-            prompt_template = "\n".join(
-                [
-                    system_prompt.system_prompt,
-                    prompt_template_4.prompt_template_4
-                ])
-
-            return prompt_template.format(
-                method_name=method_name,
-                class_name=class_name,
-                method_code=method["fullText"],
-                testing_framework="JUnit 5",
-                mocking_framework="Mockito",
-                related_methods=related_methods_formatted,
-                related_classes=related_classes_formatted,
-                package=package,
-                imports=imports,
-                class_header=class_header
-            )
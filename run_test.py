@@ -1,11 +1,22 @@
+import fcntl
 import glob
+import hashlib
+import json
 import os
+import shutil
 import subprocess
 import configparser
 import xml.etree.ElementTree as ET
 import warnings
 
 
+# has to be increased whenever the way projects are built changes, so cached builds are not used anymore
+BUILD_CACHE_VERSION = 1
+
+# dependencies of the projects already built or found in the build cache by this process
+_project_dependencies = {}
+
+
 class TestExecuter:
 
     def __init__(self, project_name: str, dependencies_pre_built: bool = False):
@@ -16,7 +27,7 @@ class TestExecuter:
         :param project_name: Name of the project to run tests for. Used to create the classpath file for compilation and
         execution.
         :param dependencies_pre_built: If true, the dependencies will not be built and it is assumed that they are
-        already built.
+        already built (the dependencies of the last build are used).
         """
         self.project_name = project_name
         self.dependencies = []
@@ -32,6 +43,11 @@ class TestExecuter:
 
             self.make_dependencies()
 
+        else:
+            build_cache = self.read_build_cache()
+            if build_cache:
+                self.dependencies = build_cache["dependencies"]
+
     def get_dependencies_as_string(self):
         return ":".join(self.dependencies)
 
@@ -94,40 +110,123 @@ class TestExecuter:
 
     def make_dependencies(self):
         """
-        Generate dependencies for a java project using maven and save them in the dependencies list
+        Generate dependencies for a java project using maven and save them in the dependencies list.
+        The build is cached (see get_build_cache_key), maven only runs if the pom.xml or the sources of the project
+        changed since the last build. Concurrent processes wait for the build of the first one.
         """
-        mvn_target_dir = f'{self.current_abs_path}/build/compiled_projects/{self.project_name}'
-        # Check if dependencies are already generated for the specific project
-        if not self.dependencies:
-            print("Making dependencies for project:", self.project_name)
-            # Run mvn command to generate dependencies
-            # Project needs to be a maven project and have a pom.xml file
-            subprocess.run(
-                f"mvn dependency:copy-dependencies -DoutputDirectory={mvn_target_dir}/dependencies \
-                -f {self.current_abs_path}/Java_Projects/{self.project_name}/pom.xml",
-                shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            # Install the project using maven (also compiles the project)
-            # Tests are skipped to avoid running old tests from the project
-            subprocess.run(f"mvn install -DskipTests -f {self.current_abs_path}/Java_Projects/{self.project_name}/pom.xml",
-                           shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            # copy compiled files to compiled_projects folder
-            # if no outputDirectory is specified in the pom.xml, the standard directory will be used
-            compile_path = self.get_standard_compile_path() if self.get_standard_compile_path() else "target"
-            target_folder = f"{self.current_abs_path}/build/compiled_projects/{self.project_name}"
-            subprocess.run(f"mkdir -p {target_folder}", shell=True)
-            subprocess.run(f"cp -r {self.current_abs_path}/Java_Projects/{self.project_name}/{compile_path}/* \
-                            {target_folder}", shell=True)
-            # remove files
-            subprocess.run(f"rm -r {self.current_abs_path}/Java_Projects/{self.project_name}/{compile_path}", shell=True)
-
-            # Get paths of all dependencies (jars) and add them to the dependencies list
-            dep_jars = glob.glob(f"{mvn_target_dir}" + "/**/*.jar", recursive=True)
-            self.dependencies.extend(list(set(dep_jars)))
-            print("Dependencies generated for project:", self.project_name)
-        else:
+        if self.dependencies:
             print("Dependencies already generated for project:", self.project_name)
+            return
+        if self.project_name in _project_dependencies:
+            self.dependencies = list(_project_dependencies[self.project_name])
+            return
+
+        os.makedirs(f"{self.current_abs_path}/build/compiled_projects", exist_ok=True)
+        with open(f"{self.current_abs_path}/build/compiled_projects/{self.project_name}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                build_cache_key = self.get_build_cache_key()
+                build_cache = self.read_build_cache()
+                if build_cache and build_cache["key"] == build_cache_key and \
+                        os.path.isdir(f"{self.current_abs_path}/build/compiled_projects/{self.project_name}") and \
+                        all(os.path.exists(jar) for jar in build_cache["dependencies"]):
+                    self.dependencies = build_cache["dependencies"]
+                    print("Dependencies already generated for project:", self.project_name)
+                else:
+                    self.build_project()
+                    self.write_build_cache(build_cache_key)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        _project_dependencies[self.project_name] = list(self.dependencies)
+
+    def build_project(self):
+        """
+        Builds the project and copies its dependencies using maven and saves them in the dependencies list.
+        The build is written to a temporary folder first and then moved into place, so other processes running tests
+        of the project never see a partially built project.
+        """
+        mvn_target_dir = f'{self.current_abs_path}/build/compiled_projects/{self.project_name}'
+        build_dir = mvn_target_dir + ".tmp"
+        old_build_dir = mvn_target_dir + ".old"
+        # remove leftovers of an interrupted build (only one process builds the project at a time)
+        shutil.rmtree(build_dir, ignore_errors=True)
+        shutil.rmtree(old_build_dir, ignore_errors=True)
+        print("Making dependencies for project:", self.project_name)
+        # Run mvn command to generate dependencies
+        # Project needs to be a maven project and have a pom.xml file
+        subprocess.run(
+            f"mvn dependency:copy-dependencies -DoutputDirectory={build_dir}/dependencies \
+            -f {self.current_abs_path}/Java_Projects/{self.project_name}/pom.xml",
+            shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        # Install the project using maven (also compiles the project)
+        # Tests are skipped to avoid running old tests from the project
+        subprocess.run(f"mvn install -DskipTests -f {self.current_abs_path}/Java_Projects/{self.project_name}/pom.xml",
+                       shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        # copy compiled files to compiled_projects folder
+        # if no outputDirectory is specified in the pom.xml, the standard directory will be used
+        compile_path = self.get_standard_compile_path() if self.get_standard_compile_path() else "target"
+        subprocess.run(f"mkdir -p {build_dir}", shell=True)
+        subprocess.run(f"cp -r {self.current_abs_path}/Java_Projects/{self.project_name}/{compile_path}/* \
+                        {build_dir}", shell=True)
+        # remove files
+        subprocess.run(f"rm -r {self.current_abs_path}/Java_Projects/{self.project_name}/{compile_path}", shell=True)
+
+        # replace the previous build (a directory can only be renamed onto an empty one, so it is moved away first)
+        if os.path.isdir(mvn_target_dir):
+            os.replace(mvn_target_dir, old_build_dir)
+        os.replace(build_dir, mvn_target_dir)
+        shutil.rmtree(old_build_dir, ignore_errors=True)
+
+        # Get paths of all dependencies (jars) and add them to the dependencies list
+        dep_jars = glob.glob(f"{mvn_target_dir}" + "/**/*.jar", recursive=True)
+        self.dependencies.extend(sorted(set(dep_jars)))
+        print("Dependencies generated for project:", self.project_name)
+
+    def get_build_cache_key(self):
+        """
+        Hashes the inputs of the maven build: the pom.xml and all other files of the project, except for build
+        outputs and hidden folders.
+        :return: Hex digest of the SHA-256 hash
+        """
+        project_path = f"{self.current_abs_path}/Java_Projects/{self.project_name}"
+        excluded_folders = {"target", os.path.normpath(self.get_standard_compile_path() or "target")}
+        build_hash = hashlib.sha256(str(BUILD_CACHE_VERSION).encode('utf-8'))
+        for root, folders, files in os.walk(project_path):
+            folders[:] = sorted(folder for folder in folders if not folder.startswith(".") and
+                                os.path.relpath(os.path.join(root, folder), project_path) not in excluded_folders)
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                build_hash.update(os.path.relpath(file_path, project_path).encode('utf-8'))
+                with open(file_path, 'rb') as file:
+                    build_hash.update(hashlib.sha256(file.read()).digest())
+        return build_hash.hexdigest()
+
+    def read_build_cache(self):
+        """
+        :return: Dictionary with the key and the dependencies of the last build of the project or None if the project
+        was not built yet
+        """
+        try:
+            with open(self.get_build_cache_path(), 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def write_build_cache(self, build_cache_key: str):
+        """
+        Saves the key and the dependencies of the build (written to a temporary file first, so readers never see a
+        partially written file).
+        :param build_cache_key: key returned by get_build_cache_key
+        """
+        build_cache_path = self.get_build_cache_path()
+        with open(build_cache_path + ".tmp", 'w') as file:
+            json.dump({"key": build_cache_key, "dependencies": self.dependencies}, file)
+        os.replace(build_cache_path + ".tmp", build_cache_path)
+
+    def get_build_cache_path(self):
+        return f"{self.current_abs_path}/build/compiled_projects/{self.project_name}_build.json"
 
     def run_test(self, classpath_file_name, class_to_test, timeout: int = 20):
         """
@@ -135,9 +234,8 @@ class TestExecuter:
         :param classpath_file_name: File name where the classpath should be saved (has to be a txt)
         :param class_to_test: Class which should be run as a test (e.g. org.jfree.tests.junit.chart.JFreeChartTests)
         :param timeout: Timeout for the test execution in seconds
-        :return:
+        :return: Tuple of return code and output of the test run (0 if all tests passed)
         """
-
         classpath = f"{self.JUNIT_JAR}:{self.MOCKITO_JAR}:{self.get_dependencies_as_string()}:" \
                     f"{self.current_abs_path}/build/compiled_projects/{self.project_name}/classes:" \
                     f"{self.current_abs_path}/build/compiled_tests/{self.project_name}"
@@ -166,4 +264,5 @@ class TestExecuter:
             output = result.stdout if result.stdout else result.stderr
             return result.returncode, output
         except subprocess.TimeoutExpired:
-            return 1, "Timeout"
\ No newline at end of file
+            return 1, "Timeout"
+
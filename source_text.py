@@ -0,0 +1,121 @@
+import hashlib
+import mmap
+import os
+from collections import OrderedDict
+
+# maximum number of source files kept open per process
+MAX_OPEN_SOURCE_FILES = 64
+
+
+class SourceFileChangedError(Exception):
+    pass
+
+
+class SourceTextReader:
+    """
+    Reads the text of code elements (classes, methods, ...) from their source files given the byte offsets recorded
+    by the JavaCodeParser. The source files are memory-mapped, so only the pages containing the requested text are
+    read. The offsets refer to the file content with normalized line endings (as read by the parser), files
+    containing carriage returns are therefore normalized in memory instead.
+    As the offsets are only valid for the parsed version of a file, files are compared to their state at parse time
+    (see file_states) when they are opened.
+    """
+
+    def __init__(self, max_open_files: int = MAX_OPEN_SOURCE_FILES, file_states: dict = None):
+        """
+        :param max_open_files: number of source files kept open, the least recently used file is closed first
+        :param file_states: dictionary of the filepaths and a tuple of size, modification time (in ns) and content
+        hash of the files at parse time, files without a state are not checked
+        """
+        self.max_open_files = max_open_files
+        self.sources = OrderedDict()
+        self.file_states = file_states
+
+    def read(self, filepath: str, start_byte: int, end_byte: int):
+        """
+        Reads the text between two byte offsets of a source file.
+        :param filepath: path of the source file
+        :param start_byte: offset of the first byte of the text
+        :param end_byte: offset after the last byte of the text
+        :return: The decoded text
+        """
+        return self.get_source(filepath)[start_byte:end_byte].decode("utf-8")
+
+    def read_spans(self, filepath: str, spans: list, separator: str = "\n"):
+        """
+        Reads several texts of a source file and joins them, e.g. a method and the comment preceding it.
+        :param filepath: path of the source file
+        :param spans: list of (start byte, end byte) tuples, None entries are skipped
+        :param separator: string placed between the texts
+        :return: The joined text
+        """
+        return separator.join(self.read(filepath, *span) for span in spans if span is not None)
+
+    def get_source(self, filepath: str):
+        """
+        Returns the content of a source file as a buffer supporting byte slices, opening the file on first use.
+        :param filepath: path of the source file
+        :return: Memory-mapped file, or the normalized bytes of a file containing carriage returns
+        """
+        if filepath in self.sources:
+            self.sources.move_to_end(filepath)
+            return self.sources[filepath][1]
+
+        if self.file_states and filepath in self.file_states:
+            self.check_file_state(filepath, *self.file_states[filepath])
+
+        source_file = open(filepath, "rb")
+        try:
+            source = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be memory-mapped
+            source_file.close()
+            source_file, source = None, b""
+
+        if source.find(b"\r") != -1:
+            # same normalization as reading the file in text mode
+            normalized_source = source[:].replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            self._close_source(source_file, source)
+            source_file, source = None, normalized_source
+
+        self.sources[filepath] = (source_file, source)
+        if len(self.sources) > self.max_open_files:
+            self._close_source(*self.sources.popitem(last=False)[1])
+        return source
+
+    @staticmethod
+    def check_file_state(filepath: str, size: int, mtime_ns: int, file_hash: str):
+        """
+        Raises a SourceFileChangedError if a file changed since it was parsed. The content hash is only compared if
+        the size or the modification time changed.
+        :param filepath: path of the source file
+        :param size: size of the file at parse time
+        :param mtime_ns: modification time of the file at parse time in nanoseconds
+        :param file_hash: hex digest of the SHA-256 hash of the file content at parse time
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            raise SourceFileChangedError(f"{filepath} was deleted since it was parsed. Parse the project again "
+                                         f"(e.g. with --incremental True).")
+        if stat.st_size == size and stat.st_mtime_ns == mtime_ns:
+            return
+        with open(filepath, "rb") as file:
+            if hashlib.sha256(file.read()).hexdigest() == file_hash:
+                return
+        raise SourceFileChangedError(f"{filepath} changed since it was parsed. Parse the project again "
+                                     f"(e.g. with --incremental True).")
+
+    def close(self):
+        """
+        Closes all open source files.
+        """
+        for source_file, source in self.sources.values():
+            self._close_source(source_file, source)
+        self.sources.clear()
+
+    @staticmethod
+    def _close_source(source_file, source):
+        if source_file is not None:
+            source.close()
+            source_file.close()
@@ -0,0 +1,170 @@
+import logging
+import queue
+from threading import Thread
+from db import DataBase
+from json_to_db import INSERT_BATCH_SIZE, add_class_rows, add_relation_rows, new_insert_batch, write_insert_batch
+from prompt_builder import PromptBuilder
+from symbol_table import SymbolTable
+from utils import print_progress_bar
+
+# maximum number of parsed files waiting to be written, the parser blocks if the database writer falls behind
+STREAM_QUEUE_SIZE = 64
+
+# keys of a method needed to resolve its relations, everything else is dropped after the method was inserted
+RELATION_KEYS = ("method_identifier", "related_methods", "method_parameter_types")
+
+
+class StreamingDatabaseWriter:
+    """
+    Writes the information extracted by the JavaCodeParser directly into the database of a project, without the
+    intermediate JSON files. The parsed files are handed over through a bounded queue to a writer thread, which
+    inserts the classes and methods in batches while the parser continues with the next files. Once all files are
+    parsed, the relations are resolved from the symbol table of the inserted methods and classes.
+    """
+
+    def __init__(self, project_name: str, queue_size: int = STREAM_QUEUE_SIZE):
+        """
+        Creates a new database for the project and starts the writer thread.
+        :param project_name: Name of the project.
+        :param queue_size: Maximum number of parsed files waiting to be written.
+        """
+        self.project_name = project_name
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.finished_queue = False
+        self.thread = Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def add_file_information(self, file_information: list):
+        """
+        Hands the information extracted from a file over to the writer thread. Blocks if the queue is full.
+        :param file_information: Information returned by JavaCodeParser.extract_file_information.
+        """
+        self.queue.put(file_information)
+
+    def finish(self):
+        """
+        Waits until all files and relations are written, then updates the statistics of the query planner and
+        counts the tokens of all prompt sections (like convert_json_to_db).
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+        DataBase(self.project_name).analyze()
+        PromptBuilder(self.project_name).prefill_token_counts()
+
+    def _write(self):
+        try:
+            # sqlite connections can only be used by the thread that created them
+            db = DataBase(self.project_name)
+            db.reset()
+            db.create_tables()
+
+            # all inserts of the project are written in one transaction
+            with db.bulk_load():
+                db.insert_project(self.project_name)
+                symbol_table, pending_relations = self._insert_classes(db)
+                self._insert_relations(db, symbol_table, pending_relations)
+        except BaseException as e:
+            self.error = e
+            # keep consuming the queue, so the parser is not blocked forever
+            while not self.finished_queue:
+                self.finished_queue = self.queue.get() is None
+
+    def _insert_classes(self, db: DataBase):
+        """
+        Inserts the classes, class variables, methods and method parameters of all files in the queue.
+        :return: Tuple of the symbol table of the inserted classes and methods and the class folders whose relations
+        have to be resolved.
+        """
+        symbol_table = SymbolTable()
+        pending_relations = []
+        # class identifier -> index of the class folder in pending_relations
+        class_folders = {}
+
+        next_method_id = 1
+        rows = new_insert_batch()
+        while True:
+            file_information = self.queue.get()
+            if file_information is None:
+                self.finished_queue = True
+                break
+
+            for class_list, method_list in class_files_of_file_information(file_information):
+                duplicate_classes = symbol_table.classes.intersection(class_dict["class_identifier"]
+                                                                      for class_dict in class_list)
+                if duplicate_classes:
+                    # like a class folder overwritten by a later file in the json files, the last class wins
+                    logging.warning("Replacing the classes {} of {} with the classes of {}."
+                                    .format(sorted(duplicate_classes), self.project_name, class_list[-1]["filepath"]))
+                    write_insert_batch(db, rows)
+                    rows = new_insert_batch()
+                    self._remove_class_folders(db, symbol_table, pending_relations, class_folders,
+                                               {class_folders[class_identifier]
+                                                for class_identifier in duplicate_classes})
+
+                next_method_id = add_class_rows(rows, self.project_name, class_list, method_list, next_method_id,
+                                                symbol_table)
+
+                for class_dict in class_list:
+                    class_folders[class_dict["class_identifier"]] = len(pending_relations)
+                pending_relations.append(([{"class_identifier": class_dict["class_identifier"]}
+                                           for class_dict in class_list],
+                                          [{key: method_dict[key] for key in RELATION_KEYS}
+                                           for method_dict in method_list]))
+
+            if len(rows["methods"]) >= INSERT_BATCH_SIZE:
+                write_insert_batch(db, rows)
+                rows = new_insert_batch()
+
+        write_insert_batch(db, rows)
+        return symbol_table, [class_folder for class_folder in pending_relations if class_folder is not None]
+
+    @staticmethod
+    def _remove_class_folders(db: DataBase, symbol_table: SymbolTable, pending_relations: list, class_folders: dict,
+                              indices: set):
+        """
+        Removes all classes of already inserted class folders from the database and the symbol table.
+        :param indices: indices of the class folders in pending_relations
+        """
+        class_identifiers = []
+        for index in indices:
+            class_identifiers.extend(class_dict["class_identifier"] for class_dict in pending_relations[index][0])
+            pending_relations[index] = None
+        db.delete_classes(class_identifiers)
+        for class_identifier in class_identifiers:
+            symbol_table.remove_class(class_identifier)
+            del class_folders[class_identifier]
+
+    def _insert_relations(self, db: DataBase, symbol_table: SymbolTable, pending_relations: list):
+        """
+        Inserts the relations of all methods, resolved from the symbol table of the inserted methods and classes.
+        """
+        rows = new_insert_batch()
+        n_classes = len(pending_relations)
+        for curr_class, (class_list, method_list) in enumerate(pending_relations, 1):
+            print_progress_bar(curr_class, n_classes,
+                               prefix="Adding intra-project relations of {} to database".format(self.project_name),
+                               display_100_percent=True)
+            add_relation_rows(rows, class_list, method_list, symbol_table)
+
+            if len(rows["related_methods"]) + len(rows["related_classes"]) >= INSERT_BATCH_SIZE:
+                write_insert_batch(db, rows)
+                rows = new_insert_batch()
+
+        write_insert_batch(db, rows)
+
+
+def class_files_of_file_information(file_information: list):
+    """
+    Converts the information extracted from a file into the content of the class folders written by
+    JavaCodeParser.write_file_information. Only the folder of the last class of a file contains a class.json file
+    (listing all classes of the file), so the database gets the same content as with convert_json_to_db.
+    :param file_information: Information returned by JavaCodeParser.extract_file_information.
+    :return: List of tuples of the class list and the method list of every class folder with a class.json file.
+    """
+    if not file_information:
+        return []
+    return [([class_output for class_output, _ in file_information], file_information[-1][1])]
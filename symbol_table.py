@@ -0,0 +1,124 @@
+import re
+
+# types of method parameters that are not recorded by the parser (only plain class names are)
+JAVA_PRIMITIVE_TYPES = {"byte", "short", "int", "long", "float", "double", "boolean", "char", "var"}
+
+CLASS_NAME_PATTERN = re.compile(r"[A-Za-z_$][\w$]*")
+
+
+class SymbolTable:
+    """
+    In-memory index of the classes and methods of a project, used to resolve the relations of methods without
+    querying the database for every call site. Methods are indexed by class and method identifier, overloaded
+    methods are told apart by the types of the arguments of an invocation.
+    """
+
+    def __init__(self):
+        # (class identifier, method identifier) -> list of (method id, parameter types) in the order of the method ids
+        self.methods = {}
+        # class identifier -> ids of the methods of the class in the order they were inserted
+        self.class_method_ids = {}
+        self.classes = set()
+
+    @classmethod
+    def from_database(cls, db):
+        """
+        Builds the symbol table of all classes and methods in a database.
+        :param db: database of the project
+        :return: SymbolTable
+        """
+        symbol_table = cls()
+        for class_identifier in db.get_class_identifiers():
+            symbol_table.add_class(class_identifier)
+
+        parameter_types = {}
+        for method_id, parameter_type in db.get_method_parameter_types():
+            parameter_types.setdefault(method_id, []).append(parameter_type)
+        for method_id, method_identifier, class_identifier in db.get_method_identifiers():
+            symbol_table.add_method(method_id, method_identifier, class_identifier, parameter_types.get(method_id, []))
+        return symbol_table
+
+    def add_class(self, class_identifier: str):
+        """
+        :param class_identifier: identifier of a class of the project
+        """
+        self.classes.add(class_identifier)
+
+    def add_method(self, method_id: int, method_identifier: str, class_identifier: str, parameter_types: list):
+        """
+        Methods have to be added in the order of their ids.
+        :param method_id: id of the method in the database
+        :param method_identifier: name of the method
+        :param class_identifier: identifier of the class of the method
+        :param parameter_types: types of the parameters recorded by the parser (method_parameter_types)
+        """
+        self.methods.setdefault((class_identifier, method_identifier), []).append((method_id, list(parameter_types)))
+        self.class_method_ids.setdefault(class_identifier, []).append(method_id)
+
+    def remove_class(self, class_identifier: str):
+        """
+        Removes a class together with its methods.
+        :param class_identifier: identifier of a class of the project
+        """
+        self.classes.discard(class_identifier)
+        method_ids = set(self.class_method_ids.pop(class_identifier, []))
+        for key in [key for key in self.methods if key[0] == class_identifier]:
+            remaining = [method for method in self.methods[key] if method[0] not in method_ids]
+            if remaining:
+                self.methods[key] = remaining
+            else:
+                del self.methods[key]
+
+    def resolve_class(self, class_identifier: str):
+        """
+        :param class_identifier: identifier of a class
+        :return: The class identifier if the class belongs to the project, None otherwise
+        """
+        return class_identifier if class_identifier in self.classes else None
+
+    def resolve_method(self, method_identifier: str, class_identifier: str, argument_types: list = None):
+        """
+        Resolves a method invocation. If the method is overloaded, the overload whose parameter types match the
+        argument types is used. Otherwise (or if the argument types do not match any overload) the first method with
+        the identifier is used.
+        :param method_identifier: name of the invoked method
+        :param class_identifier: identifier of the class the method is invoked on
+        :param argument_types: known types of the arguments of the invocation (see
+        JavaCodeParser.extract_method_invocation_argument_types)
+        :return: Id of the invoked method or None if the method does not belong to the project
+        """
+        candidates = self.methods.get((class_identifier, method_identifier))
+        if not candidates:
+            return None
+        if len(candidates) == 1 or not argument_types:
+            return candidates[0][0]
+
+        # only plain class names are recorded as parameter types, other argument types can not be compared
+        argument_types = [argument_type for argument_type in argument_types
+                          if CLASS_NAME_PATTERN.fullmatch(argument_type)
+                          and argument_type not in JAVA_PRIMITIVE_TYPES]
+        for method_id, parameter_types in candidates:
+            if parameter_types == argument_types:
+                return method_id
+
+        # not every argument has a known type, use the overload if only one can take the known types
+        matching_candidates = [method_id for method_id, parameter_types in candidates
+                               if self._is_subsequence(argument_types, parameter_types)]
+        if len(matching_candidates) == 1:
+            return matching_candidates[0]
+        return candidates[0][0]
+
+    def method_id_of_class(self, class_identifier: str, index: int):
+        """
+        :param class_identifier: identifier of a class
+        :param index: position of the method in the method list of the class (as written by the parser)
+        :return: Id of the method or None if the class has no such method
+        """
+        method_ids = self.class_method_ids.get(class_identifier, [])
+        return method_ids[index] if index < len(method_ids) else None
+
+    @staticmethod
+    def _is_subsequence(types: list, parameter_types: list):
+        remaining_parameter_types = iter(parameter_types)
+        return all(any(argument_type == parameter_type for parameter_type in remaining_parameter_types)
+                   for argument_type in types)
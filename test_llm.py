@@ -0,0 +1,292 @@
+import configparser
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import openai
+import requests
+
+import llm
+from llm import BatchingLlm, HuggingFaceLlm, HuggingFaceLlmError, LocalServerLlm
+
+# seconds the stub server reports for loading the model on the first attempt of a "retry" prompt
+ESTIMATED_LOADING_TIME = 0.5
+
+
+class StubServer:
+    """
+    Local stand-in for an inference API. Requests are answered by the respond function of the subclass, the server
+    records how many requests are answered at the same time.
+    """
+
+    def __init__(self, response_delay: float = 0.05):
+        self.response_delay = response_delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("localhost", 0), self._handler())
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, path: str, request: dict):
+        """
+        :return: Tuple of the status code and the body of the response (json, or a list of server-sent events)
+        """
+        raise NotImplementedError
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.lock:
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                # time.sleep is replaced in the tests, the requests still have to overlap
+                threading.Event().wait(stub.response_delay)
+                with stub.lock:
+                    stub.in_flight -= 1
+
+                status, body = stub.respond(self.path, request)
+                if request.get("stream") and status == 200:
+                    content_type = "text/event-stream"
+                    data = "".join(f"data: {json.dumps(event)}\n\n" for event in body).encode("utf-8")
+                else:
+                    content_type = "application/json"
+                    data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class StubInferenceServer(StubServer):
+    """
+    Stand-in for the HuggingFace inference API. Answers every prompt with "answer to <prompt>". The first attempt of
+    a prompt starting with "retry" fails with 503 (model loading), prompts starting with "invalid" fail with 400.
+    """
+
+    def __init__(self, response_delay: float = 0.05):
+        super().__init__(response_delay)
+        self.url = f"http://localhost:{self.port}/models/stub"
+        self.attempts = {}
+
+    def respond(self, path, request):
+        prompt = request["inputs"]
+        with self.lock:
+            self.attempts[prompt] = self.attempts.get(prompt, 0) + 1
+            attempt = self.attempts[prompt]
+        if prompt.startswith("invalid"):
+            return 400, {"error": "invalid payload"}
+        if prompt.startswith("retry") and attempt == 1:
+            return 503, {"error": "model is loading", "estimated_time": ESTIMATED_LOADING_TIME}
+        return 200, [{"generated_text": "answer to " + prompt}]
+
+
+class StubCompletionServer(StubServer):
+    """
+    Stand-in for the OpenAI compatible completions endpoint of a local web server. Answers every prompt of a request
+    with "answer to <prompt>" (streamed word by word if requested), requests containing a prompt starting with
+    "invalid" fail with 400.
+    """
+
+    def __init__(self, response_delay: float = 0.05):
+        super().__init__(response_delay)
+        # prompts of every request, in the order the requests were answered
+        self.requests = []
+        # parameters of every request (without the prompts)
+        self.parameters = []
+
+    def respond(self, path, request):
+        prompts = request["prompt"] if isinstance(request["prompt"], list) else [request["prompt"]]
+        with self.lock:
+            self.requests.append(prompts)
+            self.parameters.append({name: value for name, value in request.items() if name != "prompt"})
+        if any(prompt.startswith("invalid") for prompt in prompts):
+            return 400, {"error": {"message": "invalid prompt", "type": "invalid_request_error"}}
+        if request.get("stream"):
+            return 200, [{"choices": [{"text": token, "index": 0}]} for token in ("answer ", "to ", prompts[0])]
+        return 200, {
+            "id": "cmpl-stub",
+            "object": "text_completion",
+            "created": 0,
+            "model": request["model"],
+            "choices": [{"text": "answer to " + prompt, "index": index, "logprobs": None, "finish_reason": "stop"}
+                        for index, prompt in enumerate(prompts)],
+            "usage": {"prompt_tokens": len(prompts), "completion_tokens": len(prompts),
+                      "total_tokens": 2 * len(prompts)},
+        }
+
+
+class StubConfigTestCase(unittest.TestCase):
+    """
+    Runs every test in a temporary working directory with a copy of config.ini, so the clients read the options of
+    the test (e.g. the url of the stub server).
+    """
+
+    def use_config(self, **inference_options):
+        config = configparser.ConfigParser()
+        config.read('config.ini')
+        for option, value in inference_options.items():
+            config.set('INFERENCE', option, str(value))
+
+        working_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, working_directory)
+        with open(os.path.join(working_directory, 'config.ini'), 'w') as file:
+            config.write(file)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(working_directory)
+
+    def start_stub(self, stub: StubServer):
+        stub.__enter__()
+        self.addCleanup(stub.__exit__, None, None, None)
+        return stub
+
+    def record_sleeps(self):
+        # the waits of the backoff are recorded instead of slept
+        sleep_patch = mock.patch.object(llm.time, "sleep")
+        self.addCleanup(sleep_patch.stop)
+        return sleep_patch.start()
+
+    @staticmethod
+    def query_concurrently(client, prompts):
+        with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+            return list(executor.map(client, prompts))
+
+
+class HuggingFaceLlmTest(StubConfigTestCase):
+
+    MAX_CONCURRENT_REQUESTS = 2
+
+    def setUp(self):
+        self.stub = self.start_stub(StubInferenceServer())
+        self.use_config(HUGGINGFACE_INFERENCE_URL=self.stub.url,
+                        HUGGINGFACE_MAX_CONCURRENT_REQUESTS=self.MAX_CONCURRENT_REQUESTS,
+                        HUGGINGFACE_MAX_RETRIES=2,
+                        HUGGINGFACE_BACKOFF_BASE=1)
+        self.client = HuggingFaceLlm()
+        self.sleep = self.record_sleeps()
+
+    def test_answers_are_returned_to_their_callers(self):
+        prompts = [f"prompt {i}" for i in range(4 * self.MAX_CONCURRENT_REQUESTS)]
+        answers = self.query_concurrently(self.client, prompts)
+
+        self.assertEqual(["answer to " + prompt for prompt in prompts], answers)
+        self.assertEqual({prompt: 1 for prompt in prompts}, self.stub.attempts)
+
+    def test_concurrent_requests_are_limited(self):
+        self.query_concurrently(self.client, [f"prompt {i}" for i in range(4 * self.MAX_CONCURRENT_REQUESTS)])
+
+        self.assertEqual(self.MAX_CONCURRENT_REQUESTS, self.stub.max_in_flight)
+
+    def test_retried_requests_return_their_own_answers(self):
+        prompts = [f"retry {i}" if i % 2 == 0 else f"prompt {i}" for i in range(4 * self.MAX_CONCURRENT_REQUESTS)]
+        answers = self.query_concurrently(self.client, prompts)
+
+        self.assertEqual(["answer to " + prompt for prompt in prompts], answers)
+        for prompt in prompts:
+            self.assertEqual(2 if prompt.startswith("retry") else 1, self.stub.attempts[prompt])
+        self.assertEqual(len(prompts) // 2, self.client.metrics.summary()["retries"])
+
+    def test_backoff_waits_for_the_model_with_jitter(self):
+        self.assertEqual("answer to retry", self.client("retry"))
+
+        # first retry: a random backoff of up to backoff_base seconds, but at least the estimated loading time
+        wait_time = self.sleep.call_args.args[0]
+        self.assertGreaterEqual(wait_time, ESTIMATED_LOADING_TIME)
+        self.assertLessEqual(wait_time, max(ESTIMATED_LOADING_TIME, self.client.backoff_base))
+
+    def test_failed_requests_are_not_retried(self):
+        with self.assertRaises(HuggingFaceLlmError):
+            self.client("invalid prompt")
+        self.assertEqual(1, self.stub.attempts["invalid prompt"])
+        self.sleep.assert_not_called()
+
+
+class LocalServerLlmTest(StubConfigTestCase):
+
+    def local_server_llm(self, stub: StubCompletionServer, **inference_options):
+        self.use_config(LOCAL_WEB_SERVER_PORT=stub.port, **inference_options)
+        return LocalServerLlm()
+
+    def test_streamed_requests_are_sent_without_best_of(self):
+        stub = self.start_stub(StubCompletionServer())
+        client = self.local_server_llm(stub)
+
+        self.assertEqual("answer to prompt", client.generate_until("prompt", lambda text: False))
+        self.assertNotIn("best_of", stub.parameters[0])
+        self.assertEqual({name: value for name, value in stub.parameters[0].items() if name != "stream"},
+                         client.completion_parameters(stream=True))
+        self.assertNotIn("best_of", client.cache_parameters(stream=True))
+        self.assertEqual(3, client.cache_parameters()["best_of"])
+
+    def test_streamed_requests_time_out(self):
+        stub = self.start_stub(StubCompletionServer(response_delay=1))
+        client = self.local_server_llm(stub, LOCAL_WEB_SERVER_READ_TIMEOUT=0.1)
+
+        with self.assertRaises(requests.exceptions.Timeout):
+            client.generate_until("prompt", lambda text: False)
+
+
+class BatchingLlmTest(StubConfigTestCase):
+
+    MAX_BATCH_SIZE = 3
+
+    def setUp(self):
+        self.stub = self.start_stub(StubCompletionServer())
+
+    def batching_llm(self, batch_requests: bool):
+        self.use_config(LOCAL_WEB_SERVER_PORT=self.stub.port,
+                        LOCAL_WEB_SERVER_MAX_BATCH_SIZE=self.MAX_BATCH_SIZE,
+                        LOCAL_WEB_SERVER_BATCH_REQUESTS=batch_requests,
+                        LOCAL_WEB_SERVER_BATCH_WINDOW=0.2)
+        return BatchingLlm(LocalServerLlm())
+
+    def test_concurrent_requests_return_answers_to_their_callers(self):
+        prompts = [f"prompt {i}" for i in range(3 * self.MAX_BATCH_SIZE)]
+        answers = self.query_concurrently(self.batching_llm(batch_requests=False), prompts)
+
+        self.assertEqual(["answer to " + prompt for prompt in prompts], answers)
+        # one prompt per request, at most MAX_BATCH_SIZE requests at the same time
+        self.assertEqual(sorted([prompt] for prompt in prompts), sorted(self.stub.requests))
+        self.assertEqual(self.MAX_BATCH_SIZE, self.stub.max_in_flight)
+
+    def test_batched_requests_return_answers_to_their_callers(self):
+        prompts = [f"prompt {i}" for i in range(3 * self.MAX_BATCH_SIZE)]
+        answers = self.query_concurrently(self.batching_llm(batch_requests=True), prompts)
+
+        self.assertEqual(["answer to " + prompt for prompt in prompts], answers)
+        self.assertEqual(sorted(prompts), sorted(prompt for request in self.stub.requests for prompt in request))
+        self.assertTrue(all(len(request) <= self.MAX_BATCH_SIZE for request in self.stub.requests))
+        self.assertLess(len(self.stub.requests), len(prompts))
+
+    def test_failed_batches_raise_in_their_callers(self):
+        batching_llm = self.batching_llm(batch_requests=True)
+        with self.assertRaises(openai.BadRequestError):
+            batching_llm("invalid prompt")
+        self.assertEqual("answer to prompt", batching_llm("prompt"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+from multiprocessing.connection import Listener, Client
+from threading import Thread, Lock
+from typing import List
+import configparser
+import hashlib
+import os
+
+from llama_cpp import Llama
+import tiktoken
+
+TOKENIZER_SERVER_AUTHKEY = b"thesis-llm-test-generation-tokenizer"
+
+# tokenizers already loaded in this process, keyed by the configured model (or tokenizer server)
+_loaded_tokenizers = {}
+
+
+class LlamaTokenizer:
+    """
+    Tokenizer backed by the vocabulary of a local model (run through llama-cpp-python).
+    Only the vocabulary is loaded, the model weights are never read into memory.
+    """
+
+    def __init__(self, model_path: str, n_ctx: int):
+        """
+        :param model_path: path to a model which can be utilized by llama-cpp-python (usually a .gguf file)
+        :param n_ctx: context size of the model
+        """
+        # the file name alone is ambiguous (e.g. the same name in different directories or quantizations), the
+        # resolved path, size and modification time identify the model whose token counts are cached
+        model_path = os.path.realpath(model_path)
+        model_stat = os.stat(model_path)
+        self.tokenizer_id = "llama:{}:{}:{}".format(model_path, model_stat.st_size, model_stat.st_mtime_ns)
+        self.llm = Llama(model_path, n_ctx=n_ctx, vocab_only=True, verbose=False)
+
+    def count_tokens(self, texts: List[str]):
+        """
+        Counts the tokens of each text.
+        :param texts: list of texts to tokenize
+        :return: List of token counts following the order of the texts
+        """
+        return [len(self.llm.tokenize(bytes(text, "utf-8"))) for text in texts]
+
+
+class TiktokenTokenizer:
+    """
+    Tokenizer using tiktoken with the cl100k_base encoding.
+    Using this tokenizer can be useful when running the application with OpenAI models, as they use
+    the same encoding.
+    """
+
+    def __init__(self):
+        self.tokenizer_id = "tiktoken:cl100k_base"
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(self, texts: List[str]):
+        """
+        Counts the tokens of each text.
+        :param texts: list of texts to tokenize
+        :return: List of token counts following the order of the texts
+        """
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts, disallowed_special=())]
+
+
+class RemoteTokenizer:
+    """
+    Client for a tokenizer server running on the same host (see serve_tokenizer).
+    Allows several processes to share one loaded vocabulary.
+    """
+
+    def __init__(self, port: int):
+        """
+        :param port: port of the tokenizer server on localhost
+        """
+        self.connection = Client(("localhost", port), authkey=TOKENIZER_SERVER_AUTHKEY)
+        self.connection.send(("tokenizer_id", None))
+        self.tokenizer_id = self.connection.recv()
+
+    def count_tokens(self, texts: List[str]):
+        """
+        Counts the tokens of each text on the tokenizer server.
+        :param texts: list of texts to tokenize
+        :return: List of token counts following the order of the texts
+        """
+        self.connection.send(("count_tokens", texts))
+        return self.connection.recv()
+
+
+def hash_text(text: str):
+    """
+    Hashes a text to look up its token count in the token count cache of the database.
+    :param text: the text to hash
+    :return: Hex digest of the SHA-256 hash of the text
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_tokenizer(config: configparser.ConfigParser):
+    """
+    Loads the tokenizer configured in the [MODEL] section of the config in this process.
+    :param config: parsed config.ini
+    :return: LlamaTokenizer if USE_MODEL is set, TiktokenTokenizer otherwise
+    """
+    if config.getboolean('MODEL', 'USE_MODEL'):
+        return LlamaTokenizer(config.get('MODEL', 'MODEL_PATH'), config.getint('MODEL', 'MODEL_MAX_INPUT_TOKENS'))
+    return TiktokenTokenizer()
+
+
+def get_tokenizer(config: configparser.ConfigParser):
+    """
+    Returns the tokenizer for the given config. The tokenizer is only loaded once per process.
+    If TOKENIZER_SERVER_PORT is set, a client for the shared tokenizer server is returned instead.
+    :param config: parsed config.ini
+    :return: Tokenizer exposing tokenizer_id and count_tokens(texts)
+    """
+    server_port = config.get('MODEL', 'TOKENIZER_SERVER_PORT', fallback="")
+    if server_port:
+        # connections can not be shared with forked worker processes, so every process opens its own
+        key = f"server:{server_port}:{os.getpid()}"
+        if key not in _loaded_tokenizers:
+            _loaded_tokenizers[key] = RemoteTokenizer(int(server_port))
+        return _loaded_tokenizers[key]
+
+    if config.getboolean('MODEL', 'USE_MODEL'):
+        key = "llama:" + config.get('MODEL', 'MODEL_PATH')
+    else:
+        key = "tiktoken"
+    if key not in _loaded_tokenizers:
+        _loaded_tokenizers[key] = load_tokenizer(config)
+    return _loaded_tokenizers[key]
+
+
+def serve_tokenizer(config: configparser.ConfigParser, port: int):
+    """
+    Loads the configured tokenizer once and answers token count requests of other processes on localhost.
+    :param config: parsed config.ini
+    :param port: port to listen on
+    """
+    tokenizer = load_tokenizer(config)
+    tokenizer_lock = Lock()
+
+    with Listener(("localhost", port), authkey=TOKENIZER_SERVER_AUTHKEY) as listener:
+        print(f"Tokenizer server ({tokenizer.tokenizer_id}) listening on port {port}")
+        while True:
+            connection = listener.accept()
+            # every client gets its own thread, so long-lived clients do not block each other
+            Thread(target=_handle_tokenizer_client, args=(connection, tokenizer, tokenizer_lock), daemon=True).start()
+
+
+def _handle_tokenizer_client(connection, tokenizer, tokenizer_lock):
+    with connection:
+        while True:
+            try:
+                command, payload = connection.recv()
+            except EOFError:
+                return
+            if command == "tokenizer_id":
+                connection.send(tokenizer.tokenizer_id)
+            elif command == "count_tokens":
+                with tokenizer_lock:
+                    token_counts = tokenizer.count_tokens(payload)
+                connection.send(token_counts)
+
+
+if __name__ == "__main__":
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    serve_tokenizer(config, config.getint('MODEL', 'TOKENIZER_SERVER_PORT'))
@@ -14,6 +14,25 @@ def extract_source_code(markdown_string):
     return source_code_sections
 
 
+# class declaration at the start of a line, optionally preceded by annotations and modifiers
+CLASS_DECLARATION_PATTERN = re.compile(r'^[ \t]*(?:@\w+(?:\([^)\n]*\))?\s+)*'
+                                       r'(?:(?:public|protected|private|abstract|final|static|strictfp)\s+)*'
+                                       r'class\s+\w+', re.MULTILINE)
+
+
+def contains_complete_class(markdown_string):
+    # if a code block (see extract_source_code) with a class declaration and balanced braces is closed, used to stop
+    # streamed answers
+    for source_code in extract_source_code(markdown_string):
+        declaration = CLASS_DECLARATION_PATTERN.search(source_code)
+        if declaration is None:
+            continue
+        class_code = source_code[declaration.start():]
+        if class_code.count("{") > 0 and class_code.count("{") == class_code.count("}"):
+            return True
+    return False
+
+
 @contextmanager
 def mute_output():
     # Save the original sys.stdout